@@ -3,18 +3,596 @@
 # Wisdom Layer Production Framework
 # BaseAgent class for all LLM-powered cognitive agents
 
-import openai
-import os
 import json
-from typing import Any, Dict
+import time
+from concurrent.futures import CancelledError
+from concurrent.futures import TimeoutError as FuturesTimeout
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.deadline import Deadline, DeadlineExceeded, remaining_timeout
+from utils.hedging import HedgeRace, get_hedger
+from utils.llm_cache import cache_key, get_cache
+from utils.llm_client import get_client, request_timeout
+from utils.llm_providers import LLMProvider, get_provider
+from utils.llm_scheduler import PRIORITY_INTERACTIVE, estimate_request_tokens, get_scheduler
+from utils.model_router import get_router
+from utils.model_filter import model_fingerprint
+from utils.semantic_cache import context_key, get_semantic_cache
+from utils.single_flight import get_single_flight
+from utils.prompt_encoding import cached_prefix, default_encoding, encode_model, record_savings
+from utils.telemetry import get_telemetry
+from utils.structured_output import (
+    batch_schema, check_reply, coerce, repair_messages, response_format_for, result_schema, validate
+)
+from utils.tokens import estimate_message_tokens, estimate_tokens
+
+
+def _open_stream(stream: Iterator[str]) -> Iterator[str]:
+    # Pull the first chunk eagerly so connection and rate-limit errors raise inside the scheduler's retry loop
+    first = next(stream, None)
+    return stream if first is None else _resume(first, stream)
+
+
+def _resume(first: str, stream: Iterator[str]) -> Iterator[str]:
+    # A generator rather than itertools.chain, so close() reaches the provider's stream
+    yield first
+    yield from stream
+
+
+def _close_stream(stream: Iterator[str]):
+    # A losing hedged stream is closed instead of being read to the end
+    close = getattr(stream, "close", None)
+    if close is not None:
+        close()
+
 
 class AgentBase:
-    def __init__(self, role: str, system_context: str = "IT Organization"):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    # Serve repeated identical prompts from the local completion cache
+    use_cache = True
+    # List fields of the agent's JSON answer; subclasses override
+    RESULT_LISTS = []
+    # Prompt encoding of the system model: "json", "compact", or None for WISDOM_PROMPT_ENCODING
+    encoding = None
+    # JSON schema of the answer; None derives it from RESULT_LISTS plus "llm_reasoning"
+    OUTPUT_SCHEMA = None
+    # Questions answered per completion by smart_prompt_batch
+    BATCH_SIZE = 5
+    # Scheduler lane; background work (cache warm-up) sets PRIORITY_BACKGROUND on its instances
+    priority = PRIORITY_INTERACTIVE
+
+    def __init__(self, role: str, system_context: str = "IT Organization", provider: Optional[LLMProvider] = None):
         self.role = role
         self.system_context = system_context
+        self._provider = provider
+        self.last_encoding_report = None
+        # Validated JSON text of the most recent structured answer, and whether it met the schema as sent
+        self.last_reply = None
+        self.last_reply_valid = None
+        # Routing decision behind the most recent request (None when the router is off or a model was given)
+        self.last_route = None
+        # Where the most recent smart answer came from: {"source": "llm"} or a semantic-cache reuse
+        self.last_call_info = None
+
+    @property
+    def provider(self) -> LLMProvider:
+        # Explicit provider if one was given, else the process-wide default (WISDOM_LLM_PROVIDER)
+        return self._provider or get_provider()
+
+    @property
+    def client(self):
+        # Shared, connection-pooled OpenAI client; never build one per call
+        return get_client()
+
+    def _encode_model(self, system_model: Dict[str, Any], encoding: Optional[str] = None,
+                      baseline: Optional[str] = None) -> str:
+        # Serialize the model for a prompt and account the tokens saved versus indented JSON
+        encoding = encoding or self.encoding or default_encoding()
+        text = encode_model(system_model, encoding)
+        if encoding == "json":
+            baseline = text
+        elif baseline is None:
+            baseline = json.dumps(system_model, indent=2)
+        json_tokens, sent_tokens = estimate_tokens(baseline), estimate_tokens(text)
+        if sent_tokens > json_tokens:
+            # Tiny inputs don't amortize the compact preamble; send them as they were
+            text, sent_tokens = baseline, json_tokens
+        record_savings(self.role, json_tokens, sent_tokens)
+        self.last_encoding_report = {
+            "encoding": encoding,
+            "json_tokens": json_tokens,
+            "sent_tokens": sent_tokens,
+            "saved_tokens": json_tokens - sent_tokens,
+        }
+        return text
+
+    def _static_prefix(self, key_parts, encoding: Optional[str], render) -> str:
+        """
+        Return the block that opens every prompt of this agent for the given model.
+
+        It holds the instructions, serialized model and meta-context, and is byte-identical
+        across questions, so providers can cache the prompt prefix. It is rendered once per
+        (agent, encoding, model version); later questions reuse the cached text.
+        """
+        encoding = encoding or self.encoding or default_encoding()
+        key = (self.role, encoding) + tuple(model_fingerprint(part) for part in key_parts)
+
+        def build():
+            self.last_encoding_report = None
+            block = render(encoding)
+            return block, self.last_encoding_report
+
+        (block, report), rendered = cached_prefix(key, build)
+        if report and not rendered:
+            record_savings(self.role, report["json_tokens"], report["sent_tokens"])
+        self.last_encoding_report = report
+        return block
+
+    def _route(self, question: str, messages: List[Dict[str, str]], default: str,
+               complexity: Optional[str] = None, model: Optional[str] = None) -> str:
+        # The caller's model if given, else the router's pick, else the agent's historical model (routing off)
+        router = get_router()
+        if model or router is None:
+            self.last_route = None
+            return model or default
+        self.last_route = router.route(question, estimate_message_tokens(messages), complexity, agent=self.role)
+        return self.last_route.model
+
+    def _record_upstream(self, model: str, started: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+                         ok: bool = True, race: Optional[HedgeRace] = None):
+        # Upstream latency (excluding queue wait), usage and failures go to telemetry and the router's statistics;
+        # a hedged copy that lost the race only counts once in telemetry, as a hedge
+        latency = time.perf_counter() - started
+        if race is not None and not race.finish(ok):
+            get_telemetry().record_call(self.role, model, latency, prompt_tokens, completion_tokens, ok, hedge_lost=True)
+            return
+        router = get_router()
+        if router is not None:
+            router.record(model, latency, ok)
+        get_telemetry().record_call(self.role, model, latency, prompt_tokens, completion_tokens, ok)
+        hedger = get_hedger()
+        if ok and hedger is not None:
+            hedger.observe(model, latency)
+
+    def _timed(self, model: str, call, race: Optional[HedgeRace] = None):
+        started = time.perf_counter()
+        try:
+            completion = call()
+        except Exception:
+            self._record_upstream(model, started, ok=False, race=race)
+            raise
+        self._record_upstream(model, started, completion.prompt_tokens, completion.completion_tokens, race=race)
+        return completion
+
+    async def _atimed(self, model: str, call, race: Optional[HedgeRace] = None):
+        started = time.perf_counter()
+        try:
+            completion = await call()
+        except Exception:
+            self._record_upstream(model, started, ok=False, race=race)
+            raise
+        self._record_upstream(model, started, completion.prompt_tokens, completion.completion_tokens, race=race)
+        return completion
+
+    @staticmethod
+    def _provider_params(model: str, params: Dict[str, Any], deadline: Optional[Deadline]) -> Dict[str, Any]:
+        # The HTTP timeout never outlives the caller's deadline
+        if deadline is None:
+            return params
+        return dict(params, timeout=deadline.timeout(request_timeout(model)))
+
+    def _admit_hedge(self, model: str, messages: List[Dict[str, str]], max_tokens: Optional[int]):
+        # The backup copy takes its own rate-limit budget, but only if it can go right away
+        tokens = estimate_request_tokens(messages, max_tokens)
+        return lambda: get_scheduler().try_acquire(self.role, model, tokens, self.priority)
+
+    def _hedged(self, model: str, messages: List[Dict[str, str]], max_tokens: Optional[int], send,
+                first_token: bool = False, discard=None):
+        # Interactive calls send a backup request if this one runs into the model's latency tail.
+        # Called inside the scheduler's admitted section, so the hedge delay excludes queue wait.
+        # `send(race)` makes one attempt; the copies of a request share the race
+        hedger = get_hedger() if self.priority == PRIORITY_INTERACTIVE else None
+        if hedger is None:
+            return send(None)
+        race = HedgeRace()
+        return hedger.run(self.role, model, lambda: send(race), first_token, discard,
+                          self._admit_hedge(model, messages, max_tokens))
+
+    async def _ahedged(self, model: str, messages: List[Dict[str, str]], max_tokens: Optional[int], send):
+        hedger = get_hedger() if self.priority == PRIORITY_INTERACTIVE else None
+        if hedger is None:
+            return await send(None)
+        race = HedgeRace()
+        return await hedger.arun(self.role, model, lambda: send(race), self._admit_hedge(model, messages, max_tokens))
+
+    def _cached(self, cache, key: str, model: str) -> Optional[str]:
+        if cache is None:
+            return None
+        cached = cache.get(key)
+        get_telemetry().record_cache(self.role, model, hit=cached is not None)
+        return cached
+
+    def _chat(self, model: str, messages: List[Dict[str, str]], deadline: Optional[Deadline] = None, **params) -> str:
+        cache = get_cache() if self.use_cache else None
+        key = cache_key(model, messages, params.get("temperature"))
+        cached = self._cached(cache, key, model)
+        if cached is not None:
+            return cached
+        if deadline is not None:
+            deadline.check(f"{self.role} call to {model}")
+
+        def send(race):
+            return self._timed(model, lambda: self.provider.complete(
+                model, messages, **self._provider_params(model, params, deadline)), race)
+
+        def call():
+            completion = get_scheduler().run(
+                self.role, model, messages,
+                lambda: self._hedged(model, messages, params.get("max_tokens"), send),
+                max_tokens=params.get("max_tokens"),
+                priority=self.priority,
+                deadline=deadline
+            )
+            if cache is not None:
+                cache.put(key, model, completion.text)
+            return completion.text
+
+        # Identical requests already in flight (other sessions, other agents' instances) share one completion
+        return get_single_flight().do(key, call, deadline, self.priority)
+
+    async def _achat(self, model: str, messages: List[Dict[str, str]], deadline: Optional[Deadline] = None,
+                     **params) -> str:
+        cache = get_cache() if self.use_cache else None
+        key = cache_key(model, messages, params.get("temperature"))
+        cached = self._cached(cache, key, model)
+        if cached is not None:
+            return cached
+        if deadline is not None:
+            deadline.check(f"{self.role} call to {model}")
+
+        def send(race):
+            return self._atimed(model, lambda: self.provider.acomplete(
+                model, messages, **self._provider_params(model, params, deadline)), race)
+
+        async def call():
+            completion = await get_scheduler().arun(
+                self.role, model, messages,
+                lambda: self._ahedged(model, messages, params.get("max_tokens"), send),
+                max_tokens=params.get("max_tokens"),
+                priority=self.priority,
+                deadline=deadline
+            )
+            if cache is not None:
+                cache.put(key, model, completion.text)
+            return completion.text
+
+        return await get_single_flight().ado(key, call, deadline, self.priority)
+
+    def _chat_stream(self, model: str, messages: List[Dict[str, str]], deadline: Optional[Deadline] = None,
+                     **params) -> Iterator[str]:
+        # Yields completion text as it arrives; a cache hit is yielded in one piece
+        cache = get_cache() if self.use_cache else None
+        key = cache_key(model, messages, params.get("temperature"))
+        cached = self._cached(cache, key, model)
+        if cached is not None:
+            yield cached
+            return
+        if deadline is not None:
+            deadline.check(f"{self.role} call to {model}")
+
+        # A follower of an identical in-flight request (at its priority or above) gets the finished text in one piece
+        flight = get_single_flight()
+        future, leader = flight.claim(key, self.priority)
+        while not leader:
+            try:
+                yield future.result(timeout=remaining_timeout(deadline))
+                return
+            except CancelledError:
+                future, leader = flight.claim(key, self.priority)  # the leader was abandoned; take over
+            except FuturesTimeout:
+                if future.done():
+                    raise
+                raise DeadlineExceeded(f"{self.role} waiting for an identical in-flight call") from None
+
+        started = None
 
-    def prompt(self, system_model: Dict[str, Any], custom_instructions: str = "") -> str:
+        def open_stream(race):
+            # Upstream latency runs from the first attempt to open the stream, after rate-limit admission.
+            # Only the copy that opens first feeds the first-token latencies
+            nonlocal started
+            started = started or time.perf_counter()
+            opened = time.perf_counter()
+            stream = _open_stream(self.provider.stream(model, messages, **self._provider_params(model, params, deadline)))
+            hedger = get_hedger()
+            if hedger is not None and (race is None or race.finish(True)):
+                hedger.observe(model, time.perf_counter() - opened, first_token=True)
+            return stream
+
+        try:
+            # Only opening the stream is retried, and hedged on its first-token wait; a stream that
+            # breaks midway surfaces to the caller
+            stream = get_scheduler().run(
+                self.role, model, messages,
+                lambda: self._hedged(model, messages, params.get("max_tokens"), open_stream, first_token=True,
+                                     discard=_close_stream),
+                max_tokens=params.get("max_tokens"),
+                priority=self.priority,
+                deadline=deadline
+            )
+            parts = []
+            for delta in stream:
+                parts.append(delta)
+                yield delta
+                if deadline is not None and deadline.expired:
+                    raise DeadlineExceeded(f"{self.role} stream from {model} cut off at the deadline")
+        except (GeneratorExit, DeadlineExceeded):
+            # Abandoned, not failed: a waiting follower takes over instead of inheriting this caller's budget
+            flight.settle(key, future, error=CancelledError())
+            raise
+        except BaseException as e:
+            if started is not None:
+                self._record_upstream(model, started, ok=False)
+            flight.settle(key, future, error=e)
+            raise
+
+        text = "".join(parts).strip()
+        self._record_upstream(model, started, estimate_message_tokens(messages), estimate_tokens(text))
+        if cache is not None:
+            cache.put(key, model, text)
+        flight.settle(key, future, text)
+
+    @classmethod
+    def output_schema(cls) -> Dict[str, Any]:
+        return cls.OUTPUT_SCHEMA or result_schema(cls.RESULT_LISTS)
+
+    def _structured(self, request: Dict[str, Any], schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Ask for JSON mode / the schema itself where the model supports it; others rely on the prompt
+        response_format = response_format_for(request["model"], schema or self.output_schema(), self.role.replace(" ", "_"))
+        return dict(request, response_format=response_format) if response_format else request
+
+    def _repair_request(self, request: Dict[str, Any], raw: str, errors: List[str],
+                        schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return dict(request, messages=repair_messages(request["messages"], raw, errors, schema or self.output_schema()))
+
+    def _semantic_key(self, context_parts, request: Dict[str, Any]) -> str:
+        # Answers from one chat model are not offered for a request routed (or pinned) to another
+        return context_key(self.role, tuple(context_parts) + (request["model"],))
+
+    def _exact_cached(self, request: Dict[str, Any]) -> bool:
+        cache = get_cache() if self.use_cache else None
+        if cache is None:
+            return False
+        request = self._structured(request)
+        return cache.contains(cache_key(request["model"], request["messages"], request.get("temperature")))
+
+    def _reuse(self, context_parts, question: str, request: Dict[str, Any]) -> Optional[str]:
+        """
+        Stored answer to a near-identical question about the same model inputs, from the
+        same chat model, or None. An exact completion-cache hit for `request` takes precedence.
+        """
+        self.last_call_info = {"source": "llm"}
+        cache = get_semantic_cache() if self.use_cache else None
+        if cache is None or not question or self._exact_cached(request):
+            return None
+        match = cache.lookup(self._semantic_key(context_parts, request), question)
+        get_telemetry().record_semantic(self.role, hit=match is not None)
+        if match is None:
+            return None
+        answer, matched_question, similarity = match
+        self.last_call_info = {"source": "semantic_cache", "matched_question": matched_question, "similarity": similarity}
+        self.last_reply, self.last_reply_valid = answer, True
+        return answer
+
+    def _remember(self, context_parts, question: str, request: Dict[str, Any], reply: str) -> str:
+        # Only schema-valid answers are offered for reuse
+        cache = get_semantic_cache() if self.use_cache else None
+        if cache is not None and question and self.last_reply_valid:
+            cache.put(self._semantic_key(context_parts, request), question, reply)
+        return reply
+
+    def _settle_reply(self, raw: str, obj: Any, errors: List[str], repaired: bool = False) -> str:
+        # Conforming JSON text for callers; unparseable output is kept as reasoning in an empty result
+        self.last_reply_valid = not errors
+        get_telemetry().record_parse(self.role, "failed" if errors else "repaired" if repaired else "ok")
+        if obj is None:
+            reply = self._failure_reply(f"Failed to parse JSON from LLM output ({'; '.join(errors)}). Raw text:\n{raw}")
+        else:
+            reply = json.dumps(coerce(obj, self.output_schema()), indent=2)
+        self.last_reply = reply
+        return reply
+
+    def _parse_smart_reply(self, raw: str) -> str:
+        # Validation only, without the repair turn
+        return self._settle_reply(raw, *check_reply(raw, self.output_schema()))
+
+    def _ask(self, request: Dict[str, Any]) -> str:
+        """Structured call: validate the reply against the schema and, if it fails, ask once for a fix."""
+        request = self._structured(request)
+        raw = self._chat(**request)
+        obj, errors = check_reply(raw, self.output_schema())
+        repaired = bool(errors)
+        if repaired:
+            raw = self._chat(**self._repair_request(request, raw, errors))
+            obj, errors = check_reply(raw, self.output_schema())
+        return self._settle_reply(raw, obj, errors, repaired)
+
+    async def _aask(self, request: Dict[str, Any]) -> str:
+        request = self._structured(request)
+        raw = await self._achat(**request)
+        obj, errors = check_reply(raw, self.output_schema())
+        repaired = bool(errors)
+        if repaired:
+            raw = await self._achat(**self._repair_request(request, raw, errors))
+            obj, errors = check_reply(raw, self.output_schema())
+        return self._settle_reply(raw, obj, errors, repaired)
+
+    def _ask_stream(self, request: Dict[str, Any]) -> Iterator[str]:
+        """Stream the raw reply, then validate it (repairing once if needed) into self.last_reply."""
+        request = self._structured(request)
+        parts = []
+        for chunk in self._chat_stream(**request):
+            parts.append(chunk)
+            yield chunk
+        raw = "".join(parts).strip()
+        obj, errors = check_reply(raw, self.output_schema())
+        repaired = bool(errors)
+        if repaired:
+            raw = self._chat(**self._repair_request(request, raw, errors))
+            obj, errors = check_reply(raw, self.output_schema())
+        self._settle_reply(raw, obj, errors, repaired)
+
+    def _batch_question(self, questions: List[str]) -> str:
+        numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+        keys = ", ".join(f'"{key}"' for key in self.output_schema()["properties"])
+        return f"""Answer each of these questions separately:
+{numbered}
+
+Respond with one JSON object of this form, with one entry per question in the same order:
+{{"answers": [{{"index": 1, "question": "...", "result": {{...}}}}, ...]}}
+where every "result" is a complete answer in the JSON format above ({keys})."""
+
+    def _batch_answers(self, request: Dict[str, Any], questions: List[str]) -> Dict[str, str]:
+        # One completion for the whole chunk; answers are matched back by their 1-based index
+        schema = batch_schema(self.output_schema())
+        request = self._structured(request, schema)
+        raw = self._chat(**request)
+        obj, errors = check_reply(raw, schema)
+        repaired = bool(errors)
+        if repaired:
+            raw = self._chat(**self._repair_request(request, raw, errors, schema))
+            obj, errors = check_reply(raw, schema)
+        get_telemetry().record_parse(self.role, "failed" if errors else "repaired" if repaired else "ok")
+        if errors:
+            return {}
+
+        answers = {}
+        for item in obj["answers"]:
+            if not isinstance(item, dict) or not isinstance(item.get("result"), dict):
+                continue
+            index = item.get("index")
+            if isinstance(index, int) and 1 <= index <= len(questions):
+                question = questions[index - 1]
+            elif item.get("question") in questions:
+                question = item["question"]
+            else:
+                continue
+            if not validate(item["result"], self.output_schema()):
+                answers[question] = json.dumps(item["result"], indent=2)
+        return answers
+
+    def _ask_batch(self, questions: List[str], build_request, ask_one) -> Dict[str, str]:
+        """
+        Answer `questions` in chunks of BATCH_SIZE per completion, so the static prompt
+        prefix (instructions, model, meta-context) is sent once per chunk instead of once
+        per question. Questions the batched reply left out or answered off-schema, and
+        whole chunks whose batched call failed or could not be parsed, are retried
+        individually with `ask_one`.
+        """
+        unique = list(dict.fromkeys(questions))
+        results = {}
+        for start in range(0, len(unique), max(1, self.BATCH_SIZE)):
+            chunk = unique[start:start + self.BATCH_SIZE]
+            if len(chunk) == 1:
+                results[chunk[0]] = ask_one(chunk[0])
+                continue
+            try:
+                answers = self._batch_answers(build_request(self._batch_question(chunk)), chunk)
+            except DeadlineExceeded as e:
+                # Out of time: individual retries would only fail the same way
+                answers = {question: self._error_reply(e) for question in chunk}
+            except Exception as e:
+                print(f"[BATCH ERROR] {e}")
+                answers = {}
+            for question in chunk:
+                results[question] = answers.get(question) or ask_one(question)
+        return results
+
+    def _smart_answer(self, context_parts, question: str, build_request) -> str:
+        # Exact cache, then semantic-cache reuse, else one structured call; failures come back as an empty,
+        # well-formed answer
+        request = build_request(question)
+        reused = self._reuse(context_parts, question, request)
+        if reused is not None:
+            return reused
+        try:
+            return self._remember(context_parts, question, request, self._ask(request))
+        except Exception as e:
+            return self._error_reply(e)
+
+    async def _asmart_answer(self, context_parts, question: str, build_request) -> str:
+        request = build_request(question)
+        reused = self._reuse(context_parts, question, request)
+        if reused is not None:
+            return reused
+        try:
+            return self._remember(context_parts, question, request, await self._aask(request))
+        except Exception as e:
+            return self._error_reply(e)
+
+    def _smart_answer_stream(self, context_parts, question: str, build_request) -> Iterator[str]:
+        request = build_request(question)
+        reused = self._reuse(context_parts, question, request)
+        if reused is not None:
+            yield reused
+            return
+        try:
+            yield from self._ask_stream(request)
+            self._remember(context_parts, question, request, self.last_reply)
+        except Exception as e:
+            self.last_reply = self._error_reply(e)
+            yield self.last_reply
+
+    def _smart_request(self, system_model, meta_context, user_query, diff_summary=None, encoding=None, model=None,
+                       deadline=None) -> Dict[str, Any]:
+        """Request kwargs for _chat: the agent's static block first, the question last. Subclasses implement it."""
+        raise NotImplementedError
+
+    def smart_prompt(self, system_model, meta_context, user_query, diff_summary=None, encoding=None, model=None,
+                     deadline=None) -> str:
+        return self._smart_answer(
+            (system_model, meta_context, diff_summary), user_query,
+            lambda question: self._smart_request(system_model, meta_context, question, diff_summary, encoding, model, deadline)
+        )
+
+    async def smart_prompt_async(self, system_model, meta_context, user_query, diff_summary=None, encoding=None,
+                                 model=None, deadline=None) -> str:
+        return await self._asmart_answer(
+            (system_model, meta_context, diff_summary), user_query,
+            lambda question: self._smart_request(system_model, meta_context, question, diff_summary, encoding, model, deadline)
+        )
+
+    def smart_prompt_stream(self, system_model, meta_context, user_query, diff_summary=None, encoding=None,
+                            model=None, deadline=None) -> Iterator[str]:
+        """Yield the raw reply text chunk by chunk; the validated answer is left in self.last_reply."""
+        return self._smart_answer_stream(
+            (system_model, meta_context, diff_summary), user_query,
+            lambda question: self._smart_request(system_model, meta_context, question, diff_summary, encoding, model, deadline)
+        )
+
+    def smart_prompt_batch(self, system_model, meta_context, questions, diff_summary=None, encoding=None,
+                           model=None, deadline=None) -> Dict[str, str]:
+        """Answer several questions about one model in as few completions as possible; returns {question: answer}."""
+        return self._ask_batch(
+            questions,
+            lambda block: self._smart_request(system_model, meta_context, block, diff_summary, encoding, model, deadline),
+            lambda question: self.smart_prompt(system_model, meta_context, question, diff_summary, encoding, model, deadline)
+        )
+
+    def _failure_reply(self, reason: str, partial: bool = False) -> str:
+        # Empty but well-formed answer so callers can still json.loads() it
+        reply = {key: [] for key in self.RESULT_LISTS}
+        reply["llm_reasoning"] = reason
+        if partial:
+            reply["partial"] = True
+        return json.dumps(reply, indent=2)
+
+    def _error_reply(self, error: Exception) -> str:
+        # A caller's expired deadline or cancellation is flagged as partial rather than reported as an LLM failure
+        if isinstance(error, DeadlineExceeded):
+            return self._failure_reply(f"Stopped before an answer was ready: {error}", partial=True)
+        return self._failure_reply(f"LLM failure: {error}")
+
+    def prompt(self, system_model: Dict[str, Any], custom_instructions: str = "", encoding: Optional[str] = None,
+               model: Optional[str] = None) -> str:
         base_prompt = f"""You are a Wisdom Layer Agent assigned the role: {self.role}.
 
 The system being modeled is: {self.system_context}
@@ -29,17 +607,16 @@ Instructions:
 {custom_instructions}
 
 Here is the current mental model:
-{json.dumps(system_model, indent=2)}
+{self._encode_model(system_model, encoding)}
 
 Respond below with your full analysis.
 """
 
-        response = self.client.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=[
-                {"role": "system", "content": f"You are the {self.role} of an agentic AI system."},
-                {"role": "user", "content": base_prompt}
-            ]
+        messages = [
+            {"role": "system", "content": f"You are the {self.role} of an agentic AI system."},
+            {"role": "user", "content": base_prompt}
+        ]
+        return self._chat(
+            model=self._route(custom_instructions, messages, default="gpt-4-turbo", complexity="analysis", model=model),
+            messages=messages
         )
-
-        return response.choices[0].message.content.strip()
@@ -2,25 +2,54 @@
 # Wisdom Layer Production Framework – Chaos Theory Agent with Ripple Playback
 
 from agents.agent_base import AgentBase
+from utils.deadline import DeadlineExceeded
+from utils.csr_graph import get_csr_graph
+from utils.graph_index import entity_label
+from utils.ripple_engine import EMPTY, RippleOverlay, propagate, ripple_hit
+from utils.ripple_monte_carlo import DEFAULT_TRIALS, monte_carlo_ripple
 from utils.model_filter import summarize_model_for_agent
-import openai
-import os
-import json
-import re
-import copy
+from utils.prompt_encoding import encode_json
 
 class ChaosTheoryAgentLLM(AgentBase):
-    def __init__(self, system_context="IT Organization"):
-        super().__init__(role="Chaos Theory Agent", system_context=system_context)
+    # List fields of the JSON answer, in display order (used for streamed rendering)
+    RESULT_LISTS = ["volatility_nodes", "feedback_loops", "emergent_risks", "fragile_paths"]
 
-    def smart_prompt(self, system_model, meta_context, user_query, diff_summary=None):
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        lite_model = summarize_model_for_agent(system_model, agent_type="chaos", max_per_category=20)
-        system_facts = json.dumps(lite_model, indent=2)
-        meta_facts = json.dumps(meta_context, indent=2)
-        diff_facts = json.dumps(diff_summary, indent=2) if diff_summary else "[]"
+    def __init__(self, system_context="IT Organization", provider=None):
+        super().__init__(role="Chaos Theory Agent", system_context=system_context, provider=provider)
 
-        instructions = f"""
+    def _smart_request(self, system_model, meta_context, user_query, diff_summary=None, encoding=None, model=None, deadline=None):
+        # Static instructions, model and meta-context first (byte-identical per model); the question last
+        static_block = self._static_prefix(
+            (system_model, meta_context), encoding,
+            lambda enc: self._static_block(system_model, meta_context, enc)
+        )
+        diff_facts = encode_json(diff_summary, encoding or self.encoding) if diff_summary else "[]"
+
+        instructions = static_block + f"""
+Recent Changes (diff_summary):
+{diff_facts}
+
+Now answer:
+{user_query}
+"""
+
+        messages = [
+            {"role": "system", "content": "You are a chaos theory analyst detecting instability and volatility in complex adaptive systems."},
+            {"role": "user", "content": instructions}
+        ]
+        return dict(
+            model=self._route(user_query, messages, default="gpt-4", model=model),
+            messages=messages,
+            temperature=0.3,
+            deadline=deadline
+        )
+
+    def _static_block(self, system_model, meta_context, encoding):
+        lite_model = summarize_model_for_agent(system_model, agent_type="chaos")
+        system_facts = self._encode_model(lite_model, encoding)
+        meta_facts = encode_json(meta_context, encoding)
+
+        return f"""
 As the Chaos Theory Agent, your task is to assess systemic volatility, feedback amplification, and tipping points.
 
 Consider:
@@ -29,18 +58,6 @@ Consider:
 - Node volatility and ripple potential
 - Hidden interdependencies and chaos amplifiers
 
-System Model:
-{system_facts}
-
-Meta Context:
-{meta_facts}
-
-Recent Changes (diff_summary):
-{diff_facts}
-
-Now answer:
-{user_query}
-
 Respond only in JSON format with structure like:
 {{
   "volatility_nodes": [...],
@@ -49,110 +66,119 @@ Respond only in JSON format with structure like:
   "fragile_paths": [...],
   "llm_reasoning": "..."
 }}
-"""
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a chaos theory analyst detecting instability and volatility in complex adaptive systems."},
-                {"role": "user", "content": instructions}
-            ],
-            temperature=0.3
-        )
+System Model:
+{system_facts}
+
+Meta Context:
+{meta_facts}
+"""
 
-        raw = response.choices[0].message.content.strip()
+    def simulate_ripple_step(self, model, event, step, graph=None):
+        """
+        Apply one ripple step to `model` (a system model or the RippleOverlay of an
+        earlier step) and return the resulting RippleOverlay; call .materialize()
+        on it to export. `graph` is the model's CSRGraph when the caller already has
+        one (e.g. memory-mapped).
+        """
+        graph = graph or self._ripple_graph(model)
+        hit = EMPTY
+        if event["type"] == "remove_person":
+            # The removed entities themselves, plus every entity naming one of them in its own fields
+            hit = ripple_hit(graph, self._ripple_origin(graph, event), graph.type_mask(nested=False))
+        return self._apply_ripple(model, graph, event, step, hit)
+
+    @staticmethod
+    def _ripple_origin(graph, event):
+        if event["type"] != "remove_person":
+            return []
+        targets = event["target"] if isinstance(event["target"], list) else [event["target"]]
+        return [node for target in targets for node in graph.nodes(target)]
 
-        try:
-            match = re.search(r'{.*}', raw, re.DOTALL)
-            json_text = match.group(0) if match else raw
-            return json_text
-        except Exception as e:
-            return json.dumps({
-                "volatility_nodes": [],
-                "feedback_loops": [],
-                "emergent_risks": [],
-                "fragile_paths": [],
-                "llm_reasoning": f"Failed to parse response as JSON. Raw output:\n{raw}"
-            }, indent=2)
-
-    def simulate_ripple_step(self, model, event, step):
-        updated_model = copy.deepcopy(model)
-        ripple_log = updated_model.get("ripple_history", [])
+    @staticmethod
+    def _ripple_graph(model):
+        return model.graph if isinstance(model, RippleOverlay) else get_csr_graph(model)
 
+    def _apply_ripple(self, model, graph, event, step, hit):
+        # Copy-on-write: only the statuses and history of the new overlay change
+        state = RippleOverlay.over(model, graph)
         targets = event["target"] if isinstance(event["target"], list) else [event["target"]]
         affected_nodes = set()
-
-        if event["type"] == "remove_person":
-            for section in updated_model:
-                if isinstance(updated_model[section], list):
-                    for obj in list(updated_model[section]):
-                        if "data" in obj:
-                            values_copy = list(obj["data"].values())
-                            for value in values_copy:
-                                if isinstance(value, list):
-                                    if any(t in value for t in targets):
-                                        obj["data"]["status"] = "ripple_affected"
-                                        affected_nodes.add(obj["data"].get("name") or obj["data"].get("hostname") or obj["data"].get("id"))
-                                elif value in targets:
-                                    obj["data"]["status"] = "ripple_affected"
-                                    affected_nodes.add(obj["data"].get("name") or obj["data"].get("hostname") or obj["data"].get("id"))
+        for node in hit:
+            obj = state.entry(node)
+            if isinstance(obj, dict) and "data" in obj:
+                state.mark(node)
+                label = graph.label(node)
+                if label is not None:
+                    affected_nodes.add(label)
 
         # Simple severity scoring based on affected count (out of 100)
         score = min(100, len(affected_nodes) * 10)
 
-        ripple_log.append({
+        state.history.append({
             "step": step,
             "event": event,
             "summary": f"{', '.join(targets)} removed. Ripple affected: {', '.join(sorted(affected_nodes)) or 'None'}",
             "severity_score": score,
+            "affected_nodes": sorted(affected_nodes),
             "llm_analysis": ""  # placeholder, will be updated by summarize_timestep
         })
-        updated_model["ripple_history"] = ripple_log
-        return updated_model
-
-    def simulate_multi_step_ripple(self, model, origin_event, max_steps=3):
-        current_model = copy.deepcopy(model)
-        affected_this_round = set()
-        all_affected = set()
-
-        for step in range(1, max_steps + 1):
-            step_summary = []
+        return state
+
+    def simulate_multi_step_ripple(self, model, origin_event, max_steps=3, deadline=None, graph=None):
+        """
+        Propagate `origin_event` for up to `max_steps`, with an LLM summary per step;
+        each step removes the nodes first reached by the previous one, and propagation
+        ends early once a step reaches nothing new.
+
+        Once `deadline` expires (or its token is cancelled) the remaining steps are
+        skipped and the result's `partial` ("ripple_partial" once materialized) says
+        how far it got. Returns a RippleOverlay over `model`.
+        """
+        graph = graph or self._ripple_graph(model)
+        state = RippleOverlay.over(model, graph)
+
+        for ripple in propagate(graph, self._ripple_origin(graph, origin_event), max_steps):
+            step = ripple.step
+            if deadline is not None and deadline.expired:
+                state.partial = {
+                    "steps_completed": step - 1,
+                    "steps_requested": max_steps,
+                    "reason": deadline.reason,
+                }
+                break
             ripple_event = {
                 "type": origin_event["type"],
-                "target": origin_event["target"] if step == 1 else list(affected_this_round)
+                "target": origin_event["target"] if step == 1 else
+                sorted(label for label in graph.labels(ripple.frontier) if label is not None)
             }
-            current_model = self.simulate_ripple_step(current_model, ripple_event, step)
-            affected_this_round.clear()
-
-            for section in current_model:
-                if isinstance(current_model[section], list):
-                    for obj in current_model[section]:
-                        if "data" in obj and obj["data"].get("status") == "ripple_affected":
-                            node_id = obj["data"].get("name") or obj["data"].get("hostname") or obj["data"].get("id")
-                            if node_id and node_id not in all_affected:
-                                affected_this_round.add(node_id)
-                                all_affected.add(node_id)
+            state = self._apply_ripple(state, graph, ripple_event, step, ripple.hit)
 
             # generate LLM summary for this step
-            summary = self.summarize_timestep(current_model, step)
-            current_model["ripple_history"][-1]["llm_analysis"] = summary
-
-        return current_model
-
-    def summarize_timestep(self, model, step):
-        last_event = model.get("ripple_history", [])[-1]
-        affected = []
-        for section in model:
-            if isinstance(model[section], list):
-                for obj in model[section]:
-                    if isinstance(obj, dict) and "data" in obj and isinstance(obj["data"], dict):
-                        if obj["data"].get("status") == "ripple_affected":
-                            affected.append(
-                                obj["data"].get("name") or
-                                obj["data"].get("hostname") or
-                                obj["data"].get("id") or
-                                "unknown"
-                            )
+            summary = self.summarize_timestep(state, step, deadline=deadline)
+            state.history[-1]["llm_analysis"] = summary
+
+        return state
+
+    def simulate_weighted_ripple(self, model, origin_event, max_steps=3, trials=DEFAULT_TRIALS, decay=None,
+                                 transmission=None, seed=None, deadline=None, graph=None):
+        """
+        Monte Carlo variant of simulate_multi_step_ripple: each reference passes a failure
+        on with a per-relationship probability (`transmission` overrides the defaults) that
+        decays every step. Returns an ImpactDistribution with each node's probability of
+        being impacted, split by step; no LLM calls are made.
+        """
+        graph = graph or self._ripple_graph(model)
+        origin = self._ripple_origin(graph, origin_event)
+        return monte_carlo_ripple(graph, origin, max_steps=max_steps, trials=trials, transmission=transmission,
+                                  decay=decay, seed=seed, deadline=deadline)
+
+    def summarize_timestep(self, model, step, llm_model=None, deadline=None):
+        if isinstance(model, RippleOverlay):
+            last_event = model.history[-1]
+            affected = [model.graph.label(node) or "unknown" for node in model.affected()]
+        else:
+            last_event, affected = self._scan_ripple_state(model)
 
         prompt = f"""
 Ripple Simulation - Step {step}
@@ -163,13 +189,32 @@ Summarize the emergent chaos effects and fragility from this event propagation.
 Explain how the affected nodes are connected, what this implies about system vulnerability,
 and what types of failure scenarios or systemic risks could emerge if these nodes fail together.
 """
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a chaos theory analyst summarizing system fragility and chaos evolution."},
-                {"role": "user", "content": prompt.strip()}
-            ],
-            temperature=0.4
-        )
-        return response.choices[0].message.content.strip()
+        messages = [
+            {"role": "system", "content": "You are a chaos theory analyst summarizing system fragility and chaos evolution."},
+            {"role": "user", "content": prompt.strip()}
+        ]
+        try:
+            return self._chat(
+                model=self._route(prompt, messages, default="gpt-4", complexity="analysis", model=llm_model),
+                messages=messages,
+                temperature=0.4,
+                deadline=deadline
+            )
+        except DeadlineExceeded as e:
+            return f"LLM summary skipped for step {step} ({e}). Affected nodes: {', '.join(affected) or 'None'}"
+        except Exception as e:
+            # Keep the ripple result even when the narrative summary cannot be produced
+            return f"LLM summary unavailable for step {step} ({e}). Affected nodes: {', '.join(affected) or 'None'}"
+
+    @staticmethod
+    def _scan_ripple_state(model):
+        # Exported (materialized) models keep their ripple state in the entities themselves
+        last_event = model.get("ripple_history", [])[-1]
+        affected = []
+        for section in model:
+            if isinstance(model[section], list):
+                for obj in model[section]:
+                    if isinstance(obj, dict) and "data" in obj and isinstance(obj["data"], dict):
+                        if obj["data"].get("status") == "ripple_affected":
+                            affected.append(entity_label(obj["data"]) or "unknown")
+        return last_event, affected
@@ -2,16 +2,59 @@
 # Wisdom Layer Production Agent – Complexity Sentinel (LLM-Powered)
 
 from agents.agent_base import AgentBase
+from utils.prompt_encoding import default_encoding
 import json
-import os
-import re
-import openai
 
 class ComplexitySentinelAgentLLM(AgentBase):
-    def __init__(self, system_context="IT Organization"):
-        super().__init__(role="Complexity Sentinel Agent", system_context=system_context)
-
-    def smart_prompt(self, current_model, previous_model, meta_context, user_query):
+    # List fields of the JSON answer, in display order (used for streamed rendering)
+    RESULT_LISTS = ["change_summary", "fragile_areas", "complexity_risks", "insights"]
+
+    def __init__(self, system_context="IT Organization", provider=None):
+        super().__init__(role="Complexity Sentinel Agent", system_context=system_context, provider=provider)
+
+    # Compares two models instead of answering about one, so the smart_prompt* entry points take the pair
+    def smart_prompt(self, current_model, previous_model, meta_context, user_query, encoding=None, model=None, deadline=None):
+        early = self._early_reply(current_model, previous_model)
+        if early is not None:
+            return early
+        return self._smart_answer(
+            (current_model, previous_model, self.system_context), user_query,
+            lambda question: self._smart_request(current_model, previous_model, meta_context, question, encoding, model, deadline)
+        )
+
+    async def smart_prompt_async(self, current_model, previous_model, meta_context, user_query, encoding=None, model=None, deadline=None):
+        early = self._early_reply(current_model, previous_model)
+        if early is not None:
+            return early
+        return await self._asmart_answer(
+            (current_model, previous_model, self.system_context), user_query,
+            lambda question: self._smart_request(current_model, previous_model, meta_context, question, encoding, model, deadline)
+        )
+
+    def smart_prompt_stream(self, current_model, previous_model, meta_context, user_query, encoding=None, model=None, deadline=None):
+        """Yield the raw reply text chunk by chunk; the validated answer is left in self.last_reply."""
+        early = self._early_reply(current_model, previous_model)
+        if early is not None:
+            self.last_reply = early
+            return iter([early])
+        return self._smart_answer_stream(
+            (current_model, previous_model, self.system_context), user_query,
+            lambda question: self._smart_request(current_model, previous_model, meta_context, question, encoding, model, deadline)
+        )
+
+    def smart_prompt_batch(self, current_model, previous_model, meta_context, questions, encoding=None, model=None, deadline=None):
+        """Answer several questions about one model pair in as few completions as possible; returns {question: answer}."""
+        early = self._early_reply(current_model, previous_model)
+        if early is not None:
+            return {question: early for question in questions}
+
+        return self._ask_batch(
+            questions,
+            lambda block: self._smart_request(current_model, previous_model, meta_context, block, encoding, model, deadline),
+            lambda question: self.smart_prompt(current_model, previous_model, meta_context, question, encoding, model, deadline)
+        )
+
+    def _early_reply(self, current_model, previous_model):
         if previous_model is None:
             return "🕰️ No previous model loaded. Please upload a second model to compare system evolution."
         if current_model == previous_model:
@@ -22,17 +65,36 @@ class ComplexitySentinelAgentLLM(AgentBase):
            "insights": [],
            "llm_reasoning": "No structural changes were detected between the previous and current models."
         })
+        return None
+
+    def _smart_request(self, current_model, previous_model, meta_context, user_query, encoding=None, model=None, deadline=None):
+        # Instructions and the diff of this model pair first (byte-identical per pair); the question last
+        static_block = self._static_prefix(
+            (current_model, previous_model, self.system_context), encoding,
+            lambda enc: self._static_block(current_model, previous_model, enc)
+        )
 
+        full_prompt = static_block + f"""
+User question: {user_query}
+"""
+
+        messages = [
+            {"role": "system", "content": "You are a Complexity Sentinel Agent for system evolution detection."},
+            {"role": "user", "content": full_prompt}
+        ]
+        return dict(
+            model=self._route(user_query, messages, default="gpt-4", model=model),
+            messages=messages,
+            temperature=0.3,
+            deadline=deadline
+        )
+
+    def _static_block(self, current_model, previous_model, encoding):
         lite_current = flatten_for_diff(current_model)
         lite_previous = flatten_for_diff(previous_model)
         diff_summary = compute_diff_summary(lite_current, lite_previous)
 
-        print("[🧠 DEBUG] DIFF SUMMARY:")
-        print(json.dumps(diff_summary, indent=2))
-
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-        full_prompt = f"""
+        return f"""
 You are the Complexity Sentinel Agent. You detect **structural changes** and **emerging complexity** in a system's evolution.
 
 You are provided two models:
@@ -40,9 +102,6 @@ You are provided two models:
 - `current`: the new snapshot
 Each is organized by system categories (e.g., Infrastructure, Applications, Teams). Each contains arrays of structured data and optional reasoning.
 
-You are also given a machine-generated `diff_summary` array containing changes:
-{json.dumps(diff_summary, indent=2)}
-
 Your tasks:
 1. Summarize and interpret the differences.
 2. Detect any fragility:
@@ -60,32 +119,21 @@ Your tasks:
 }}
 
 System context: {self.system_context}
-User question: {user_query}
+
+You are also given a machine-generated `diff_summary` array containing changes:
+{self._encode_diff(diff_summary, encoding)}
 """
 
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a Complexity Sentinel Agent for system evolution detection."},
-                    {"role": "user", "content": full_prompt}
-                ],
-                temperature=0.3
-            )
-
-            raw = response.choices[0].message.content.strip()
-            match = re.search(r'{.*}', raw, re.DOTALL)
-            json_text = match.group(0) if match else raw
-            return json_text
-
-        except Exception as e:
-            return json.dumps({
-                "change_summary": [],
-                "fragile_areas": [],
-                "complexity_risks": [],
-                "insights": [],
-                "llm_reasoning": f"LLM failure: {str(e)}"
-            }, indent=2)
+    def _encode_diff(self, diff_summary, encoding=None):
+        baseline = json.dumps(diff_summary, indent=2)
+        if (encoding or self.encoding or default_encoding()) != "compact":
+            return baseline
+
+        # Compact mode tabulates the changed entities under added_node / removed_node
+        grouped = {}
+        for change in diff_summary:
+            grouped.setdefault(change["type"], []).append(change["entity"])
+        return self._encode_model(grouped, "compact", baseline=baseline)
 
 def flatten_for_diff(model):
     clean = {}
@@ -0,0 +1,131 @@
+# © 2025 David Thatcher. All rights reserved.
+# Wisdom Layer Production Framework – Orchestrator running every agent against one model
+
+import asyncio
+import json
+import time
+
+from agents.systems_thinking_agent_llm import SystemsThinkingAgentLLM
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from agents.karma_agent_llm import KarmaAgentLLM
+from agents.complexity_sentinel_agent_llm import ComplexitySentinelAgentLLM
+from agents.meta_contexts import get_meta_context
+from utils.llm_client import run_coroutine
+
+AGENT_CLASSES = {
+    "Systems Thinking": SystemsThinkingAgentLLM,
+    "Chaos Theory": ChaosTheoryAgentLLM,
+    "Karma": KarmaAgentLLM,
+    "Complexity Sentinel": ComplexitySentinelAgentLLM,
+}
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Asked of an agent when the caller gives it no question of its own
+DEFAULT_QUESTIONS = {
+    "Systems Thinking": "What are the bottlenecks in this system?",
+    "Chaos Theory": "Which nodes are most volatile and why?",
+    "Karma": "Which actors are ethically fragile?",
+    "Complexity Sentinel": "What new relationships or nodes have emerged unexpectedly?",
+}
+
+
+def _parse(result):
+    try:
+        return json.loads(result.strip())
+    except (json.JSONDecodeError, AttributeError):
+        return result
+
+
+async def _run_agent(name, current_model, previous_model, meta_context, question, semaphore, provider=None,
+                     encoding=None, deadline=None):
+    agent = AGENT_CLASSES[name](provider=provider)
+    started = time.perf_counter()
+    async with semaphore:
+        try:
+            if name == "Complexity Sentinel":
+                result = await agent.smart_prompt_async(
+                    current_model=current_model,
+                    previous_model=previous_model,
+                    meta_context=meta_context,
+                    user_query=question,
+                    encoding=encoding,
+                    deadline=deadline
+                )
+            else:
+                result = await agent.smart_prompt_async(current_model, meta_context, question, encoding=encoding,
+                                                        deadline=deadline)
+            result = _parse(result)
+            # Cut off by the deadline (or cancelled): an empty answer flagged as partial
+            partial = isinstance(result, dict) and result.get("partial")
+            entry = {"status": "partial" if partial else "ok", "result": result}
+        except Exception as e:
+            entry = {"status": "error", "error": str(e)}
+    entry["question"] = question
+    entry["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return name, entry
+
+
+async def run_all_agents_async(current_model, previous_model=None, questions=None, meta_context=None,
+                               agents=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, provider=None,
+                               encoding=None, deadline=None):
+    """
+    Run every agent against one model concurrently and merge their answers.
+
+    Args:
+        current_model (dict): The uploaded system model.
+        previous_model (dict): Earlier snapshot for the Complexity Sentinel (optional).
+        questions (str | dict): One question for all agents, or {agent name: question};
+            agents without one are asked their DEFAULT_QUESTIONS entry.
+        meta_context (dict): Defaults to get_meta_context(current_model).
+        agents (list): Subset of AGENT_CLASSES names to run; defaults to all four.
+        max_concurrency (int): Upper bound on agent calls in flight at once.
+        provider (LLMProvider): Backend for every agent; defaults to the process-wide provider.
+        encoding (str): Prompt encoding of the model ("json" or "compact"); defaults to WISDOM_PROMPT_ENCODING.
+        deadline (Deadline): Shared time budget and cancellation; agents it cuts off report "partial".
+
+    Returns:
+        dict: Merged report keyed by agent name, plus overall wall-clock time.
+    """
+    names = list(agents or AGENT_CLASSES)
+    if meta_context is None:
+        meta_context = get_meta_context(current_model)
+    if not isinstance(questions, dict):
+        questions = {name: questions for name in names}
+    questions = {name: questions.get(name) or DEFAULT_QUESTIONS[name] for name in names}
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        _run_agent(name, current_model, previous_model, meta_context, questions[name], semaphore, provider,
+                   encoding, deadline)
+        for name in names
+    ])
+
+    return {
+        "agents": dict(results),
+        "failed": [name for name, entry in results if entry["status"] == "error"],
+        "partial": [name for name, entry in results if entry["status"] == "partial"],
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_all_agents(current_model, previous_model=None, questions=None, meta_context=None,
+                   agents=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, provider=None,
+                   encoding=None, deadline=None, on_wait=None):
+    """
+    Blocking entry point for run_all_agents_async (e.g. from Streamlit), on the shared event loop.
+    `on_wait()` is called a few times a second while the agents run; if it raises, every
+    outstanding agent call is cancelled.
+    """
+    return run_coroutine(run_all_agents_async(
+        current_model,
+        previous_model=previous_model,
+        questions=questions,
+        meta_context=meta_context,
+        agents=agents,
+        max_concurrency=max_concurrency,
+        provider=provider,
+        encoding=encoding,
+        deadline=deadline
+    ), on_wait=on_wait)
@@ -3,14 +3,14 @@
 
 from agents.agent_base import AgentBase
 from utils.model_filter import summarize_model_for_agent
-import openai
-import os
-import json
-import re
+from utils.prompt_encoding import encode_json
 
 class SystemsThinkingAgentLLM(AgentBase):
-    def __init__(self, system_context="IT Organization"):
-        super().__init__(role="Systems Thinking Agent", system_context=system_context)
+    # List fields of the JSON answer, in display order (used for streamed rendering)
+    RESULT_LISTS = ["bottlenecks", "isolated_nodes", "perspective_conflicts", "feedback_loops"]
+
+    def __init__(self, system_context="IT Organization", provider=None):
+        super().__init__(role="Systems Thinking Agent", system_context=system_context, provider=provider)
 
     def analyze(self, system_model):
         custom_instructions = """
@@ -31,54 +31,53 @@ class SystemsThinkingAgentLLM(AgentBase):
 """
         return self.prompt(system_model, custom_instructions)
 
-    def smart_prompt(self, system_model, meta_context, user_question, diff_summary=None):
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        lite_model = summarize_model_for_agent(system_model, agent_type="systems", max_per_category=20)
-        system_facts = json.dumps(lite_model, indent=2)
-        meta_facts = json.dumps(meta_context, indent=2)
-        diff_facts = json.dumps(diff_summary, indent=2) if diff_summary else "[]"
-
-        full_prompt = f"""
-You are a Systems Thinking Agent analyzing an IT organization.
-
-Here is the current systems model:
-{system_facts}
-
-Here is the meta-context:
-{meta_facts}
+    def _smart_request(self, system_model, meta_context, user_question, diff_summary=None, encoding=None, model=None, deadline=None):
+        # Static instructions, model and meta-context first (byte-identical per model); the question last
+        static_block = self._static_prefix(
+            (system_model, meta_context), encoding,
+            lambda enc: self._static_block(system_model, meta_context, enc)
+        )
+        diff_facts = encode_json(diff_summary, encoding or self.encoding) if diff_summary else "[]"
 
+        full_prompt = static_block + f"""
 Recent structural changes (diff_summary):
 {diff_facts}
 
 Now, answer the following question:
 {user_question}
-
-Use DSRP (Distinctions, Systems, Relationships, Perspectives) if applicable.
-Respond strictly in JSON format.
 """
 
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a systems thinking assistant analyzing complex adaptive systems."},
-                {"role": "user", "content": full_prompt}
-            ],
-            temperature=0.3
+        messages = [
+            {"role": "system", "content": "You are a systems thinking assistant analyzing complex adaptive systems."},
+            {"role": "user", "content": full_prompt}
+        ]
+        return dict(
+            model=self._route(user_question, messages, default="gpt-4", model=model),
+            messages=messages,
+            temperature=0.3,
+            deadline=deadline
         )
 
-        raw = response.choices[0].message.content.strip()
+    def _static_block(self, system_model, meta_context, encoding):
+        lite_model = summarize_model_for_agent(system_model, agent_type="systems")
+        system_facts = self._encode_model(lite_model, encoding)
+        meta_facts = encode_json(meta_context, encoding)
 
-        # Try to extract valid JSON using a regex fallback
-        try:
-            match = re.search(r'{.*}', raw, re.DOTALL)
-            json_text = match.group(0) if match else raw
-            return json_text  # Streamlit will still call json.loads()
-        except Exception as e:
-            # Fail-safe fallback
-            return json.dumps({
-                "bottlenecks": [],
-                "isolated_nodes": [],
-                "perspective_conflicts": [],
-                "feedback_loops": [],
-                "llm_reasoning": f"Failed to parse JSON from LLM output. Raw text:\n{raw}"
-            }, indent=2)
+        return f"""
+You are a Systems Thinking Agent analyzing an IT organization.
+Use DSRP (Distinctions, Systems, Relationships, Perspectives) if applicable.
+Respond strictly in this JSON format:
+{{
+  "bottlenecks": [...],
+  "isolated_nodes": [...],
+  "perspective_conflicts": [...],
+  "feedback_loops": [...],
+  "llm_reasoning": "..."
+}}
+
+Here is the current systems model:
+{system_facts}
+
+Here is the meta-context:
+{meta_facts}
+"""
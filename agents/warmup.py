@@ -0,0 +1,95 @@
+# © 2025 David Thatcher. All rights reserved.
+# Wisdom Layer Production Framework – Background cache warm-up for predefined questions
+
+import threading
+import time
+
+from agents.orchestrator import AGENT_CLASSES
+from agents.meta_contexts import get_meta_context
+from utils.llm_cache import get_cache
+from utils.llm_scheduler import PRIORITY_BACKGROUND
+from utils.model_filter import model_fingerprint
+
+
+class WarmupJob:
+    """
+    Precomputes answers to predefined questions on a background thread so that
+    interactive clicks are served from the completion cache.
+
+    Calls go through the scheduler's background lane, one at a time, and the job
+    stops before its next question once cancel() is called (e.g. a new model was
+    uploaded). Prompts are built exactly as the dashboard builds them, so the
+    cache keys match.
+
+    Args:
+        current_model (dict): The uploaded system model.
+        previous_model (dict): Earlier snapshot for the Complexity Sentinel (optional).
+        questions (dict): {agent name: [questions]} using AGENT_CLASSES names.
+        encoding (str): Prompt encoding the dashboard will use.
+        provider (LLMProvider): Backend; defaults to the process-wide provider.
+    """
+
+    def __init__(self, current_model, previous_model, questions, encoding=None, provider=None):
+        self.current_model = current_model
+        self.previous_model = previous_model
+        self.questions = {name: list(qs) for name, qs in questions.items() if name in AGENT_CLASSES}
+        self.encoding = encoding
+        self.provider = provider
+        self.key = warmup_key(current_model, previous_model, encoding)
+        self.total = sum(len(qs) for qs in self.questions.values())
+        self.completed = 0
+        self.errors = []
+        self.elapsed_seconds = 0.0
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="wisdom-warmup", daemon=True)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self._thread.ident is not None and not self._thread.is_alive()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        started = time.perf_counter()
+        meta_context = get_meta_context(self.current_model)
+        for name, questions in self.questions.items():
+            agent = AGENT_CLASSES[name](provider=self.provider)
+            agent.priority = PRIORITY_BACKGROUND
+            for question in questions:
+                if self._cancel.is_set():
+                    self.elapsed_seconds = round(time.perf_counter() - started, 3)
+                    return
+                try:
+                    if name == "Complexity Sentinel":
+                        agent.smart_prompt(self.current_model, self.previous_model, meta_context, question,
+                                           encoding=self.encoding)
+                    else:
+                        agent.smart_prompt(self.current_model, meta_context, question, encoding=self.encoding)
+                except Exception as e:
+                    self.errors.append(f"{name}: {question}: {e}")
+                self.completed += 1
+        self.elapsed_seconds = round(time.perf_counter() - started, 3)
+
+
+def warmup_key(current_model, previous_model, encoding=None):
+    """Identity of a warm-up: the model versions and prompt encoding it precomputes for."""
+    return (model_fingerprint(current_model), model_fingerprint(previous_model), encoding)
+
+
+def start_warmup(current_model, previous_model, questions, encoding=None, provider=None):
+    """Start a WarmupJob, or return None when the completion cache is disabled (nothing to warm)."""
+    if get_cache() is None:
+        return None
+    return WarmupJob(current_model, previous_model, questions, encoding=encoding, provider=provider).start()
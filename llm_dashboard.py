@@ -1,8 +1,10 @@
 # llm_dashboard.py
 
 import streamlit as st
+import hashlib
 import json
 import os
+import time
 import matplotlib.pyplot as plt
 
 from agents.systems_thinking_agent_llm import SystemsThinkingAgentLLM
@@ -10,25 +12,48 @@ from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
 from agents.karma_agent_llm import KarmaAgentLLM
 from agents.complexity_sentinel_agent_llm import ComplexitySentinelAgentLLM
 from agents.meta_contexts import get_meta_context
+from agents.orchestrator import run_all_agents
+from agents.warmup import start_warmup, warmup_key
+from utils.deadline import Deadline
+from utils.model_filter import VersionedModel
+from utils.csr_graph import load_graph_bytes
+from utils.prompt_encoding import default_encoding
+from utils.ripple_monte_carlo import DEFAULT_TRIALS, ripple_decay
+from utils.stream_json import IncrementalJSONParser
+from utils.telemetry import start_metrics_server
 from dotenv import load_dotenv
 load_dotenv()
 
+# Prometheus scrape endpoint for LLM call metrics, when WISDOM_METRICS_PORT is set
+start_metrics_server()
+
 st.set_page_config(page_title="LLM Wisdom Layer Dashboard ", layout="wide")
 st.title("🧠 LLM-Powered Wisdom Layer Dashboard ")
 
+
+def load_upload(uploaded_file, key):
+    # Parsed once per upload; the SHA-256 of the file is the model's version, so it is never re-hashed
+    digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    parsed = st.session_state.get(f"{key}_upload")
+    if parsed is None or parsed[0] != digest:
+        parsed = (digest, VersionedModel(json.loads(uploaded_file.getvalue()), version=digest))
+        st.session_state[f"{key}_upload"] = parsed
+    return parsed[1]
+
+
 # Upload current and previous JSON models
 current_model_file = st.file_uploader("Upload CURRENT system model", type="json", key="current")
 previous_model_file = st.file_uploader("Upload PREVIOUS system model", type="json", key="previous")
 
 if current_model_file:
-    current_model = json.load(current_model_file)
+    current_model = load_upload(current_model_file, "current")
     st.session_state["current_model"] = current_model
 else:
     st.warning("Upload the current model to proceed.")
     st.stop()
 
 if previous_model_file:
-    previous_model = json.load(previous_model_file)
+    previous_model = load_upload(previous_model_file, "previous")
     st.session_state["previous_model"] = previous_model
 else:
     previous_model = None
@@ -71,83 +96,271 @@ question_options = {
     ]
 }
 
+prompt_encoding = st.sidebar.radio(
+    "Prompt encoding of the system model", ["json", "compact"],
+    index=["json", "compact"].index(default_encoding()),
+    help="Compact sends one table per category with shared entity aliases, using far fewer prompt tokens."
+)
+
+time_budget = st.sidebar.number_input(
+    "Time budget per action (seconds, 0 = no limit)", min_value=0, max_value=600, value=0, step=5,
+    help="LLM calls are cut off at the budget; ripple simulations skip their remaining steps and are flagged as partial."
+)
+
+
+def new_deadline():
+    return Deadline.after(time_budget) if time_budget else None
+
+
+# Precompute every sample question in the background for this model version; a new upload cancels the old job
+warmup = st.session_state.get("warmup")
+current_warmup_key = warmup_key(st.session_state["current_model"], st.session_state["previous_model"], prompt_encoding)
+if warmup is None or warmup.key != current_warmup_key:
+    if warmup is not None:
+        warmup.cancel()
+    warmup = start_warmup(
+        st.session_state["current_model"], st.session_state["previous_model"],
+        question_options, encoding=prompt_encoding
+    )
+    st.session_state["warmup"] = warmup
+if warmup is not None:
+    st.sidebar.caption(f"Cache warm-up: {warmup.completed}/{warmup.total} sample answers ready"
+                       + (" (cancelled)" if warmup.cancelled else ""))
+
 sample = st.selectbox("Sample Questions", question_options.get(agent_choice, []))
 user_query = st.text_input("Ask the selected agent a question:", value=sample)
 
 # Run Smart Prompt
 if st.button("Submit Question"):
+    meta_context = get_meta_context(st.session_state["current_model"])
+    deadline = new_deadline()
+
+    if agent_choice == "Systems Thinking":
+        agent = SystemsThinkingAgentLLM()
+        stream = agent.smart_prompt_stream(st.session_state["current_model"], meta_context, user_query, encoding=prompt_encoding,
+                                           deadline=deadline)
+
+    elif agent_choice == "Chaos Theory":
+        agent = ChaosTheoryAgentLLM()
+        stream = agent.smart_prompt_stream(st.session_state["current_model"], meta_context, user_query, encoding=prompt_encoding,
+                                           deadline=deadline)
+
+    elif agent_choice == "Karma":
+        agent = KarmaAgentLLM()
+        stream = agent.smart_prompt_stream(st.session_state["current_model"], meta_context, user_query, encoding=prompt_encoding,
+                                           deadline=deadline)
+
+    elif agent_choice == "Complexity Sentinel":
+        agent = ComplexitySentinelAgentLLM()
+        stream = agent.smart_prompt_stream(
+            current_model=st.session_state["current_model"],
+            previous_model=st.session_state["previous_model"],
+            meta_context=meta_context,
+            user_query=user_query,
+            encoding=prompt_encoding,
+            deadline=deadline
+        )
+
+    st.subheader("🔍 Agent Insight")
+
+    # Render each list item as soon as it has fully streamed in
+    parser = IncrementalJSONParser()
+    sections = {}
+    headed = set()
+    live_area = st.container()
+    with live_area:
+        for key in agent.RESULT_LISTS:
+            sections[key] = st.container()
     with st.spinner(f"Running {agent_choice} Agent with Smart Prompt..."):
-        meta_context = get_meta_context(st.session_state["current_model"])
+        for chunk in stream:
+            for key, item in parser.feed(chunk):
+                if key not in sections:
+                    with live_area:
+                        sections[key] = st.container()
+                section = sections[key]
+                if key not in headed:
+                    section.markdown(f"**{key.replace('_', ' ').title()}**")
+                    headed.add(key)
+                if isinstance(item, (dict, list)):
+                    section.json(item)
+                else:
+                    section.markdown(f"- {item}")
+
+    result = agent.last_reply or parser.text.strip()
+
+    call_info = agent.last_call_info or {}
+    if call_info.get("source") == "semantic_cache":
+        st.info(f"♻️ Reused answer to a similar question: “{call_info['matched_question']}” "
+                f"(similarity {call_info['similarity']:.2f}) — no LLM call was made.")
 
-        if agent_choice == "Systems Thinking":
-            agent = SystemsThinkingAgentLLM()
-            result = agent.smart_prompt(st.session_state["current_model"], meta_context, user_query)
+    report = agent.last_encoding_report
+    if report:
+        st.caption(f"Prompt encoding: {report['encoding']} — {report['sent_tokens']} model tokens sent, "
+                   f"{report['saved_tokens']} saved versus indented JSON")
 
-        elif agent_choice == "Chaos Theory":
-            agent = ChaosTheoryAgentLLM()
-            result = agent.smart_prompt(st.session_state["current_model"], meta_context, user_query)
+    try:
+        result = result.strip()
+        parsed = json.loads(result)
+        if isinstance(parsed, dict) and parsed.get("partial"):
+            st.warning(f"⏱️ Partial result: {parsed.get('llm_reasoning')}")
+        with st.expander("Full JSON response", expanded=not headed):
+            st.json(parsed)
+    except json.JSONDecodeError:
+        st.warning("⚠️ The response is not JSON. Displaying raw text instead.")
+        st.markdown(result)
 
-        elif agent_choice == "Karma":
-            agent = KarmaAgentLLM()
-            result = agent.smart_prompt(st.session_state["current_model"], meta_context, user_query)
+# Answer every sample question for the selected agent, sending the model once per batch
+if st.button("Answer All Sample Questions"):
+    meta_context = get_meta_context(st.session_state["current_model"])
+    questions = question_options.get(agent_choice, [])
 
-        elif agent_choice == "Complexity Sentinel":
-            agent = ComplexitySentinelAgentLLM()
-            result = agent.smart_prompt(
+    with st.spinner(f"Answering {len(questions)} questions with the {agent_choice} Agent in one batch..."):
+        if agent_choice == "Complexity Sentinel":
+            answers = ComplexitySentinelAgentLLM().smart_prompt_batch(
                 current_model=st.session_state["current_model"],
                 previous_model=st.session_state["previous_model"],
                 meta_context=meta_context,
-                user_query=user_query
+                questions=questions,
+                encoding=prompt_encoding,
+                deadline=new_deadline()
+            )
+        else:
+            agent_class = {
+                "Systems Thinking": SystemsThinkingAgentLLM,
+                "Chaos Theory": ChaosTheoryAgentLLM,
+                "Karma": KarmaAgentLLM
+            }[agent_choice]
+            answers = agent_class().smart_prompt_batch(
+                st.session_state["current_model"], meta_context, questions, encoding=prompt_encoding,
+                deadline=new_deadline()
             )
 
-        st.subheader("🔍 Agent Insight")
+    st.subheader("📋 Sample Question Answers")
+    for question, answer in answers.items():
+        with st.expander(question):
+            try:
+                st.json(json.loads(answer))
+            except json.JSONDecodeError:
+                st.markdown(answer)
 
-        try:
-            result = result.strip()
-            parsed = json.loads(result)
-            st.json(parsed)
-        except json.JSONDecodeError:
-            st.warning("⚠️ The response is not JSON. Displaying raw text instead.")
-            st.markdown(result)
+# Run every agent in parallel against the uploaded model
+if st.button("Run All Agents"):
+    # Clicking Stop (or any other widget) reruns the script, which cancels the agent calls still running
+    st.button("Stop", key="stop_all_agents")
+    progress = st.empty()
+    started = time.monotonic()
+    with st.spinner("Running Systems Thinking, Chaos Theory, Karma and Complexity Sentinel in parallel..."):
+        report = run_all_agents(
+            current_model=st.session_state["current_model"],
+            previous_model=st.session_state["previous_model"],
+            # The typed question is for the selected agent; the others answer their default question
+            questions={agent_choice: user_query},
+            encoding=prompt_encoding,
+            deadline=new_deadline(),
+            on_wait=lambda: progress.caption(f"Running for {time.monotonic() - started:.0f}s")
+        )
+    progress.empty()
+
+    st.subheader(f"🧭 Combined Wisdom Report ({report['elapsed_seconds']}s)")
+    for name, entry in report["agents"].items():
+        with st.expander(f"{name} — {entry['status']} ({entry['elapsed_seconds']}s)", expanded=entry["status"] != "error"):
+            if entry["status"] == "error":
+                st.error(entry["error"])
+            elif isinstance(entry["result"], (dict, list)):
+                st.json(entry["result"])
+            else:
+                st.markdown(entry["result"])
 
 # Add Ripple Simulation UI if Chaos Agent selected
 if agent_choice == "Chaos Theory":
     st.markdown("---")
     st.subheader("⚡ Ripple Simulation (Chaos Agent)")
+    # Mapped from a sidecar keyed by the upload's content, so reruns skip resolving references
+    graph = load_graph_bytes(current_model_file.getvalue(), st.session_state["current_model"])
+    st.caption(f"Dependency graph: {len(graph)} entities, {graph.edge_count} references "
+               f"across {len(graph.edge_types)} relationship types")
 
     with st.form("RippleForm"):
         ripple_target = st.selectbox(
             "Choose a node to simulate removal",
-            options=[
-                obj["data"]["name"]
-                for obj in st.session_state["current_model"].get("Human Interactions", [])
-                if "name" in obj["data"]
-            ],
+            options=graph.labels_in("Human Interactions"),
             index=0
         )
         ripple_step = st.number_input("Start Step Number", min_value=1, max_value=10, value=1)
         run_multi_step = st.checkbox("🌀 Run full ripple propagation (multi-step)")
+        run_monte_carlo = st.checkbox(
+            "🎲 Weighted Monte Carlo propagation",
+            help="Each relationship passes the failure on with its own probability, decaying every step; "
+                 "shows how likely each node is to be impacted across many trials. No LLM calls."
+        )
+        mc_trials = st.number_input("Monte Carlo trials", min_value=100, max_value=100000, value=DEFAULT_TRIALS, step=500)
+        mc_decay = st.slider("Decay per step", min_value=0.0, max_value=1.0, value=ripple_decay(), step=0.05)
         submit_ripple = st.form_submit_button("Simulate Ripple")
 
     if submit_ripple:
         agent = ChaosTheoryAgentLLM()
         ripple_event = {"type": "remove_person", "target": ripple_target}
+        dependents = sorted({label for label in graph.labels(graph.referrers([ripple_target])) if label})
+        st.caption(f"Directly depends on {ripple_target}: {', '.join(dependents) or 'nothing'}")
+
+        if run_monte_carlo:
+            with st.spinner(f"Sampling {mc_trials} weighted ripples..."):
+                impact = agent.simulate_weighted_ripple(
+                    model=st.session_state["current_model"],
+                    origin_event=ripple_event,
+                    max_steps=3,
+                    trials=int(mc_trials),
+                    decay=mc_decay,
+                    deadline=new_deadline(),
+                    graph=graph
+                )
+            if impact.partial:
+                st.warning(f"⏱️ Partial Monte Carlo run ({impact.partial['reason']}): {impact.partial['trials_completed']} of "
+                           f"{impact.partial['trials_requested']} trials completed.")
+            percentiles = impact.percentiles()
+            st.markdown(f"**Expected impacted nodes:** {impact.expected_impacted:.1f} "
+                        f"(p50 {percentiles['p50']}, p90 {percentiles['p90']}, p99 {percentiles['p99']}) — "
+                        f"**Severity Score:** {impact.severity_score}")
+            rows = impact.top(25)
+            for row in rows:
+                for step, probability in enumerate(row.pop("by_step"), start=1):
+                    row[f"step {step}"] = probability
+            st.dataframe(rows, use_container_width=True)
+            if impact.trials:
+                fig, ax = plt.subplots(figsize=(6, 2.5))
+                ax.hist(impact.sizes, bins=min(50, int(impact.sizes.max()) + 1))
+                ax.set_xlabel("Nodes impacted per trial")
+                ax.set_ylabel("Trials")
+                st.pyplot(fig)
+            with st.expander("Full impact distribution JSON"):
+                st.json(impact.to_dict(limit=None))
 
-        if run_multi_step:
+        elif run_multi_step:
             with st.spinner("Simulating multi-step ripple..."):
-                updated_model = agent.simulate_multi_step_ripple(
+                ripple = agent.simulate_multi_step_ripple(
                     model=st.session_state["current_model"],
                     origin_event=ripple_event,
-                    max_steps=3
+                    max_steps=3,
+                    deadline=new_deadline(),
+                    graph=graph
                 )
-                for entry in updated_model.get("ripple_history", []):
+                partial = ripple.partial
+                if partial:
+                    st.warning(f"⏱️ Partial ripple ({partial['reason']}): {partial['steps_completed']} of "
+                               f"{partial['steps_requested']} steps completed.")
+                for entry in ripple.history:
                     st.markdown(f"### 🌀 Step {entry['step']} Summary")
                     st.markdown(entry['summary'])
                     st.markdown(f"**Severity Score:** {entry.get('severity_score', 'N/A')} (scale 0-100 based on number of impacted nodes)")
                     if entry.get("llm_analysis"):
                         st.info(entry["llm_analysis"])
         else:
-            updated_model = agent.simulate_ripple_step(st.session_state["current_model"], ripple_event, ripple_step)
-            ripple_summary = agent.summarize_timestep(updated_model, ripple_step)
+            ripple = agent.simulate_ripple_step(st.session_state["current_model"], ripple_event, ripple_step, graph=graph)
+            ripple_summary = agent.summarize_timestep(ripple, ripple_step, deadline=new_deadline())
             st.success(f"Ripple Step {ripple_step} from removal of {ripple_target}")
             st.code(ripple_summary, language="markdown")
+
+        if not run_monte_carlo:
+            # The rippled model is only assembled for export
+            st.download_button("Download rippled model", json.dumps(ripple.materialize(), indent=2),
+                               file_name="systems_model_ripple.json", mime="application/json")
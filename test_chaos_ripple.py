@@ -14,19 +14,19 @@ event = {
     "target": "Jane Doe"
 }
 
-# Simulate ripple step
+# Simulate ripple step (ripple state is an overlay on the unchanged model)
 step = 1
-updated_model = chaos_agent.simulate_ripple_step(model, event, step=step)
+ripple = chaos_agent.simulate_ripple_step(model, event, step=step)
 
 # Print affected nodes for sanity check
-print(f"\nRipple History:\n{updated_model.get('ripple_history', [])}")
+print(f"\nRipple History:\n{ripple.history}")
 
 # Get LLM summary
-summary = chaos_agent.summarize_timestep(updated_model, step=step)
+summary = chaos_agent.summarize_timestep(ripple, step=step)
 
 print("\n🔍 Chaos Agent Summary:")
 print(summary)
 
 # Optional: Save the result to see model evolution
 with open("systems_model_ripple_step1.json", "w") as f:
-    json.dump(updated_model, f, indent=2)
+    json.dump(ripple.materialize(), f, indent=2)
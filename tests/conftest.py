@@ -0,0 +1,15 @@
+# conftest.py
+# Offline test settings: every LLM call goes to the in-process fake provider, with no shared state on disk
+
+import os
+
+os.environ.update({
+    "WISDOM_LLM_PROVIDER": "fake",
+    "WISDOM_LLM_CACHE": "off",
+    "WISDOM_SEMANTIC_CACHE": "off",
+    "WISDOM_MODEL_ROUTER": "off",
+    "WISDOM_HEDGE": "off",
+    "WISDOM_RATE_LIMITS": '{"gpt-4": {"rpm": 100000, "tpm": 100000000}, '
+                          '"gpt-4-turbo": {"rpm": 100000, "tpm": 100000000}, '
+                          '"gpt-3.5-turbo": {"rpm": 100000, "tpm": 100000000}}',
+})
@@ -0,0 +1,72 @@
+# test_agent_base.py
+# Batched questions: one completion per chunk, answers matched back, failed chunks asked one by one
+
+import json
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils.llm_providers import FakeProvider
+
+with open("systems_model.json") as f:
+    MODEL = json.load(f)
+
+QUESTIONS = ["Which nodes are most volatile?", "Where are the feedback loops?", "What could cascade from the database?"]
+BATCH_MARKER = "Answer each of these questions separately"
+
+
+class BatchProvider(FakeProvider):
+    # Counts single and batched completions; `batch_reply` overrides what a batched prompt gets back
+    def __init__(self, batch_reply=None):
+        super().__init__()
+        self.batch_reply = batch_reply
+        self.single_calls = 0
+        self.batch_calls = 0
+
+    def complete(self, model, messages, **params):
+        if not any(BATCH_MARKER in m["content"] for m in messages):
+            self.single_calls += 1
+            return super().complete(model, messages, **params)
+        self.batch_calls += 1
+        if self.batch_reply is None:
+            return super().complete(model, messages, **params)
+        return self.batch_reply(super().complete(model, messages, **params))
+
+
+def _answers(provider):
+    agent = ChaosTheoryAgentLLM(provider=provider)
+    answers = agent.smart_prompt_batch(MODEL, {}, QUESTIONS + QUESTIONS[:1])
+    assert list(answers) == QUESTIONS
+    for answer in answers.values():
+        assert "LLM failure" not in json.loads(answer)["llm_reasoning"]
+    return answers
+
+
+def test_batch_is_one_completion_matched_back_by_index():
+    provider = BatchProvider()
+    _answers(provider)
+    assert (provider.batch_calls, provider.single_calls) == (1, 0)
+
+
+def test_answers_missing_from_the_batch_are_asked_individually():
+    def drop_second(completion):
+        reply = json.loads(completion.text)
+        reply["answers"] = [item for item in reply["answers"] if item["index"] != 2]
+        completion.text = json.dumps(reply)
+        return completion
+
+    provider = BatchProvider(drop_second)
+    _answers(provider)
+    assert (provider.batch_calls, provider.single_calls) == (1, 1)
+
+
+def test_failed_or_unparseable_batch_falls_back_to_single_questions():
+    def fail(completion):
+        raise RuntimeError("batch endpoint down")
+
+    def garble(completion):
+        completion.text = "Sorry, I cannot answer in JSON today."
+        return completion
+
+    for batch_reply in (fail, garble):
+        provider = BatchProvider(batch_reply)
+        _answers(provider)
+        assert provider.single_calls == len(QUESTIONS)
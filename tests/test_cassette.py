@@ -0,0 +1,70 @@
+# test_cassette.py
+# Record/replay of LLM exchanges: faithful replay, repeat order, rerouted models, misses and latency
+
+import asyncio
+import itertools
+import json
+import time
+
+import pytest
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils.cassette import CassetteMissError, CassetteProvider
+from utils.llm_providers import Completion, FakeProvider
+
+MESSAGES = [{"role": "user", "content": "Which nodes are most volatile?"}]
+
+with open("systems_model.json") as f:
+    MODEL = json.load(f)
+
+
+class NumberedProvider(FakeProvider):
+    # Every completion is different, so replays show which recording they came from
+    def __init__(self):
+        super().__init__()
+        self.numbers = itertools.count(1)
+
+    def complete(self, model, messages, **params):
+        time.sleep(0.05)
+        return Completion(f"answer {next(self.numbers)}", model, 10, 2)
+
+
+def test_replay_returns_recordings_in_order(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    recorder = CassetteProvider(path, "record", NumberedProvider())
+    recorded = [recorder.complete("gpt-4", MESSAGES, temperature=0.3).text for _ in range(2)]
+    assert recorded == ["answer 1", "answer 2"]
+
+    player = CassetteProvider(path, "replay", latency_scale=0)
+    replayed = [player.complete("gpt-4", MESSAGES, temperature=0.3) for _ in range(3)]
+    assert [c.text for c in replayed] == ["answer 1", "answer 2", "answer 1"]
+    assert (replayed[0].prompt_tokens, replayed[0].completion_tokens) == (10, 2)
+    assert asyncio.run(player.acomplete("gpt-4", MESSAGES, temperature=0.3)).text == "answer 2"
+    # A request routed to another model is served the recording for the same messages
+    assert player.complete("gpt-3.5-turbo", MESSAGES, temperature=0.3).model == "gpt-3.5-turbo"
+
+    with pytest.raises(CassetteMissError):
+        player.complete("gpt-4", MESSAGES, temperature=0.9)
+    with pytest.raises(CassetteMissError):
+        player.complete("gpt-4", [{"role": "user", "content": "Something never asked"}], temperature=0.3)
+
+
+def test_replay_latency_follows_the_recording_scaled(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    CassetteProvider(path, "record", NumberedProvider()).complete("gpt-4", MESSAGES)
+    for scale, low, high in ((1.0, 0.04, 1.0), (0.0, 0.0, 0.03)):
+        started = time.perf_counter()
+        CassetteProvider(path, "replay", latency_scale=scale).complete("gpt-4", MESSAGES)
+        assert low <= time.perf_counter() - started < high
+
+
+def test_recorded_agent_session_replays_identically(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    recorder = CassetteProvider(path, "record", FakeProvider())
+    agent = ChaosTheoryAgentLLM(provider=recorder)
+    answer = agent.smart_prompt(MODEL, {}, "Which nodes are most volatile?")
+    streamed = "".join(agent.smart_prompt_stream(MODEL, {}, "Where are the feedback loops?"))
+
+    player = ChaosTheoryAgentLLM(provider=CassetteProvider(path, "replay", latency_scale=0))
+    assert player.smart_prompt(MODEL, {}, "Which nodes are most volatile?") == answer
+    assert "".join(player.smart_prompt_stream(MODEL, {}, "Where are the feedback loops?")) == streamed
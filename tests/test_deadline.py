@@ -0,0 +1,68 @@
+# test_deadline.py
+# Deadlines and cancellation: clamped timeouts, and agent calls that stop with a partial answer
+
+import json
+import time
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils.deadline import CancellationToken, Deadline, remaining_timeout
+from utils.llm_providers import FakeProvider
+
+MESSAGES = [{"role": "user", "content": "Which nodes are most volatile?"}]
+
+with open("systems_model.json") as f:
+    MODEL = json.load(f)
+
+
+class RecordingProvider(FakeProvider):
+    def __init__(self, latency=0.0):
+        super().__init__(latency=latency)
+        self.timeouts = []
+
+    def complete(self, model, messages, **params):
+        self.timeouts.append(params.get("timeout"))
+        return super().complete(model, messages, **params)
+
+
+def test_deadline_clamps_timeouts_and_expires_on_cancel():
+    unlimited = Deadline()
+    assert unlimited.remaining() is None and unlimited.timeout(30) == 30 and not unlimited.expired
+    assert remaining_timeout(None, 30) == 30
+
+    deadline = Deadline.after(5)
+    assert 4 < deadline.timeout(30) <= 5
+    assert deadline.timeout(1) == 1 and deadline.reason is None
+
+    token = CancellationToken()
+    cancellable = Deadline.after(5, token)
+    token.cancel()
+    assert cancellable.expired and cancellable.remaining() == 0.0 and cancellable.reason == "cancelled"
+    assert Deadline.after(0).reason == "deadline exceeded"
+
+
+def test_provider_timeout_never_outlives_the_deadline():
+    provider = RecordingProvider()
+    agent = ChaosTheoryAgentLLM(provider=provider)
+    agent._chat("gpt-4", MESSAGES, temperature=0.3, deadline=Deadline.after(2))
+    agent._chat("gpt-4", MESSAGES, temperature=0.7)
+    assert 0 < provider.timeouts[0] <= 2
+    assert provider.timeouts[1] is None
+
+
+def test_expired_or_cancelled_call_returns_a_partial_answer():
+    provider = RecordingProvider()
+    agent = ChaosTheoryAgentLLM(provider=provider)
+    token = CancellationToken()
+    token.cancel()
+    for deadline in (Deadline.after(0), Deadline(token=token)):
+        reply = json.loads(agent.smart_prompt(MODEL, {}, "Which nodes are most volatile?", deadline=deadline))
+        assert reply["partial"] is True and reply["volatility_nodes"] == []
+    assert provider.timeouts == []
+
+
+def test_slow_call_is_cut_off_at_the_deadline():
+    agent = ChaosTheoryAgentLLM(provider=RecordingProvider(latency=3.0))
+    started = time.perf_counter()
+    reply = json.loads(agent.smart_prompt(MODEL, {}, "Which nodes are most volatile?", deadline=Deadline.after(0.3)))
+    assert time.perf_counter() - started < 1.5
+    assert reply["partial"] is True
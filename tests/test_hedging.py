@@ -0,0 +1,139 @@
+# test_hedging.py
+# Hedged requests: slow calls and slow first tokens get an admitted backup, losers count once as hedges
+
+import itertools
+import threading
+import time
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils import hedging, telemetry
+from utils.hedging import Hedger
+from utils.llm_providers import FakeProvider
+from utils.llm_scheduler import LLMScheduler
+
+MESSAGES = [{"role": "user", "content": "Which nodes are most volatile and why?"}]
+
+
+def _primed(model, first_token=False):
+    hedger = Hedger(min_samples=3, budget=1.0)
+    for _ in range(5):
+        hedger.observe(model, 0.05, first_token)
+    return hedger
+
+
+def test_primary_runs_on_caller_thread_when_no_hedge_is_possible():
+    # No latency history yet, and history but no hedge budget left
+    no_budget = _primed("gpt-4")
+    no_budget.budget = 0.0
+    threads = []
+    for hedger in (Hedger(), no_budget):
+        hedger.run("agent", "gpt-4", lambda: threads.append(threading.current_thread()))
+    assert threads == [threading.current_thread()] * 2
+
+
+def test_slow_primary_is_hedged():
+    hedger, calls = _primed("gpt-4"), itertools.count()
+
+    def call():
+        if next(calls) == 0:
+            time.sleep(2)
+            return "primary"
+        return "hedge"
+
+    started = time.perf_counter()
+    assert hedger.run("agent", "gpt-4", call) == "hedge"
+    assert time.perf_counter() - started < 1.0
+    assert hedger.stats["agent"] == {"requests": 1, "hedges": 1, "hedge_wins": 1}
+
+
+def test_backup_needs_scheduler_admission():
+    hedger, calls = _primed("gpt-4"), itertools.count()
+
+    def call():
+        next(calls)
+        time.sleep(0.3)
+        return "primary"
+
+    assert hedger.run("agent", "gpt-4", call, admit=lambda: False) == "primary"
+    assert next(calls) == 1
+    assert hedger.stats["agent"] == {"requests": 1, "hedges": 0, "hedge_wins": 0}
+
+    # try_acquire admits only what fits in the buckets right now
+    scheduler = LLMScheduler(limits={"gpt-4": {"rpm": 1, "tpm": 10000}})
+    assert scheduler.try_acquire("agent", "gpt-4", 10)
+    assert not scheduler.try_acquire("agent", "gpt-4", 10)
+
+
+def test_primary_workers_are_reused():
+    workers, names = hedging._PrimaryWorkers(2), []
+    for _ in range(5):
+        workers.try_submit(lambda: names.append(threading.current_thread())).result(5)
+        time.sleep(0.05)
+    assert len(set(names)) == 1
+    assert workers._started == 1
+
+    # Every worker busy: nothing queues, the caller runs the primary itself
+    release = threading.Event()
+    busy = [workers.try_submit(release.wait) for _ in range(2)]
+    assert workers.try_submit(lambda: None) is None
+    release.set()
+    for future in busy:
+        future.result(5)
+
+
+class SlowFirstComplete(FakeProvider):
+    # The first completion takes 0.5 s; later ones answer at once
+    def __init__(self):
+        super().__init__()
+        self.completions = itertools.count()
+
+    def complete(self, model, messages, **params):
+        if next(self.completions) == 0:
+            time.sleep(0.5)
+        return super().complete(model, messages, **params)
+
+
+def test_losing_copy_is_recorded_once_as_hedge(monkeypatch):
+    monkeypatch.setenv("WISDOM_HEDGE", "on")
+    monkeypatch.setattr(hedging, "_hedger", _primed("gpt-4"))
+    monkeypatch.setattr(telemetry, "_telemetry", telemetry.Telemetry())
+    agent = ChaosTheoryAgentLLM(provider=SlowFirstComplete())
+
+    assert agent._chat("gpt-4", MESSAGES, temperature=0.3)
+    calls = telemetry.get_telemetry().calls._values
+    for _ in range(50):
+        if (agent.role, "gpt-4", "hedge_lost") in calls:
+            break
+        time.sleep(0.1)
+    assert calls == {(agent.role, "gpt-4", "ok"): 1, (agent.role, "gpt-4", "hedge_lost"): 1}
+
+
+class SlowFirstStream(FakeProvider):
+    # The first stream opened waits 2 s for its first chunk; later ones answer at once
+    def __init__(self):
+        super().__init__()
+        self.opened = itertools.count()
+        self.closed = threading.Event()
+
+    def stream(self, model, messages, **params):
+        slow = next(self.opened) == 0
+        try:
+            if slow:
+                time.sleep(2)
+            yield from super().stream(model, messages, **params)
+        finally:
+            if slow:
+                self.closed.set()
+
+
+def test_stream_first_token_is_hedged_and_loser_closed(monkeypatch):
+    monkeypatch.setenv("WISDOM_HEDGE", "on")
+    monkeypatch.setattr(hedging, "_hedger", _primed("gpt-4", first_token=True))
+    provider = SlowFirstStream()
+    agent = ChaosTheoryAgentLLM(provider=provider)
+
+    started = time.perf_counter()
+    text = "".join(agent._chat_stream("gpt-4", MESSAGES, temperature=0.3))
+    assert time.perf_counter() - started < 1.0
+    assert text
+    assert provider.closed.wait(5)
@@ -0,0 +1,61 @@
+# test_llm_cache.py
+# Completion cache: what the key depends on, TTL and LRU eviction, and agent calls served from it
+
+import time
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils.llm_cache import LLMCache, cache_key
+from utils.llm_providers import FakeProvider
+
+MESSAGES = [
+    {"role": "system", "content": "You are a Wisdom Layer Agent."},
+    {"role": "user", "content": "Which nodes are most volatile?"},
+]
+
+
+def test_key_covers_model_temperature_system_and_prompt():
+    key = cache_key("gpt-4", MESSAGES, 0.3)
+    assert key == cache_key("gpt-4", [dict(m) for m in MESSAGES], 0.3)
+    assert key != cache_key("gpt-3.5-turbo", MESSAGES, 0.3)
+    assert key != cache_key("gpt-4", MESSAGES, 0.7)
+    assert key != cache_key("gpt-4", [MESSAGES[0], {"role": "user", "content": "Which nodes are stable?"}], 0.3)
+    assert key != cache_key("gpt-4", [{"role": "system", "content": "You are terse."}, MESSAGES[1]], 0.3)
+    # Roles are part of the rendered prompt
+    assert key != cache_key("gpt-4", [MESSAGES[0], dict(MESSAGES[1], role="assistant")], 0.3)
+
+
+def test_ttl_and_lru_eviction():
+    cache = LLMCache(":memory:", ttl=60, max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, "gpt-4", key.upper())
+        time.sleep(0.01)
+    assert cache.get("a") == "A"   # "a" is now the most recently used
+    cache.put("c", "gpt-4", "C")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("A", None, "C")
+    assert cache.stats()["entries"] == 2
+
+    expired = LLMCache(":memory:", ttl=0)
+    expired.put("a", "gpt-4", "A")
+    time.sleep(0.01)
+    assert expired.get("a") is None and not expired.contains("a")
+
+
+class CountingProvider(FakeProvider):
+    def __init__(self):
+        super().__init__()
+        self.completions = 0
+
+    def complete(self, model, messages, **params):
+        self.completions += 1
+        return super().complete(model, messages, **params)
+
+
+def test_repeated_agent_call_is_served_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("WISDOM_LLM_CACHE", str(tmp_path / "llm_cache.sqlite"))
+    provider = CountingProvider()
+    agent = ChaosTheoryAgentLLM(provider=provider)
+    first = agent._chat("gpt-4", MESSAGES, temperature=0.3)
+    assert agent._chat("gpt-4", MESSAGES, temperature=0.3) == first
+    assert provider.completions == 1
+    agent._chat("gpt-4", MESSAGES, temperature=0.7)
+    assert provider.completions == 2
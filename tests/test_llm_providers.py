@@ -0,0 +1,37 @@
+# test_llm_providers.py
+# Provider backends: the OpenAI stream is closed however its consumer stops
+
+from types import SimpleNamespace
+
+from utils import llm_providers
+from utils.llm_providers import OpenAIProvider
+
+
+class FakeStream:
+    def __init__(self, deltas):
+        self.chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=d))]) for d in deltas]
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+def test_openai_stream_is_closed_when_abandoned(monkeypatch):
+    streams = []
+
+    def create(**params):
+        streams.append(FakeStream(["Hello", " world"]))
+        return streams[-1]
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(llm_providers, "get_client", lambda: client)
+    provider = OpenAIProvider()
+
+    assert "".join(provider.stream("gpt-4", [])) == "Hello world"
+    chunks = provider.stream("gpt-4", [])
+    assert next(chunks) == "Hello"
+    chunks.close()
+    assert [stream.closed for stream in streams] == [True, True]
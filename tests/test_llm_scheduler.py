@@ -0,0 +1,100 @@
+# test_llm_scheduler.py
+# Rate-limit scheduler: token buckets, round-robin across agents, background reserve, retries and deadlines
+
+import asyncio
+
+import pytest
+
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.llm_providers import ProviderError
+from utils.llm_scheduler import (
+    BACKGROUND_RESERVE, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, LLMScheduler, TokenBucket, is_retryable
+)
+
+MESSAGES = [{"role": "user", "content": "Which nodes are most volatile?"}]
+INTERACTIVE = ("gpt-4", PRIORITY_INTERACTIVE)
+BACKGROUND = ("gpt-4", PRIORITY_BACKGROUND)
+
+
+def test_token_bucket_refills_evenly_over_a_minute():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(30, now + 10) == pytest.approx(20.0)
+    # Requests larger than the bucket cost (and wait for) one full bucket
+    bucket.take(1000)
+    assert bucket.tokens == pytest.approx(10 - 60)
+
+
+def test_waiting_agents_are_served_round_robin():
+    scheduler = LLMScheduler(limits={"gpt-4": {"rpm": 1000, "tpm": 1000000}})
+    served = []
+    with scheduler._cond:
+        tickets = [(agent, scheduler._enqueue(agent, INTERACTIVE)) for agent in ("busy", "busy", "busy", "quiet")]
+        while scheduler._next_ticket("gpt-4") is not None:
+            ticket = scheduler._next_ticket("gpt-4")
+            agent = next(agent for agent, t in tickets if t is ticket)
+            assert scheduler._admit(agent, INTERACTIVE, ticket, 10) == 0
+            served.append(agent)
+    assert served == ["busy", "quiet", "busy", "busy"]
+
+
+def test_background_calls_queue_behind_interactive_and_keep_a_reserve():
+    scheduler = LLMScheduler(limits={"gpt-4": {"rpm": 100, "tpm": 1000}})
+    with scheduler._cond:
+        background = scheduler._enqueue("warmup", BACKGROUND)
+        interactive = scheduler._enqueue("agent", INTERACTIVE)
+        assert scheduler._admit("warmup", BACKGROUND, background, 10) is None
+        assert scheduler._admit("agent", INTERACTIVE, interactive, 10) == 0
+
+        # Leave exactly the reserve free: interactive calls still fit, background ones wait
+        _, tokens = scheduler._model_buckets("gpt-4")
+        tokens.take(tokens.tokens - 1000 * BACKGROUND_RESERVE)
+        assert scheduler._admit("warmup", BACKGROUND, background, 10) > 0
+    assert scheduler.try_acquire("agent", "gpt-4", 10)
+
+
+def test_try_acquire_never_jumps_the_queue():
+    scheduler = LLMScheduler(limits={"gpt-4": {"rpm": 1000, "tpm": 1000000}})
+    with scheduler._cond:
+        scheduler._enqueue("agent", INTERACTIVE)
+    assert not scheduler.try_acquire("hedge", "gpt-4", 10)
+    assert scheduler._queues[INTERACTIVE].get("hedge") is None
+
+
+def test_acquire_waits_for_refill_and_respects_the_deadline():
+    scheduler = LLMScheduler(limits={"gpt-4": {"rpm": 600, "tpm": 1000000}})
+    requests, _ = scheduler._model_buckets("gpt-4")
+    requests.take(requests.tokens)
+    assert 0.05 < scheduler.acquire("agent", "gpt-4", 10) < 1.0   # one request every 0.1 s
+
+    requests.take(requests.tokens + 600)   # a minute's worth in debt
+    with pytest.raises(DeadlineExceeded):
+        scheduler.acquire("agent", "gpt-4", 10, deadline=Deadline(0.2))
+    assert not scheduler._queues[INTERACTIVE]
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(scheduler.aacquire("agent", "gpt-4", 10, deadline=Deadline(0.2)))
+    assert not scheduler._queues[INTERACTIVE]
+
+
+def test_transient_failures_are_retried():
+    scheduler = LLMScheduler(backoff=0.01, max_backoff=0.05)
+    attempts = []
+
+    def overloaded_twice():
+        attempts.append("overloaded")
+        if len(attempts) < 3:
+            raise ProviderError("overloaded", 503)
+        return "done"
+
+    def rejected():
+        attempts.append("rejected")
+        raise ProviderError("bad request", 400)
+
+    assert scheduler.run("agent", "gpt-4", MESSAGES, overloaded_twice) == "done"
+    with pytest.raises(ProviderError):
+        scheduler.run("agent", "gpt-4", MESSAGES, rejected)
+    assert attempts == ["overloaded"] * 3 + ["rejected"]
+    assert is_retryable(ProviderError("rate limited", 429))
@@ -0,0 +1,65 @@
+# test_model_filter.py
+# Model version fingerprints (explicit upload versions, content hashes that follow in-place edits)
+# and token-budgeted model summaries
+
+import copy
+import json
+
+from utils.graph_index import get_graph_index
+from utils.model_filter import VersionedModel, _serialized_tokens, model_fingerprint, summarize_model_for_agent
+
+with open("systems_model.json") as f:
+    MODEL = json.load(f)
+
+
+def test_in_place_edit_changes_fingerprint_and_index():
+    model = copy.deepcopy(MODEL)
+    before, nodes = model_fingerprint(model), len(get_graph_index(model))
+    model["Applications"].append({"data": {"name": "NewApp", "owned_by": "DevOps"}})
+    assert model_fingerprint(model) != before
+    assert len(get_graph_index(model)) == nodes + 1
+    assert get_graph_index(model).nodes("NewApp")
+
+
+def test_versioned_model_uses_its_version_until_edited():
+    model = VersionedModel(copy.deepcopy(MODEL), version="sha-1")
+    assert model_fingerprint(model) == "sha-1"
+    assert model == MODEL and json.loads(json.dumps(model)) == MODEL
+    duplicate = copy.deepcopy(model)
+    assert type(duplicate) is dict and model_fingerprint(duplicate) == model_fingerprint(MODEL)
+    model["Extra"] = []
+    assert model_fingerprint(model) not in ("sha-1", model_fingerprint(MODEL))
+
+
+def _in_order(part, whole):
+    # `part` keeps `whole`'s order: every entry is found after the previous one
+    remaining = iter(whole)
+    return all(any(entry is candidate for candidate in remaining) for entry in part)
+
+
+def test_model_within_budget_is_passed_whole():
+    summary = summarize_model_for_agent(MODEL, "chaos")
+    assert {category: len(entries) for category, entries in summary.items()} == \
+        {category: len(entries) for category, entries in MODEL.items() if isinstance(entries, list)}
+
+
+def test_summary_never_exceeds_its_budget_and_keeps_model_order():
+    whole = summarize_model_for_agent(MODEL, token_budget=10 ** 9)
+    for budget in (200, 300, 500, 800, 1000, 1150):
+        summary = summarize_model_for_agent(MODEL, token_budget=budget)
+        assert _serialized_tokens(summary) <= budget
+        assert all(_in_order(summary[category], whole[category]) for category in whole)
+    # Round-robin packing: one large category cannot crowd out the others
+    summary = summarize_model_for_agent(MODEL, token_budget=1000)
+    assert all(summary[category] for category in whole if whole[category])
+
+
+def test_large_category_is_packed_alongside_the_rest():
+    model = copy.deepcopy(MODEL)
+    model["Applications"] += [
+        {"data": {"name": f"Service{i}", "owned_by": "DevOps", "description": "Generated load " * 5}} for i in range(2000)
+    ]
+    summary = summarize_model_for_agent(model, "chaos")
+    assert _serialized_tokens(summary) <= 4000
+    assert all(summary[category] for category, entries in MODEL.items() if isinstance(entries, list) and entries)
+    assert len(summarize_model_for_agent(model, token_budget=10 ** 9, max_per_category=3)["Applications"]) == 3
@@ -0,0 +1,61 @@
+# test_model_router.py
+# Model routing: query classification, context-window fallback and when a pinned route is re-evaluated
+
+import time
+
+from utils.model_router import ModelRouter, classify_query
+
+
+def test_classify_query():
+    assert classify_query("Which nodes are most volatile?") == "lookup"
+    assert classify_query("List the services owned by payments") == "lookup"
+    assert classify_query("Why did the checkout latency cascade into billing?") == "reasoning"
+    assert classify_query("What would happen if the cache cluster went down?") == "reasoning"
+    assert classify_query("Summarize the volatility profile of the data tier") == "analysis"
+    # Long "which ..." questions are not simple lookups
+    assert classify_query("Which " + "very " * 20 + "long question is this") == "analysis"
+
+
+def test_prompt_too_large_for_the_floor_falls_back_to_a_larger_context():
+    router = ModelRouter(stats_path=None)
+    assert router.route("Which nodes are most volatile?", 1000).model == "gpt-3.5-turbo"
+    # 20k tokens exceed gpt-3.5-turbo's window: the next tier that fits is used
+    assert router.route("Which nodes are most volatile?", 20000).model == "gpt-4-turbo"
+    # Nothing at the reasoning floor fits 10k tokens: the long-context model is the fallback
+    assert router.route("Why does this cascade?", 10000).model == "gpt-4-turbo"
+
+
+def test_pin_expires_after_its_ttl():
+    router = ModelRouter(stats_path=None)
+    question = "Summarize the volatility profile of the data tier"
+    router._stats["pinned"]["agent|analysis"] = {"model": "gpt-4", "pinned_at": time.time()}
+    route = router.route(question, 1000, agent="agent")
+    assert (route.model, route.reason) == ("gpt-4", "pinned route")
+
+    router._stats["pinned"]["agent|analysis"]["pinned_at"] -= router.pin_ttl + 1
+    assert router.route(question, 1000, agent="agent").model == "gpt-4-turbo"
+    assert router._stats["pinned"]["agent|analysis"]["model"] == "gpt-4-turbo"
+
+
+def test_pin_moves_when_its_model_breaks_the_latency_slo():
+    router = ModelRouter(stats_path=None)
+    assert router.route("Which nodes are most volatile?", 1000, agent="agent").model == "gpt-3.5-turbo"
+    for _ in range(10):
+        router.record("gpt-3.5-turbo", 40.0)
+    assert router.route("Which nodes are most volatile?", 1000, agent="agent").model == "gpt-4-turbo"
+    assert router._stats["pinned"]["agent|lookup"]["model"] == "gpt-4-turbo"
+
+
+def test_prompt_over_the_cost_ceiling_is_routed_elsewhere_without_moving_the_pin():
+    router = ModelRouter(stats_path=None)
+    question = "Summarize the volatility profile of the data tier"
+    for _ in range(5):
+        router.record("gpt-4-turbo", 0.0, ok=False)
+    assert router.route(question, 1000, agent="agent").model == "gpt-4"
+    for _ in range(5):
+        router.record("gpt-4-turbo", 12.0)
+
+    assert router.route(question, 4000, agent="agent").model == "gpt-4"
+    # 7k prompt tokens on gpt-4 cost more than the analysis ceiling
+    assert router.route(question, 7000, agent="agent").model == "gpt-4-turbo"
+    assert router._stats["pinned"]["agent|analysis"]["model"] == "gpt-4"
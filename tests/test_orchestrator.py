@@ -0,0 +1,32 @@
+# test_orchestrator.py
+# Run All Agents: the caller's time budget and cancellation reach every agent call
+
+import json
+import time
+
+import pytest
+
+from agents.orchestrator import run_all_agents
+from utils.deadline import Deadline
+from utils.llm_providers import FakeProvider
+
+with open("systems_model.json") as f:
+    MODEL = json.load(f)
+
+
+def test_deadline_cuts_off_every_agent_as_partial():
+    report = run_all_agents(MODEL, provider=FakeProvider(latency=3.0), deadline=Deadline.after(0.3),
+                            agents=["Systems Thinking", "Chaos Theory", "Karma"])
+    assert report["elapsed_seconds"] < 1.5
+    assert report["partial"] == ["Systems Thinking", "Chaos Theory", "Karma"]
+    assert report["failed"] == []
+
+
+def test_interrupted_wait_cancels_the_run():
+    def on_wait():
+        raise KeyboardInterrupt
+
+    started = time.perf_counter()
+    with pytest.raises(KeyboardInterrupt):
+        run_all_agents(MODEL, provider=FakeProvider(latency=3.0), on_wait=on_wait)
+    assert time.perf_counter() - started < 1.0
@@ -0,0 +1,111 @@
+# test_prompt_encoding.py
+# Compact prompt encoding of the system model (table layout, aliases, savings) and the cached static prompt prefix
+
+import copy
+import json
+from collections import OrderedDict
+
+import pytest
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils import prompt_encoding
+from utils.model_filter import VersionedModel
+from utils.prompt_encoding import COMPACT_PREAMBLE, cached_prefix, encode_compact, encode_json, encode_model, encoding_report
+from utils.tokens import estimate_message_tokens
+
+with open("systems_model.json") as f:
+    MODEL = json.load(f)
+
+
+def test_compact_tables_share_headers_and_alias_repeated_names():
+    model = {
+        "Applications": [
+            {"data": {"name": "Pay", "owned_by": "PlatformTeam", "tags": []}},
+            {"data": {"name": "Ledger|Core", "owned_by": "PlatformTeam", "tags": ["prod", "eu"]}},
+            {"data": {"hostname": "vm-1", "runs": ["Pay"]}},
+        ],
+        "Teams": [{"data": {"name": "PlatformTeam", "members": ["Ann", "Bo"]}}],
+        "Empty": [],
+    }
+    # "PlatformTeam" is worth an alias; the short, twice-used "Pay" is not
+    lines = encode_compact(model).split("\n")
+    assert lines[0] == COMPACT_PREAMBLE
+    assert lines[1:] == [
+        "Aliases: @1=PlatformTeam",
+        "## Applications",
+        "name|owned_by|tags",
+        "Pay|@1|-",
+        "Ledger/Core|@1|prod;eu",
+        "hostname|runs",
+        "vm-1|Pay",
+        "## Teams",
+        "name|members",
+        "@1|Ann;Bo",
+    ]
+
+
+def test_compact_encoding_keeps_every_entity_and_saves_tokens():
+    text = encode_model(MODEL, "compact")
+    for entries in MODEL.values():
+        for entry in entries if isinstance(entries, list) else []:
+            data = entry.get("data", entry)
+            for field in ("name", "hostname", "id"):
+                if isinstance(data.get(field), str):
+                    assert data[field] in text
+    report = encoding_report(MODEL)
+    assert report["compact_tokens"] < report["json_tokens"] / 2
+    assert encode_model(MODEL, "json") == json.dumps(MODEL, indent=2)
+    assert encode_json({"a": [1, 2]}, "compact") == '{"a":[1,2]}'
+    with pytest.raises(ValueError):
+        encode_model(MODEL, "yaml")
+
+
+def test_agent_prompt_uses_the_requested_encoding():
+    agent = ChaosTheoryAgentLLM()
+    as_json = agent._smart_request(MODEL, {}, "Which nodes are most volatile?", encoding="json")["messages"]
+    compact = agent._smart_request(MODEL, {}, "Which nodes are most volatile?", encoding="compact")["messages"]
+    assert COMPACT_PREAMBLE in "\n".join(m["content"] for m in compact)
+    assert COMPACT_PREAMBLE not in "\n".join(m["content"] for m in as_json)
+    assert estimate_message_tokens(compact) < estimate_message_tokens(as_json)
+    # The question stays last, after the static block
+    assert compact[-1]["content"].rstrip().endswith("Which nodes are most volatile?")
+
+
+def _counting_agent(monkeypatch):
+    monkeypatch.setattr(prompt_encoding, "_prefix_cache", OrderedDict())
+    agent, renders = ChaosTheoryAgentLLM(), []
+    render = agent._static_block
+    monkeypatch.setattr(agent, "_static_block", lambda *args: renders.append(args[-1]) or render(*args))
+    return agent, renders
+
+
+def test_static_prefix_is_rendered_once_per_model_version_and_encoding(monkeypatch):
+    agent, renders = _counting_agent(monkeypatch)
+    first = agent._smart_request(MODEL, {}, "Which nodes are most volatile?")["messages"][1]["content"]
+    second = agent._smart_request(MODEL, {}, "Where are the feedback loops?")["messages"][1]["content"]
+    block = first[:first.index("Recent Changes")]
+    assert second.startswith(block) and COMPACT_PREAMBLE not in block
+    assert len(renders) == 1
+
+    agent._smart_request(MODEL, {}, "Which nodes are most volatile?", encoding="compact")
+    edited = copy.deepcopy(MODEL)
+    edited["Applications"].append({"data": {"name": "NewApp"}})
+    agent._smart_request(edited, {}, "Which nodes are most volatile?")
+    agent._smart_request(MODEL, {"org": "other"}, "Which nodes are most volatile?")
+    assert len(renders) == 4
+
+    # An upload's explicit version is the key: an equal copy under the same version is not re-rendered
+    for _ in range(2):
+        agent._smart_request(VersionedModel(MODEL, version="upload-1"), {}, "Which nodes are most volatile?")
+    assert len(renders) == 5
+
+
+def test_prefix_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(prompt_encoding, "_prefix_cache", OrderedDict())
+    monkeypatch.setattr(prompt_encoding, "PREFIX_CACHE_SIZE", 2)
+    assert cached_prefix("a", lambda: "A") == ("A", True)
+    assert cached_prefix("b", lambda: "B") == ("B", True)
+    assert cached_prefix("a", lambda: "A") == ("A", False)
+    assert cached_prefix("c", lambda: "C") == ("C", True)
+    assert cached_prefix("a", lambda: "A") == ("A", False)
+    assert cached_prefix("b", lambda: "B") == ("B", True)
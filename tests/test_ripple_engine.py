@@ -0,0 +1,133 @@
+# test_ripple_engine.py
+# The CSR graph and frontier ripple against the original deep-copying ripple simulation
+
+import copy
+import json
+import time
+
+import numpy as np
+import pytest
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils import csr_graph
+from utils.csr_graph import CSRGraph
+from utils.deadline import Deadline
+from utils.graph_index import DESCRIPTIVE_FIELDS, GraphIndex, entity_label
+from utils.ripple_engine import propagate
+from utils.ripple_monte_carlo import monte_carlo_ripple
+
+with open("systems_model.json") as f:
+    MODEL = json.load(f)
+
+LABELS = sorted({label for label in GraphIndex(MODEL).labels if label is not None})
+
+
+def _baseline_ripple_step(model, targets):
+    # The original simulate_ripple_step: deep copy, then mark every entity with a field naming a target.
+    # Only change: descriptive fields ("type": "Observability") no longer count as naming an entity
+    updated = copy.deepcopy(model)
+    for section in updated:
+        if isinstance(updated[section], list):
+            for obj in updated[section]:
+                if "data" in obj:
+                    for key, value in list(obj["data"].items()):
+                        if key in DESCRIPTIVE_FIELDS:
+                            continue
+                        if (any(t in value for t in targets) if isinstance(value, list) else value in targets):
+                            obj["data"]["status"] = "ripple_affected"
+    return updated
+
+
+def _affected(model):
+    return {(section, position) for section, entries in model.items() if isinstance(entries, list)
+            for position, obj in enumerate(entries)
+            if isinstance(obj, dict) and obj.get("data", {}).get("status") == "ripple_affected"}
+
+
+def test_csr_graph_matches_graph_index():
+    index, graph = GraphIndex(MODEL), CSRGraph.from_model(MODEL)
+    assert len(graph) == len(index) and graph.edge_count == index.edge_count
+    for node in range(len(index)):
+        assert graph.label(node) == index.labels[node]
+        assert graph.locate(node) == (index.categories[node], index.positions[node])
+        for nested in (True, False):
+            assert sorted(graph.dependents(node, nested=nested)) == sorted(index.dependents(node, nested=nested))
+            assert sorted(graph.dependencies(node, nested=nested)) == sorted(index.dependencies(node, nested=nested))
+
+
+def test_saved_graph_maps_back_identically(tmp_path):
+    graph = CSRGraph.from_model(MODEL)
+    graph.save(str(tmp_path / "model.graph"))
+    loaded = CSRGraph.load(str(tmp_path / "model.graph"))
+    assert isinstance(loaded.rev_sources, np.memmap)
+    assert loaded.directory == str(tmp_path / "model.graph")
+    assert [loaded.label(n) for n in range(len(loaded))] == [graph.label(n) for n in range(len(graph))]
+    assert np.array_equal(loaded.rev_offsets, graph.rev_offsets) and np.array_equal(loaded.rev_sources, graph.rev_sources)
+
+
+def test_label_lookup_uses_the_persisted_index(tmp_path, monkeypatch):
+    index = GraphIndex(MODEL)
+    expected = {}
+    for node, label in enumerate(index.labels):
+        if label is not None:
+            expected.setdefault(label, []).append(node)
+    graph = CSRGraph.from_model(MODEL)
+    graph.save(str(tmp_path / "model.graph"))
+    loaded = CSRGraph.load(str(tmp_path / "model.graph"))
+    assert isinstance(loaded.label_hashes, np.memmap)
+    for label, nodes in expected.items():
+        assert graph.nodes(label) == loaded.nodes(label) == nodes
+    # Every label hashing alike still resolves by comparing the labels themselves
+    monkeypatch.setattr(csr_graph, "_label_hash", lambda encoded: 7)
+    colliding = CSRGraph.from_model(MODEL)
+    assert {label: colliding.nodes(label) for label in expected} == expected
+    assert graph.nodes("No such entity") == graph.nodes(None) == []
+
+
+@pytest.mark.parametrize("target", LABELS)
+def test_ripple_step_matches_baseline(target):
+    event = {"type": "remove_person", "target": target}
+    ripple = ChaosTheoryAgentLLM().simulate_ripple_step(MODEL, event, step=1)
+    exported = ripple.materialize()
+    expected = _baseline_ripple_step(MODEL, [target])
+    assert _affected(exported) == _affected(expected)
+    assert {k: v for k, v in exported.items() if k != "ripple_history"} == \
+        {k: v for k, v in expected.items() if k != "ripple_history"}
+    assert "status" not in json.dumps(MODEL)  # the base model is never written to
+
+
+def test_propagation_steps_match_baseline():
+    # The original multi-step loop: each step removes whatever the previous step newly affected
+    graph = CSRGraph.from_model(MODEL)
+    current, seen, targets = MODEL, set(), ["Jane Doe"]
+    expected = []
+    for _ in range(3):
+        current = _baseline_ripple_step(current, targets)
+        affected = {entity_label(current[s][p]["data"]) for s, p in _affected(current)}
+        targets = sorted(affected - seen)
+        seen |= affected
+        expected.append(targets)
+
+    steps = [sorted(label for label in graph.labels(step.new) if label is not None)
+             for step in propagate(graph, graph.nodes("Jane Doe"), 3)]
+    assert steps == expected[:len(steps)]
+    assert all(not targets for targets in expected[len(steps):])
+
+
+def test_monte_carlo_seed_gives_same_result_in_process_pool():
+    graph = CSRGraph.from_model(MODEL)
+    origin = graph.nodes("Jane Doe")
+    serial = monte_carlo_ripple(graph, origin, trials=1000, seed=7, workers=1)
+    pooled = monte_carlo_ripple(graph, origin, trials=1000, seed=7, workers=2)
+    assert serial.trials == pooled.trials == 1000
+    assert np.array_equal(serial.step_counts, pooled.step_counts)
+    assert np.array_equal(serial.sizes, pooled.sizes)
+
+
+def test_monte_carlo_pool_returns_at_the_deadline():
+    graph = CSRGraph.from_model(MODEL)
+    started = time.perf_counter()
+    impact = monte_carlo_ripple(graph, graph.nodes("Jane Doe"), trials=2000000, seed=7, workers=2,
+                                deadline=Deadline(0.5))
+    assert time.perf_counter() - started < 2.0
+    assert impact.partial["trials_completed"] == impact.trials < 2000000
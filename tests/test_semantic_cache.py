@@ -0,0 +1,82 @@
+# test_semantic_cache.py
+# Reuse of answers to near-identical questions: similarity, guard words, TTL, index bounds and cache order
+
+import json
+import time
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils import semantic_cache
+from utils.semantic_cache import SemanticCache, question_guards
+
+with open("systems_model.json") as f:
+    MODEL = json.load(f)
+
+
+def test_paraphrase_is_reused_within_its_context():
+    cache = SemanticCache(":memory:")
+    cache.put("ctx", "Which nodes are most volatile?", "answer")
+    answer, matched, similarity = cache.lookup("ctx", "which nodes are the most volatile")
+    assert (answer, matched) == ("answer", "Which nodes are most volatile?")
+    assert similarity >= cache.threshold
+    assert cache.lookup("other ctx", "Which nodes are most volatile?") is None
+    assert cache.reused == 1
+
+
+def test_guard_words_and_entities_block_reuse():
+    cache = SemanticCache(":memory:")
+    cache.put("ctx", "Which nodes are most volatile?", "most")
+    cache.put("ctx", "What depends on PayrollApp?", "payroll")
+    assert cache.lookup("ctx", "Which nodes are least volatile?") is None
+    assert cache.lookup("ctx", "Which nodes are not volatile?") is None
+    assert cache.lookup("ctx", "What depends on BillingApp?") is None
+    assert question_guards("Is Jane on vlan20 or PayrollApp, not more?") == {"jane", "vlan20", "payrollapp", "not", "more"}
+
+
+def test_expired_answers_are_not_reused():
+    cache = SemanticCache(":memory:", ttl=0.2)
+    cache.put("ctx", "Which nodes are most volatile?", "answer")
+    assert cache.lookup("ctx", "Which nodes are most volatile?") is not None
+    time.sleep(0.3)
+    assert cache.lookup("ctx", "Which nodes are most volatile?") is None
+    cache.put("ctx", "What depends on PayrollApp?", "payroll")
+    assert [entry[0] for entry in cache._index["ctx"][0]] == ["What depends on PayrollApp?"]
+
+
+def test_index_is_bounded(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "MAX_CONTEXTS", 2)
+    monkeypatch.setattr(semantic_cache, "MAX_ENTRIES_PER_CONTEXT", 3)
+    cache = SemanticCache(":memory:")
+    for i in range(5):
+        cache.put("ctx", f"What does team {i} own?", str(i))
+    entries, vectors = cache._index["ctx"]
+    assert [answer for _, _, answer, _ in entries] == ["2", "3", "4"]
+    assert vectors.shape[0] == 3
+    cache.put("a", "q", "x")
+    cache.put("b", "q", "x")
+    assert list(cache._index) == ["a", "b"]
+    # An evicted context is reloaded from disk, newest answers first
+    assert cache.lookup("ctx", "What does team 4 own?")[0] == "4"
+
+
+def _agent(tmp_path, monkeypatch):
+    monkeypatch.setenv("WISDOM_LLM_CACHE", str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setenv("WISDOM_SEMANTIC_CACHE", str(tmp_path / "semantic_cache.sqlite"))
+    return ChaosTheoryAgentLLM()
+
+
+def test_exact_cache_hit_takes_precedence_over_semantic_reuse(tmp_path, monkeypatch):
+    agent = _agent(tmp_path, monkeypatch)
+    first = agent.smart_prompt(MODEL, {}, "Which nodes are most volatile?")
+    assert agent.smart_prompt(MODEL, {}, "Which nodes are most volatile?") == first
+    assert agent.last_call_info == {"source": "llm"}
+    agent.smart_prompt(MODEL, {}, "which nodes are the most volatile")
+    assert agent.last_call_info["source"] == "semantic_cache"
+
+
+def test_semantic_reuse_is_per_chat_model(tmp_path, monkeypatch):
+    agent = _agent(tmp_path, monkeypatch)
+    agent.smart_prompt(MODEL, {}, "Which nodes are most volatile?", model="gpt-4")
+    agent.smart_prompt(MODEL, {}, "which nodes are the most volatile", model="gpt-3.5-turbo")
+    assert agent.last_call_info == {"source": "llm"}
+    agent.smart_prompt(MODEL, {}, "which nodes are the most volatile", model="gpt-4")
+    assert agent.last_call_info["source"] == "semantic_cache"
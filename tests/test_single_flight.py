@@ -0,0 +1,113 @@
+# test_single_flight.py
+# Coalescing of identical in-flight LLM calls, and that it never puts a user's question behind warm-up
+
+import asyncio
+import threading
+import time
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils.llm_providers import FakeProvider
+from utils.llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from utils.single_flight import SingleFlight
+
+MESSAGES = [{"role": "user", "content": "Which nodes are most volatile and why?"}]
+
+
+def _lead_blocked(flight, key, release, priority):
+    # Start a leader for `key` that only finishes once `release` is set; returns its thread and results
+    started, results = threading.Event(), []
+
+    def call():
+        started.set()
+        release.wait(5)
+        return "leader"
+
+    thread = threading.Thread(target=lambda: results.append(flight.do(key, call, priority=priority)))
+    thread.start()
+    started.wait(5)
+    return thread, results
+
+
+def test_identical_calls_share_one_completion():
+    flight, release = SingleFlight(), threading.Event()
+    thread, results = _lead_blocked(flight, "k", release, PRIORITY_INTERACTIVE)
+    follower = []
+    waiter = threading.Thread(target=lambda: follower.append(flight.do("k", lambda: "own call")))
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    thread.join(5)
+    waiter.join(5)
+    assert results == ["leader"] and follower == ["leader"]
+    assert (flight.leaders, flight.followers) == (1, 1)
+    assert flight.in_flight() == 0
+
+
+def test_interactive_caller_does_not_follow_background_flight():
+    flight, release = SingleFlight(), threading.Event()
+    thread, results = _lead_blocked(flight, "k", release, PRIORITY_BACKGROUND)
+    started = time.perf_counter()
+    assert flight.do("k", lambda: "interactive", priority=PRIORITY_INTERACTIVE) == "interactive"
+    assert time.perf_counter() - started < 1.0
+    release.set()
+    thread.join(5)
+    assert results == ["leader"]
+    assert flight.in_flight() == 0
+
+
+def test_background_caller_joins_interactive_flight():
+    flight, release = SingleFlight(), threading.Event()
+    thread, results = _lead_blocked(flight, "k", release, PRIORITY_INTERACTIVE)
+    follower = []
+    waiter = threading.Thread(target=lambda: follower.append(
+        flight.do("k", lambda: "own call", priority=PRIORITY_BACKGROUND)))
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    thread.join(5)
+    waiter.join(5)
+    assert follower == ["leader"]
+
+
+def test_abandoned_leader_is_taken_over():
+    flight = SingleFlight()
+    future, leader = flight.claim("k")
+    assert leader
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(flight.do("k", lambda: "takeover")))
+    waiter.start()
+    time.sleep(0.05)
+    flight.settle("k", future, error=asyncio.CancelledError())
+    waiter.join(5)
+    assert result == ["takeover"]
+
+
+def test_async_followers_share_one_completion():
+    flight, calls = SingleFlight(), []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        return await asyncio.gather(*[flight.ado("k", call) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["done"] * 5
+    assert len(calls) == 1
+
+
+def test_interactive_agent_call_is_not_delayed_by_background_warmup():
+    # The warm-up agent's provider is slow; an identical interactive question must not wait for it
+    warmup = ChaosTheoryAgentLLM(provider=FakeProvider(latency=3.0))
+    warmup.priority = PRIORITY_BACKGROUND
+    interactive = ChaosTheoryAgentLLM(provider=FakeProvider())
+    background = threading.Thread(target=warmup._chat, args=("gpt-4", MESSAGES), kwargs={"temperature": 0.3})
+    background.start()
+    time.sleep(0.2)
+
+    started = time.perf_counter()
+    reply = interactive._chat("gpt-4", MESSAGES, temperature=0.3)
+    assert time.perf_counter() - started < 1.0
+    assert reply
+    background.join(10)
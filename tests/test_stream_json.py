@@ -0,0 +1,39 @@
+# test_stream_json.py
+# Streamed agent replies: list items surface as soon as they are complete, whatever the chunking
+
+from utils.stream_json import IncrementalJSONParser
+
+REPLY = 'Here you go: {"volatility_nodes": ["PayrollApp", {"name": "vlan20", "links": [1, 2]}], ' \
+        '"note": "a [bracket], and \\"quotes\\"", "feedback_loops": [], "emergent_risks": ["x, y"], ' \
+        '"llm_reasoning": "done"}'
+ITEMS = [("volatility_nodes", "PayrollApp"), ("volatility_nodes", {"name": "vlan20", "links": [1, 2]}),
+         ("emergent_risks", "x, y")]
+
+
+def _feed(chunks, keys=None):
+    parser, items = IncrementalJSONParser(keys), []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return parser, items
+
+
+def test_items_are_the_same_for_any_chunking():
+    for size in (1, 2, 7, 16, len(REPLY)):
+        parser, items = _feed([REPLY[i:i + size] for i in range(0, len(REPLY), size)])
+        assert items == ITEMS
+        assert parser.done
+
+
+def test_item_is_emitted_once_its_delimiter_arrives():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"volatility_nodes": ["Payroll') == []
+    assert parser.feed('App"') == []
+    assert parser.feed(', ') == [("volatility_nodes", "PayrollApp")]
+    assert not parser.done
+
+
+def test_keys_filter_and_unparseable_items():
+    _, items = _feed([REPLY], keys=["emergent_risks"])
+    assert items == [("emergent_risks", "x, y")]
+    _, items = _feed(['{"fragile_paths": [unquoted path, 3]}'])
+    assert items == [("fragile_paths", "unquoted path"), ("fragile_paths", 3)]
@@ -0,0 +1,51 @@
+# test_structured_output.py
+# Schema checks, JSON extraction and repair turns for agent replies
+
+import json
+
+from utils.structured_output import (
+    MAX_REPLY_CHARS, batch_schema, check_reply, coerce, extract_json, repair_messages, response_format_for,
+    result_schema, validate
+)
+
+SCHEMA = result_schema(["volatility_nodes", "feedback_loops"])
+
+
+def test_extract_json_skips_prose_fences_and_broken_candidates():
+    assert extract_json('Sure!\n```json\n{"a": [1, {"b": 2}]}\n```') == ({"a": [1, {"b": 2}]}, None)
+    assert extract_json('{not json} then {"a": 1}') == ({"a": 1}, None)
+    assert extract_json("no object here") == (None, "no JSON object found")
+    assert extract_json(None) == (None, "empty reply")
+    assert extract_json("{" * (MAX_REPLY_CHARS + 1))[1].startswith("reply longer than")
+    obj, error = extract_json('{"a": 1,')
+    assert obj is None and error.startswith("invalid JSON")
+
+
+def test_validate_and_coerce():
+    good = {"volatility_nodes": [], "feedback_loops": ["x"], "llm_reasoning": "why"}
+    assert validate(good, SCHEMA) == []
+    assert validate([], SCHEMA) == ["the reply must be a single JSON object"]
+    errors = validate({"volatility_nodes": "PayrollApp", "llm_reasoning": "why"}, SCHEMA)
+    assert errors == ['"volatility_nodes" must be a JSON array', 'missing required key "feedback_loops"']
+    fixed = coerce({"volatility_nodes": "PayrollApp", "llm_reasoning": {"k": 1}}, SCHEMA)
+    assert fixed == {"volatility_nodes": ["PayrollApp"], "feedback_loops": [], "llm_reasoning": '{"k": 1}'}
+    assert validate(fixed, SCHEMA) == []
+
+
+def test_check_reply_and_repair_turn():
+    raw = 'Result: {"volatility_nodes": []}'
+    obj, errors = check_reply(raw, SCHEMA)
+    assert obj == {"volatility_nodes": []}
+    assert errors == ['missing required key "feedback_loops"', 'missing required key "llm_reasoning"']
+    messages = repair_messages([{"role": "user", "content": "q"}], raw, errors, SCHEMA)
+    assert messages[1] == {"role": "assistant", "content": raw}
+    assert '"feedback_loops" (array)' in messages[2]["content"] and errors[0] in messages[2]["content"]
+
+
+def test_batch_schema_and_response_formats():
+    schema = batch_schema(SCHEMA)
+    reply = {"answers": [{"index": 1, "result": {"volatility_nodes": [], "feedback_loops": [], "llm_reasoning": ""}}]}
+    assert check_reply(json.dumps(reply), schema) == (reply, [])
+    assert response_format_for("gpt-4o-mini", SCHEMA)["type"] == "json_schema"
+    assert response_format_for("gpt-4-turbo", SCHEMA) == {"type": "json_object"}
+    assert response_format_for("gpt-4", SCHEMA) is None
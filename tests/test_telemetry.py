@@ -0,0 +1,65 @@
+# test_telemetry.py
+# LLM call metrics: OpenMetrics exposition, what an agent call records, and the file and HTTP exporters
+
+import json
+import socket
+import urllib.request
+
+from agents.chaos_theory_agent_llm import ChaosTheoryAgentLLM
+from utils import telemetry
+from utils.telemetry import CONTENT_TYPE, Telemetry, start_metrics_server
+
+with open("systems_model.json") as f:
+    MODEL = json.load(f)
+
+
+def test_openmetrics_exposition():
+    metrics = Telemetry()
+    metrics.record_call('Agent "X"', "gpt-4", 0.3, prompt_tokens=120, completion_tokens=40)
+    metrics.record_call('Agent "X"', "gpt-4", 3.0, ok=False)
+    lines = metrics.render().split("\n")
+    labels = 'agent="Agent \\"X\\"",model="gpt-4"'
+    assert f'wisdom_llm_calls_total{{{labels},outcome="ok"}} 1' in lines
+    assert f'wisdom_llm_calls_total{{{labels},outcome="error"}} 1' in lines
+    assert f"wisdom_llm_prompt_tokens_total{{{labels}}} 120" in lines
+    assert "# UNIT wisdom_llm_upstream_latency_seconds seconds" in lines
+    # Histogram buckets are cumulative
+    assert f'wisdom_llm_upstream_latency_seconds_bucket{{{labels},le="0.25"}} 0' in lines
+    assert f'wisdom_llm_upstream_latency_seconds_bucket{{{labels},le="0.5"}} 1' in lines
+    assert f'wisdom_llm_upstream_latency_seconds_bucket{{{labels},le="5.0"}} 2' in lines
+    assert f'wisdom_llm_upstream_latency_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"wisdom_llm_upstream_latency_seconds_sum{{{labels}}} 3.3" in lines
+    assert lines[-2:] == ["# EOF", ""]
+
+
+def test_agent_call_is_recorded(monkeypatch):
+    monkeypatch.setattr(telemetry, "_telemetry", Telemetry())
+    agent = ChaosTheoryAgentLLM()
+    agent.smart_prompt(MODEL, {}, "Which nodes are most volatile?")
+    metrics = telemetry.get_telemetry()
+    assert metrics.calls._values == {(agent.role, "gpt-4", "ok"): 1}
+    assert metrics.parses._values == {(agent.role, "ok"): 1}
+    assert metrics.prompt_tokens._values[(agent.role, "gpt-4")] > 0
+    assert list(metrics.queue_wait._series) == list(metrics.latency._series) == [(agent.role, "gpt-4")]
+
+
+def test_file_and_http_exporters(tmp_path, monkeypatch):
+    metrics = Telemetry()
+    metrics.record_parse("agent", "repaired")
+    monkeypatch.setattr(telemetry, "_telemetry", metrics)
+    path = tmp_path / "metrics" / "wisdom.prom"
+    metrics.write_file(str(path))
+    assert path.read_text() == metrics.render()
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    monkeypatch.setattr(telemetry, "_server", None)
+    server = start_metrics_server(port)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["Content-Type"] == CONTENT_TYPE
+            assert 'wisdom_llm_reply_parses_total{agent="agent",result="repaired"} 1' in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -2,12 +2,15 @@
 # Optional AI enrichment module for Wisdom Layer agents
 
 import os
-import openai
 import hashlib
 import json
+import time
 
-# Optional: set this via environment variable
-openai.api_key = os.getenv("")
+from utils.llm_providers import get_provider
+from utils.tokens import estimate_message_tokens
+from utils.llm_scheduler import get_scheduler
+from utils.model_router import get_router
+from utils.telemetry import get_telemetry
 
 CACHE_FILE = "data/ai_cache.json"
 
@@ -24,34 +27,57 @@ def save_cache(cache):
 def hash_prompt(prompt):
     return hashlib.sha256(prompt.encode()).hexdigest()
 
-def get_intention_from_ai(text, cache_enabled=True):
+def get_intention_from_ai(text, cache_enabled=True, model=None):
     prompt = f"""
     Classify the following technical message by INTENTION:
     Message: "{text}"
     Choose one: Positive, Neutral, or Negative
     Answer:
     """
+    messages = [
+        {"role": "system", "content": "You are an expert DevOps system analyst."},
+        {"role": "user", "content": prompt}
+    ]
+
+    router = get_router()
+    if model is None:
+        model = router.route(text, estimate_message_tokens(messages), "lookup").model if router else "gpt-3.5-turbo"
+    telemetry = get_telemetry()
+
     key = hash_prompt(prompt)
     cache = load_cache() if cache_enabled else {}
 
+    if cache_enabled:
+        telemetry.record_cache("ai_utils", model, hit=key in cache)
     if key in cache:
         return cache[key]
 
+    def call():
+        started = time.perf_counter()
+        try:
+            completion = get_provider().complete(model, messages, max_tokens=10, temperature=0.2)
+        except Exception:
+            latency = time.perf_counter() - started
+            if router is not None:
+                router.record(model, latency, ok=False)
+            telemetry.record_call("ai_utils", model, latency, ok=False)
+            raise
+        latency = time.perf_counter() - started
+        if router is not None:
+            router.record(model, latency)
+        telemetry.record_call("ai_utils", model, latency, completion.prompt_tokens, completion.completion_tokens)
+        return completion
+
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an expert DevOps system analyst."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=10,
-            temperature=0.2,
-        )
-        reply = response.choices[0].message["content"].strip()
+        response = get_scheduler().run("ai_utils", model, messages, call, max_tokens=10)
+        reply = response.text
         intention = reply.split()[0].capitalize()
 
         if intention not in ["Positive", "Neutral", "Negative"]:
+            telemetry.record_parse("ai_utils", "failed")
             intention = "Neutral"
+        else:
+            telemetry.record_parse("ai_utils", "ok")
 
         if cache_enabled:
             cache[key] = intention
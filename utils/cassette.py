@@ -0,0 +1,138 @@
+# cassette.py
+# Record/replay layer for LLM exchanges, for profiling and benchmarking without GPT-4
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+from utils.ai_utils import hash_prompt
+from utils.llm_cache import cache_key
+from utils.llm_providers import Completion, LLMProvider
+
+
+class CassetteMissError(LookupError):
+    """Replay was asked for an exchange that is not on the cassette."""
+
+
+class CassetteProvider(LLMProvider):
+    """
+    Wraps another provider and records every exchange to a JSONL cassette, or
+    serves exchanges back from one.
+
+    In "record" mode each call goes to `inner` and is appended to `path` with its
+    prompt hash, parameters, output, token usage and measured latency. In "replay"
+    mode calls never leave the process: the recorded output is returned after the
+    recorded latency multiplied by `latency_scale` (0 replays instantly). Repeated
+    recordings of the same request are replayed in the order they were captured.
+    A request whose model differs from the recording (the router picked another one)
+    is served the exchange recorded for the same messages and temperature.
+
+    Disable the completion cache (WISDOM_LLM_CACHE=off) while recording, otherwise
+    cache hits never reach the provider and are missing from the cassette.
+    """
+
+    name = "cassette"
+
+    def __init__(self, path, mode="replay", inner=None, latency_scale=1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == "record" and inner is None:
+            raise ValueError("Recording needs an inner provider to forward calls to")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._entries = {}
+        # The same exchanges by prompt alone, for replays whose model was routed differently from the recording
+        self._by_prompt = {}
+        self._cursor = {}
+        if mode == "replay":
+            self._load()
+        elif os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+                    self._by_prompt.setdefault(self._prompt_key(entry["prompt_hash"], entry["params"]), []).append(entry)
+
+    @staticmethod
+    def _prompt_key(prompt_hash, params):
+        return f"{prompt_hash}:{params.get('temperature')}"
+
+    @staticmethod
+    def _key(model, messages, params):
+        return cache_key(model, messages, params.get("temperature"))
+
+    def _record(self, model, messages, params, completion, latency):
+        entry = {
+            "key": self._key(model, messages, params),
+            "prompt_hash": hash_prompt(json.dumps(messages)),
+            "model": model,
+            "params": {k: v for k, v in params.items() if k != "timeout" and isinstance(v, (str, int, float, bool, type(None)))},
+            "output": completion.text,
+            "prompt_tokens": completion.prompt_tokens,
+            "completion_tokens": completion.completion_tokens,
+            "latency": round(latency, 4),
+            "recorded_at": time.time(),
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _lookup(self, model, messages, params):
+        key = self._key(model, messages, params)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                key = self._prompt_key(hash_prompt(json.dumps(messages)), params)
+                entries = self._by_prompt.get(key)
+            if not entries:
+                raise CassetteMissError(f"No recorded exchange for {model} prompt {key[:12]}")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            entry = entries[index % len(entries)]
+        completion = Completion(entry["output"], model, entry.get("prompt_tokens", 0), entry.get("completion_tokens", 0))
+        return completion, entry.get("latency", 0.0) * self.latency_scale
+
+    def complete(self, model, messages, **params):
+        if self.mode == "replay":
+            completion, delay = self._lookup(model, messages, params)
+            time.sleep(delay)
+            return completion
+        started = time.perf_counter()
+        completion = self.inner.complete(model, messages, **params)
+        self._record(model, messages, params, completion, time.perf_counter() - started)
+        return completion
+
+    async def acomplete(self, model, messages, **params):
+        if self.mode == "replay":
+            completion, delay = self._lookup(model, messages, params)
+            await asyncio.sleep(delay)
+            return completion
+        started = time.perf_counter()
+        completion = await self.inner.acomplete(model, messages, **params)
+        self._record(model, messages, params, completion, time.perf_counter() - started)
+        return completion
+
+    def stream(self, model, messages, **params):
+        if self.mode == "replay":
+            completion, delay = self._lookup(model, messages, params)
+            chunks = [completion.text[i:i + 16] for i in range(0, len(completion.text), 16)] or [""]
+            for chunk in chunks:
+                time.sleep(delay / len(chunks))
+                yield chunk
+            return
+        started = time.perf_counter()
+        parts = []
+        for chunk in self.inner.stream(model, messages, **params):
+            parts.append(chunk)
+            yield chunk
+        text = "".join(parts).strip()
+        completion = Completion(text, model)
+        self._record(model, messages, params, completion, time.perf_counter() - started)
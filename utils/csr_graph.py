@@ -0,0 +1,287 @@
+# csr_graph.py
+# Compressed-sparse-row dependency graph with memory-mapped sidecar persistence, for very large estates
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.graph_index import GRAPH_CACHE_SIZE, GraphIndex
+from utils.model_filter import model_fingerprint
+
+DEFAULT_GRAPH_CACHE_DIR = "data/graph_cache"   # WISDOM_GRAPH_CACHE: sidecars of uploaded models, by content hash
+SIDECAR_SUFFIX = ".graph"
+FORMAT_VERSION = 2
+
+ARRAYS = (
+    "fwd_offsets", "fwd_targets", "fwd_types",
+    "rev_offsets", "rev_sources", "rev_types",
+    "node_categories", "node_positions", "label_offsets", "label_bytes",
+    "label_hashes", "label_nodes",
+)
+
+_csr_lock = threading.Lock()
+_csr_cache = OrderedDict()
+
+
+def _csr(keys, values, types, node_count):
+    # Group edges by `keys` (stable, so each row keeps model order) into offsets/values/types arrays
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=node_count), out=offsets[1:])
+    return offsets, values[order], types[order]
+
+
+def _label_hash(encoded):
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "little")
+
+
+def _edge_type_dtype(count):
+    return np.uint8 if count <= np.iinfo(np.uint8).max + 1 else np.uint16
+
+
+class CSRGraph:
+    """
+    The graph index as flat NumPy arrays: forward and reverse adjacency in CSR form
+    (int64 row offsets, int32 neighbour IDs, uint8 edge-type IDs), plus each node's
+    category, position within its category and UTF-8 label. That is about ten bytes
+    per edge in total, and loading a saved graph maps the files instead of reading them.
+    Named nodes are also kept sorted by a 64-bit label hash, so a label lookup is a
+    binary search over the mapped arrays rather than a map rebuilt per instance.
+
+    Row u of the forward arrays lists the entities u refers to; row v of the
+    reverse arrays lists the entities that refer to v.
+    """
+
+    def __init__(self, arrays, meta):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.edge_types = meta["edge_types"]
+        self.category_names = meta["categories"]
+        self._unnamed = set(meta["unnamed"])
+        # Sidecar directory holding these arrays, once saved or loaded (other processes map it from there)
+        self.directory = None
+
+    @classmethod
+    def from_index(cls, index):
+        node_count = len(index)
+        edge_count = index.edge_count
+        sources = np.empty(edge_count, dtype=np.int32)
+        targets = np.empty(edge_count, dtype=np.int32)
+        types = np.empty(edge_count, dtype=_edge_type_dtype(len(index.edge_types)))
+        i = 0
+        for source, edges in enumerate(index.forward):
+            for target, type_id in edges:
+                sources[i], targets[i], types[i] = source, target, type_id
+                i += 1
+
+        arrays = {}
+        arrays["fwd_offsets"], arrays["fwd_targets"], arrays["fwd_types"] = _csr(sources, targets, types, node_count)
+        arrays["rev_offsets"], arrays["rev_sources"], arrays["rev_types"] = _csr(targets, sources, types, node_count)
+
+        categories = list(index.by_category)
+        category_ids = {category: i for i, category in enumerate(categories)}
+        arrays["node_categories"] = np.array([category_ids[c] for c in index.categories], dtype=np.uint16)
+        arrays["node_positions"] = np.array(index.positions, dtype=np.int32)
+
+        encoded = [(label or "").encode("utf-8") for label in index.labels]
+        arrays["label_offsets"] = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum([len(label) for label in encoded], out=arrays["label_offsets"][1:])
+        arrays["label_bytes"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        named = np.array([n for n, label in enumerate(index.labels) if label is not None], dtype=np.int32)
+        hashes = np.array([_label_hash(encoded[n]) for n in named], dtype=np.uint64)
+        order = np.argsort(hashes, kind="stable")
+        arrays["label_hashes"], arrays["label_nodes"] = hashes[order], named[order]
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "nodes": node_count,
+            "edges": edge_count,
+            "edge_types": list(index.edge_types),
+            "categories": categories,
+            "unnamed": [n for n, label in enumerate(index.labels) if label is None],
+        }
+        return cls(arrays, meta)
+
+    @classmethod
+    def from_model(cls, system_model):
+        return cls.from_index(GraphIndex(system_model))
+
+    # --- persistence ---
+
+    def save(self, directory):
+        """Write the arrays as .npy files plus meta.json, replacing `directory` atomically."""
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = f"{directory}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(tmp_dir)
+        try:
+            for name in ARRAYS:
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(getattr(self, name)))
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump(self.meta, f)
+            old_dir = None
+            if os.path.exists(directory):
+                old_dir = f"{directory}.old-{uuid.uuid4().hex}"
+                os.replace(directory, old_dir)
+            os.replace(tmp_dir, directory)
+            if old_dir:
+                shutil.rmtree(old_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.directory = directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Map a saved graph back in; raises OSError/ValueError if it is missing or from another format."""
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported graph format {meta.get('version')} in {directory}")
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in ARRAYS}
+        graph = cls(arrays, meta)
+        graph.directory = directory
+        return graph
+
+    # --- queries ---
+
+    def __len__(self):
+        return self.meta["nodes"]
+
+    @property
+    def edge_count(self):
+        return self.meta["edges"]
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    def label(self, node):
+        if node in self._unnamed:
+            return None
+        start, end = self.label_offsets[node], self.label_offsets[node + 1]
+        return bytes(self.label_bytes[start:end]).decode("utf-8")
+
+    def labels(self, nodes=None):
+        nodes = range(len(self)) if nodes is None else nodes
+        return [self.label(int(n)) for n in nodes]
+
+    def nodes(self, label):
+        # Equal hashes are adjacent and in node order; comparing the labels rules out collisions
+        if not isinstance(label, str):
+            return []
+        key = np.uint64(_label_hash(label.encode("utf-8")))
+        start = int(np.searchsorted(self.label_hashes, key, side="left"))
+        end = int(np.searchsorted(self.label_hashes, key, side="right"))
+        return [int(n) for n in self.label_nodes[start:end] if self.label(int(n)) == label]
+
+    def nodes_in(self, category):
+        if category not in self.category_names:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.node_categories == self.category_names.index(category))
+
+    def labels_in(self, category):
+        return [label for label in self.labels(self.nodes_in(category)) if label is not None]
+
+    def locate(self, node):
+        """(category, position) of `node`'s entry in the model."""
+        return self.category_names[self.node_categories[node]], int(self.node_positions[node])
+
+    def type_mask(self, edge_types=None, nested=True):
+        """Boolean mask over edge-type IDs selecting `edge_types` (all by default), optionally only top-level fields."""
+        return np.array([(edge_types is None or t in edge_types) and (nested or "." not in t) for t in self.edge_types],
+                        dtype=bool)
+
+    def dependencies(self, node, edge_types=None, nested=True):
+        start, end = self.fwd_offsets[node], self.fwd_offsets[node + 1]
+        return self.fwd_targets[start:end][self.type_mask(edge_types, nested)[self.fwd_types[start:end]]]
+
+    def dependents(self, node, edge_types=None, nested=True):
+        start, end = self.rev_offsets[node], self.rev_offsets[node + 1]
+        return self.rev_sources[start:end][self.type_mask(edge_types, nested)[self.rev_types[start:end]]]
+
+    def referrers(self, labels, edge_types=None, nested=True):
+        """Sorted IDs of every node referring to an entity named in `labels`."""
+        nodes = [n for label in labels for n in self.nodes(label)]
+        if not nodes:
+            return np.zeros(0, dtype=np.int32)
+        return np.unique(np.concatenate([self.dependents(n, edge_types, nested) for n in nodes]))
+
+    def degrees(self):
+        """In-degree plus out-degree of every node."""
+        return np.diff(self.fwd_offsets) + np.diff(self.rev_offsets)
+
+
+def get_csr_graph(system_model):
+    """CSR graph of an in-memory model, built once per model version."""
+    key = model_fingerprint(system_model)
+    with _csr_lock:
+        if key in _csr_cache:
+            _csr_cache.move_to_end(key)
+            return _csr_cache[key]
+    graph = CSRGraph.from_model(system_model)
+    with _csr_lock:
+        _csr_cache[key] = graph
+        while len(_csr_cache) > GRAPH_CACHE_SIZE:
+            _csr_cache.popitem(last=False)
+    return graph
+
+
+def sidecar_path(model_path):
+    """systems_model.json -> systems_model.graph/"""
+    return os.path.splitext(model_path)[0] + SIDECAR_SUFFIX
+
+
+def load_graph(model_path, sidecar=None):
+    """
+    The CSR graph of the model file at `model_path`, from its sidecar directory when
+    that was built from the same file (size and mtime), else parsed, built and saved.
+    """
+    sidecar = sidecar or sidecar_path(model_path)
+    stat = os.stat(model_path)
+    source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    try:
+        graph = CSRGraph.load(sidecar)
+        if graph.meta.get("source") == source:
+            return graph
+    except (OSError, ValueError, KeyError):
+        pass
+    with open(model_path, "r", encoding="utf-8") as f:
+        graph = CSRGraph.from_model(json.load(f))
+    graph.meta["source"] = source
+    _save_quietly(graph, sidecar)
+    return graph
+
+
+def load_graph_bytes(raw, system_model=None, cache_dir=None):
+    """
+    CSR graph of an uploaded model file's bytes, cached under the SHA-256 of the
+    content so reruns and later sessions map it instead of re-resolving references.
+    Pass the already parsed `system_model`, if there is one, to skip re-parsing on a miss.
+    """
+    cache_dir = cache_dir or os.getenv("WISDOM_GRAPH_CACHE", DEFAULT_GRAPH_CACHE_DIR)
+    sidecar = os.path.join(cache_dir, hashlib.sha256(raw).hexdigest() + SIDECAR_SUFFIX)
+    try:
+        return CSRGraph.load(sidecar)
+    except (OSError, ValueError, KeyError):
+        pass
+    graph = CSRGraph.from_model(system_model if system_model is not None else json.loads(raw))
+    _save_quietly(graph, sidecar)
+    return graph
+
+
+def _save_quietly(graph, directory):
+    # A read-only checkout or full disk only costs the next rerun a rebuild
+    try:
+        graph.save(directory)
+    except OSError as e:
+        print(f"[GRAPH CACHE ERROR] {e}")
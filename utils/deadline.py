@@ -0,0 +1,80 @@
+# deadline.py
+# End-to-end time budgets and cancellation for agent calls and ripple simulations
+
+import threading
+import time
+
+
+class DeadlineExceeded(TimeoutError):
+    """The caller's time budget ran out (or it cancelled) before the work finished."""
+
+
+class CancellationToken:
+    """Thread-safe flag a caller (e.g. a dashboard button) sets to abort work in progress."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class Deadline:
+    """
+    A point in time by which work must finish, optionally tied to a CancellationToken.
+
+    Pass one instance down a call chain; each layer clamps its own timeouts to
+    remaining() and stops early once expired.
+
+    Args:
+        seconds (float): Budget from now; None means no time limit (cancellation only).
+        token (CancellationToken): Expires the deadline as soon as it is cancelled.
+    """
+
+    def __init__(self, seconds=None, token=None):
+        self.at = None if seconds is None else time.monotonic() + seconds
+        self.token = token
+
+    @classmethod
+    def after(cls, seconds, token=None):
+        return cls(seconds, token)
+
+    def remaining(self):
+        """Seconds left (never negative), or None when there is no time limit."""
+        if self.token is not None and self.token.cancelled:
+            return 0.0
+        if self.at is None:
+            return None
+        return max(0.0, self.at - time.monotonic())
+
+    @property
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    @property
+    def reason(self):
+        """Why work must stop ("cancelled" or "deadline exceeded"), or None while time remains."""
+        if self.token is not None and self.token.cancelled:
+            return "cancelled"
+        return "deadline exceeded" if self.expired else None
+
+    def check(self, what="operation"):
+        if self.expired:
+            raise DeadlineExceeded(f"{what} {self.reason}")
+
+    def timeout(self, default=None):
+        """`default` clamped to the time remaining."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+
+def remaining_timeout(deadline, default=None):
+    """Deadline-aware timeout that also accepts deadline=None."""
+    return default if deadline is None else deadline.timeout(default)
@@ -0,0 +1,168 @@
+# graph_index.py
+# Typed dependency graph resolved from the string references inside a system model
+
+import threading
+from collections import OrderedDict
+
+from utils.model_filter import model_fingerprint
+from utils.prompt_encoding import IDENTIFIER_FIELDS
+
+# Fields that classify an entity rather than point at another one ("type": "Observability" is not a dependency)
+DESCRIPTIVE_FIELDS = frozenset((
+    "type", "status", "tags", "timestamp", "environment", "environments", "role", "roles",
+))
+
+# Top-level lists that record simulation output rather than entities
+NON_ENTITY_SECTIONS = frozenset(("ripple_history",))
+
+# Indexes kept per model version (fingerprint)
+GRAPH_CACHE_SIZE = 16
+
+_graph_lock = threading.Lock()
+_graph_cache = OrderedDict()
+
+
+def entity_label(data):
+    """The name an entity is referred to by elsewhere in the model (name, hostname, id or vlan_name)."""
+    for field in IDENTIFIER_FIELDS:
+        if data.get(field):
+            return data[field]
+    return None
+
+
+def _references(data):
+    # (edge type, referenced string) pairs: top-level fields, plus one level of nesting as "key.sub_key"
+    for key, value in data.items():
+        if key in IDENTIFIER_FIELDS or key in DESCRIPTIVE_FIELDS:
+            continue
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                for ref in _strings(sub_value):
+                    yield f"{key}.{sub_key}", ref
+        else:
+            for ref in _strings(value):
+                yield key, ref
+
+
+def _strings(value):
+    if isinstance(value, str):
+        return (value,)
+    if isinstance(value, list):
+        return [v for v in value if isinstance(v, str)]
+    return ()
+
+
+class GraphIndex:
+    """
+    Entities of a system model as integer node IDs, with the relationships the model
+    only states implicitly (runs, deployed_on, owned_by, members, subnet, related_to,
+    relationships.monitors_applications, responsibilities.*, ...) resolved into typed
+    forward and reverse adjacency lists.
+
+    An edge u -> v of type t means entity u names entity v in field t; reverse[v]
+    lists every (u, t) that depends on v. Strings that name no entity (tags, IPs,
+    tools outside the model) are not edges. `entities` are the model's own data
+    dicts, shared by every caller of the same model version: treat them as read-only.
+    """
+
+    def __init__(self, system_model):
+        self.labels = []        # node -> label (None for unnamed entities)
+        self.categories = []    # node -> top-level category
+        self.positions = []     # node -> index of the entry within its category
+        self.entities = []      # node -> entity data dict
+        self.by_label = {}      # label -> [nodes]; labels need not be unique
+        self.by_category = {}   # category -> [nodes] in model order
+        self.edge_types = []    # type id -> field path
+        self.forward = []       # node -> [(target, type id)]
+        self.reverse = []       # node -> [(source, type id)]
+        self._type_ids = {}
+
+        for category, entries in system_model.items():
+            if not isinstance(entries, list) or category in NON_ENTITY_SECTIONS:
+                continue
+            nodes = self.by_category.setdefault(category, [])
+            for position, entry in enumerate(entries):
+                data = entry.get("data", entry) if isinstance(entry, dict) else entry
+                if not isinstance(data, dict):
+                    continue
+                node = len(self.labels)
+                label = entity_label(data)
+                self.labels.append(label)
+                self.categories.append(category)
+                self.positions.append(position)
+                self.entities.append(data)
+                nodes.append(node)
+                if label is not None:
+                    self.by_label.setdefault(label, []).append(node)
+
+        self.forward = [[] for _ in self.labels]
+        self.reverse = [[] for _ in self.labels]
+        for source, data in enumerate(self.entities):
+            for edge_type, ref in _references(data):
+                for target in self.by_label.get(ref, ()):
+                    if target != source:
+                        type_id = self._type_id(edge_type)
+                        self.forward[source].append((target, type_id))
+                        self.reverse[target].append((source, type_id))
+
+    def _type_id(self, edge_type):
+        if edge_type not in self._type_ids:
+            self._type_ids[edge_type] = len(self.edge_types)
+            self.edge_types.append(edge_type)
+        return self._type_ids[edge_type]
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def edge_count(self):
+        return sum(len(edges) for edges in self.forward)
+
+    def nodes(self, label):
+        return self.by_label.get(label, [])
+
+    def labels_in(self, category):
+        return [self.labels[n] for n in self.by_category.get(category, []) if self.labels[n] is not None]
+
+    def _types(self, edge_types, nested):
+        if edge_types is None and nested:
+            return None
+        return {i for i, t in enumerate(self.edge_types)
+                if (edge_types is None or t in edge_types) and (nested or "." not in t)}
+
+    def dependencies(self, node, edge_types=None, nested=True):
+        """Nodes `node` refers to."""
+        types = self._types(edge_types, nested)
+        return [t for t, k in self.forward[node] if types is None or k in types]
+
+    def dependents(self, node, edge_types=None, nested=True):
+        """Nodes that refer to `node`."""
+        types = self._types(edge_types, nested)
+        return [s for s, k in self.reverse[node] if types is None or k in types]
+
+    def referrers(self, labels, edge_types=None, nested=True):
+        """Every node referring to an entity named in `labels`, in node order."""
+        types = self._types(edge_types, nested)
+        found = set()
+        for label in labels:
+            for node in self.by_label.get(label, ()):
+                found.update(s for s, k in self.reverse[node] if types is None or k in types)
+        return sorted(found)
+
+    def degree(self, node):
+        return len(self.forward[node]) + len(self.reverse[node])
+
+
+def get_graph_index(system_model):
+    """Index of `system_model`, built once per model version and shared across agents and reruns."""
+    key = model_fingerprint(system_model)
+    with _graph_lock:
+        if key in _graph_cache:
+            _graph_cache.move_to_end(key)
+            return _graph_cache[key]
+    index = GraphIndex(system_model)
+    with _graph_lock:
+        _graph_cache[key] = index
+        while len(_graph_cache) > GRAPH_CACHE_SIZE:
+            _graph_cache.popitem(last=False)
+    return index
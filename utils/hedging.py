@@ -0,0 +1,248 @@
+# hedging.py
+# Hedged LLM requests: a second identical call once the first runs past a latency percentile
+
+import asyncio
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import numpy as np
+
+from utils.telemetry import get_telemetry
+
+DEFAULT_PERCENTILE = 95.0   # WISDOM_HEDGE_PERCENTILE
+DEFAULT_BUDGET = 0.1        # WISDOM_HEDGE_BUDGET: hedges allowed per primary request, per agent
+MIN_SAMPLES = 20            # no hedging until the model's latency distribution is known
+LATENCY_WINDOW = 200
+
+# Threads racing hedgeable primaries; when all are busy the primary runs unhedged on the caller's thread
+PRIMARY_WORKERS = 32
+
+# Runs the backup copies only; primaries never queue here
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="wisdom-hedge")
+
+
+class HedgeRace:
+    """
+    Shared by the copies of one request. The first copy to succeed is the request's own
+    outcome; a copy finishing after that lost the race and is recorded only as a hedge.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._won = False
+
+    def finish(self, ok):
+        """False when this copy lost the race (another one has already succeeded)."""
+        with self._lock:
+            if self._won:
+                return False
+            self._won = ok
+            return True
+
+
+class _PrimaryWorkers:
+    """Reusable threads that start a call at once or not at all: a primary is never queued."""
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle = []
+        self._started = 0
+
+    def try_submit(self, call):
+        """Future of `call()` running on an idle worker, or None when every worker is busy."""
+        with self._lock:
+            if self._idle:
+                inbox = self._idle.pop()
+            elif self._started < self.size:
+                self._started += 1
+                inbox = queue.SimpleQueue()
+                threading.Thread(target=self._serve, args=(inbox,), name="wisdom-hedge-primary", daemon=True).start()
+            else:
+                return None
+        future = Future()
+        inbox.put((future, call))
+        return future
+
+    def _serve(self, inbox):
+        while True:
+            future, call = inbox.get()
+            _run_into(future, call)
+            with self._lock:
+                self._idle.append(inbox)
+
+
+_primaries = _PrimaryWorkers(PRIMARY_WORKERS)
+
+
+class Hedger:
+    """
+    Sends a backup copy of a request when the original has been outstanding longer
+    than the `percentile` of recently observed latencies for its model, and returns
+    whichever finishes first. The other copy is cancelled (async) or its result
+    discarded (blocking clients cannot abort an in-flight HTTP call).
+
+    Each agent may hedge at most `budget` times per primary request, so hedging
+    adds at most that fraction to upstream spend. Callers hedge only the upstream call
+    itself, after rate-limit admission, so queue wait never counts toward the delay; the
+    backup is sent only if `admit()` lets it through the rate limits without waiting.
+    Streams hedge their first-token wait, against first-token latencies (`first_token`).
+    """
+
+    def __init__(self, percentile=DEFAULT_PERCENTILE, budget=DEFAULT_BUDGET,
+                 min_samples=MIN_SAMPLES, window=LATENCY_WINDOW):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies = {}
+        # agent -> {"requests", "hedges", "hedge_wins"}
+        self.stats = {}
+
+    def observe(self, model, latency, first_token=False):
+        with self._lock:
+            self._latencies.setdefault((model, first_token), deque(maxlen=self.window)).append(latency)
+
+    def delay(self, model, first_token=False):
+        """Seconds to wait before hedging a call to `model`, or None while there is too little history."""
+        with self._lock:
+            samples = list(self._latencies.get((model, first_token), ()))
+        if len(samples) < self.min_samples:
+            return None
+        return float(np.percentile(samples, self.percentile))
+
+    def _agent_stats(self, agent):
+        return self.stats.setdefault(agent, {"requests": 0, "hedges": 0, "hedge_wins": 0})
+
+    def _start(self, agent):
+        with self._lock:
+            self._agent_stats(agent)["requests"] += 1
+
+    def _has_budget(self, agent):
+        stats = self._agent_stats(agent)
+        return stats["hedges"] + 1 <= self.budget * stats["requests"]
+
+    def _allow(self, agent, model, admit=None):
+        with self._lock:
+            if not self._has_budget(agent):
+                return False
+        if admit is not None and not admit():
+            get_telemetry().record_hedge(agent, model, "not_admitted")
+            return False
+        with self._lock:
+            self._agent_stats(agent)["hedges"] += 1
+        get_telemetry().record_hedge(agent, model, "sent")
+        return True
+
+    def _won(self, agent, model):
+        with self._lock:
+            self._agent_stats(agent)["hedge_wins"] += 1
+        get_telemetry().record_hedge(agent, model, "won")
+
+    def run(self, agent, model, call, first_token=False, discard=None, admit=None):
+        """
+        Run blocking `call()`, hedged; returns the first successful result. `admit()` takes
+        the backup's rate-limit budget if it is available right now (no hedge otherwise), and
+        `discard(result)` releases a losing copy that still succeeds later (e.g. closes a stream).
+
+        A thread blocked in a call cannot give it up, so a hedgeable primary runs on a
+        reusable worker while the caller waits for whichever copy finishes first. Primaries
+        that cannot be hedged (unknown latencies, no budget, every worker busy) run on the
+        caller's thread.
+        """
+        self._start(agent)
+        delay = self.delay(model, first_token)
+        with self._lock:
+            hedgeable = delay is not None and self._has_budget(agent)
+        primary = _primaries.try_submit(call) if hedgeable else None
+        if primary is None:
+            return call()
+        try:
+            return primary.result(timeout=delay)
+        except FuturesTimeout:
+            pass
+        if not self._allow(agent, model, admit):
+            return primary.result()
+
+        hedge = _executor.submit(call)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        if not other.cancel() and discard is not None:
+                            other.add_done_callback(lambda loser: _release(loser, discard))
+                    if future is hedge:
+                        self._won(agent, model)
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    async def arun(self, agent, model, call, admit=None):
+        """Async counterpart of run(); `call()` returns an awaitable. The losing task is cancelled."""
+        self._start(agent)
+        delay = self.delay(model)
+        if delay is None:
+            return await call()
+
+        primary = asyncio.ensure_future(call())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            if not self._allow(agent, model, admit):
+                return await primary
+
+            hedge = asyncio.ensure_future(call())
+            pending, error = {primary, hedge}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._won(agent, model)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _run_into(future, call):
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        future.set_result(call())
+    except BaseException as e:
+        future.set_exception(e)
+
+
+def _release(future, discard):
+    if not future.cancelled() and future.exception() is None:
+        discard(future.result())
+
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger():
+    """Process-wide hedger configured from the environment, or None when WISDOM_HEDGE=off."""
+    global _hedger
+    if os.getenv("WISDOM_HEDGE", "on").lower() in ("0", "off", "false", "none"):
+        return None
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger(
+                percentile=float(os.getenv("WISDOM_HEDGE_PERCENTILE", DEFAULT_PERCENTILE)),
+                budget=float(os.getenv("WISDOM_HEDGE_BUDGET", DEFAULT_BUDGET)),
+            )
+        return _hedger
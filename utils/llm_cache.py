@@ -0,0 +1,131 @@
+# llm_cache.py
+# Persistent, content-addressed cache for agent chat completions (SQLite backed)
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.ai_utils import hash_prompt
+
+DEFAULT_CACHE_PATH = "data/llm_cache.sqlite"   # WISDOM_LLM_CACHE ("off" disables)
+DEFAULT_TTL_SECONDS = 24 * 60 * 60             # WISDOM_LLM_CACHE_TTL
+DEFAULT_MAX_ENTRIES = 5000                     # WISDOM_LLM_CACHE_MAX_ENTRIES
+
+
+def cache_key(model, messages, temperature=None):
+    """
+    Key a completion by model, temperature, system message and the hash of the
+    fully rendered prompt (every non-system message, in order).
+    """
+    system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    rendered = json.dumps([[m["role"], m["content"]] for m in messages if m["role"] != "system"])
+    return hash_prompt(json.dumps([model, temperature, system, hash_prompt(rendered)]))
+
+
+class LLMCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    last_access REAL,
+                    hit_count INTEGER DEFAULT 0
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON completions(last_access)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response FROM completions WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE completions SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+                (now, key)
+            )
+            self.hits += 1
+            return row[0]
+
+    def contains(self, key):
+        """Whether `key` has a live entry; unlike get() it is not counted as a hit or miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM completions WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        return row is not None
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, response, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        # TTL first, then least-recently-used entries beyond the size cap
+        self._conn.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            """DELETE FROM completions WHERE key IN (
+                   SELECT key FROM completions ORDER BY last_access DESC LIMIT -1 OFFSET ?
+               )""",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM completions")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache configured from the environment, or None when disabled."""
+    global _cache
+    path = os.getenv("WISDOM_LLM_CACHE", DEFAULT_CACHE_PATH)
+    if path.lower() in ("", "0", "off", "false", "none"):
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            _cache = LLMCache(
+                path=path,
+                ttl=float(os.getenv("WISDOM_LLM_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+                max_entries=int(os.getenv("WISDOM_LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            )
+        return _cache
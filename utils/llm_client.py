@@ -0,0 +1,161 @@
+# llm_client.py
+# Process-wide pooled OpenAI client registry shared by every Wisdom Layer agent
+
+import asyncio
+import json
+import os
+import threading
+import weakref
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import httpx
+import openai
+
+from utils.deadline import Deadline
+
+# Connection pool defaults (override via environment)
+DEFAULT_POOL_SIZE = 20          # WISDOM_LLM_POOL_SIZE
+DEFAULT_KEEPALIVE_SECONDS = 60  # WISDOM_LLM_KEEPALIVE
+DEFAULT_TIMEOUT_SECONDS = 60    # WISDOM_LLM_TIMEOUT
+
+# Per-model request timeouts in seconds; WISDOM_LLM_MODEL_TIMEOUTS='{"gpt-4": 90}' overrides
+MODEL_TIMEOUTS = {
+    "gpt-4": 120.0,
+    "gpt-4-turbo": 90.0,
+    "gpt-3.5-turbo": 30.0,
+}
+
+# How often run_coroutine() hands control back to a waiting caller's on_wait()
+WAIT_POLL_SECONDS = 0.25
+
+_lock = threading.Lock()
+_clients = {}
+# Async clients hold connections bound to the loop they were opened on, so keep one pool per loop
+_async_clients = weakref.WeakKeyDictionary()
+# Event loop shared by blocking callers of async code, so its async client pool outlives each call
+_loop = None
+
+
+def _env_number(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return type(default)(value)
+    except ValueError:
+        return default
+
+
+def client_settings():
+    """Current pool configuration, resolved from the environment."""
+    return {
+        "pool_size": _env_number("WISDOM_LLM_POOL_SIZE", DEFAULT_POOL_SIZE),
+        "keepalive": _env_number("WISDOM_LLM_KEEPALIVE", DEFAULT_KEEPALIVE_SECONDS),
+        "timeout": _env_number("WISDOM_LLM_TIMEOUT", DEFAULT_TIMEOUT_SECONDS),
+    }
+
+
+def request_timeout(model):
+    """Timeout (seconds) to apply to a single completion against `model`."""
+    timeouts = dict(MODEL_TIMEOUTS)
+    overrides = os.getenv("WISDOM_LLM_MODEL_TIMEOUTS")
+    if overrides:
+        try:
+            timeouts.update({k: float(v) for k, v in json.loads(overrides).items()})
+        except (ValueError, AttributeError):
+            pass
+    return timeouts.get(model, float(client_settings()["timeout"]))
+
+
+def _http_limits(settings):
+    return httpx.Limits(
+        max_connections=settings["pool_size"],
+        max_keepalive_connections=settings["pool_size"],
+        keepalive_expiry=settings["keepalive"],
+    )
+
+
+def get_client(api_key=None):
+    """
+    Return the shared OpenAI client for `api_key` (defaults to OPENAI_API_KEY).
+
+    The client is created once per process and keeps its HTTP connections alive,
+    so repeated agent calls reuse the same TLS sessions instead of reconnecting.
+    """
+    key = api_key or os.getenv("OPENAI_API_KEY")
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            settings = client_settings()
+            http_client = httpx.Client(limits=_http_limits(settings), timeout=settings["timeout"])
+            # Retries are owned by utils.llm_scheduler, which also paces them against rate limits
+            client = openai.OpenAI(api_key=key, http_client=http_client, max_retries=0)
+            _clients[key] = client
+        return client
+
+
+def get_async_client(api_key=None):
+    """
+    Return the shared AsyncOpenAI client for `api_key` on the running event loop.
+
+    Many agent queries can be awaited concurrently through it; they share one
+    keep-alive pool sized by WISDOM_LLM_POOL_SIZE.
+    """
+    key = api_key or os.getenv("OPENAI_API_KEY")
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _async_clients.setdefault(loop, {})
+        client = per_loop.get(key)
+        if client is None:
+            settings = client_settings()
+            http_client = httpx.AsyncClient(limits=_http_limits(settings), timeout=settings["timeout"])
+            client = openai.AsyncOpenAI(api_key=key, http_client=http_client, max_retries=0)
+            per_loop[key] = client
+        return client
+
+
+def get_event_loop():
+    """The process-wide event loop, running on a daemon thread, that run_coroutine() submits to."""
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="wisdom-async", daemon=True).start()
+        return _loop
+
+
+def run_coroutine(coro, timeout=None, on_wait=None):
+    """
+    Run `coro` to completion from synchronous code (e.g. a Streamlit rerun) on the shared
+    loop, so every call reuses that loop's pooled AsyncOpenAI client instead of building
+    a fresh loop and client as asyncio.run() would. `on_wait()` is called every
+    WAIT_POLL_SECONDS while it runs; the coroutine is cancelled if `timeout` passes first
+    or the waiting thread is interrupted (e.g. on_wait raises when Streamlit stops the script).
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    limit = Deadline(timeout)
+    try:
+        while True:
+            try:
+                return future.result(limit.timeout(WAIT_POLL_SECONDS if on_wait else None))
+            except FuturesTimeout:
+                if limit.expired:
+                    raise
+            on_wait()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+def close_clients():
+    """Close every pooled connection (e.g. on shutdown or after a config change)."""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        # Async clients must be closed on their own loop; loops that have stopped took their pools with them
+        for loop, clients in list(_async_clients.items()):
+            if loop.is_running():
+                for client in clients.values():
+                    asyncio.run_coroutine_threadsafe(client.close(), loop)
+        _async_clients.clear()
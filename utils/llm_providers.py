@@ -0,0 +1,271 @@
+# llm_providers.py
+# Pluggable chat-completion backends: OpenAI, plus an offline deterministic fake for load tests
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from utils.llm_client import get_client, get_async_client, request_timeout
+from utils.tokens import estimate_message_tokens, estimate_tokens
+
+
+class Completion:
+    """Text of one chat completion plus the usage reported (or estimated) for it."""
+
+    def __init__(self, text, model, prompt_tokens=0, completion_tokens=0):
+        self.text = text
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+
+class ProviderError(Exception):
+    """Upstream failure carrying an HTTP-style status, so the scheduler can decide to retry."""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMProvider:
+    name = "base"
+
+    def complete(self, model, messages, **params):
+        raise NotImplementedError
+
+    async def acomplete(self, model, messages, **params):
+        raise NotImplementedError
+
+    def stream(self, model, messages, **params):
+        # Backends without native streaming deliver the whole completion as one chunk
+        yield self.complete(model, messages, **params).text
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def complete(self, model, messages, **params):
+        response = get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=params.pop("timeout", None) or request_timeout(model),
+            **params
+        )
+        return self._completion(model, response)
+
+    async def acomplete(self, model, messages, **params):
+        response = await get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=params.pop("timeout", None) or request_timeout(model),
+            **params
+        )
+        return self._completion(model, response)
+
+    def stream(self, model, messages, **params):
+        stream = get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=params.pop("timeout", None) or request_timeout(model),
+            stream=True,
+            **params
+        )
+        # Closing releases the HTTP connection when the consumer stops early (a hedge loser, a cancelled request)
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
+
+    def _completion(self, model, response):
+        usage = getattr(response, "usage", None)
+        return Completion(
+            text=response.choices[0].message.content.strip(),
+            model=model,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        )
+
+
+class FakeProvider(LLMProvider):
+    """
+    In-process deterministic backend for benchmarking without network or API key.
+
+    Answers are derived from a hash of the prompt, so the same request always gets
+    the same reply. JSON answers follow the schema the prompt asks for
+    ("key": [...] lines) and cite entity names found in the embedded model.
+    A `timeout` shorter than the simulated latency fails the call after `timeout`
+    seconds, as an HTTP client would.
+
+    Args:
+        latency (float): Mean seconds per completion.
+        jitter (float): Uniform +/- seconds added to the latency.
+        error_rate (float): Probability that a call raises ProviderError.
+        error_status (int): Status carried by injected errors (429 and 5xx are retried).
+        seed (int): Seed for the latency/error stream.
+    """
+
+    name = "fake"
+
+    DEFAULT_LIST_KEYS = ["bottlenecks", "isolated_nodes", "perspective_conflicts", "feedback_loops"]
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _plan(self):
+        # One draw per call keeps the latency/error sequence reproducible under a fixed seed
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.error_rate
+        return delay, fail
+
+    @staticmethod
+    def _timed_out(delay, params):
+        timeout = params.get("timeout")
+        return timeout is not None and delay > timeout
+
+    @staticmethod
+    def _answer(rng, names, keys, digest):
+        answer = {}
+        for key in keys:
+            picks = rng.sample(names, min(len(names), rng.randint(1, 3)))
+            answer[key] = [f"{name}: {key.replace('_', ' ')} signal" for name in picks]
+        answer["llm_reasoning"] = f"Deterministic offline analysis ({digest[:8]})."
+        return answer
+
+    def _reply(self, model, messages):
+        prompt = "\n".join(m["content"] for m in messages)
+        digest = hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+        rng = random.Random(int(digest[:16], 16))
+
+        if "Positive, Neutral, or Negative" in prompt:
+            text = rng.choice(["Positive", "Neutral", "Negative"])
+        elif "JSON" in prompt:
+            # Entity names from JSON-encoded models, or from the alias legend of compact ones
+            names = set(re.findall(r'"(?:name|hostname|id)":\s*"([^"]+)"', prompt))
+            names.update(re.findall(r'@\d+=([^;\n]+)', prompt))
+            names = sorted(names) or ["unknown"]
+            keys = [k for k in dict.fromkeys(re.findall(r'"(\w+)":\s*\[\.\.\.\]', prompt)) if k != "llm_reasoning"]
+            keys = keys or self.DEFAULT_LIST_KEYS
+            batch = re.search(r"Answer each of these questions separately:\n((?:\d+\. .*\n?)+)", prompt)
+            if batch:
+                questions = re.findall(r"^\d+\. (.*)$", batch.group(1), re.MULTILINE)
+                reply = {"answers": [
+                    {"index": i, "question": question, "result": self._answer(rng, names, keys, digest)}
+                    for i, question in enumerate(questions, 1)
+                ]}
+            else:
+                reply = self._answer(rng, names, keys, digest)
+            text = json.dumps(reply, indent=2)
+        else:
+            text = f"Offline summary ({digest[:8]}): the affected nodes share dependencies that amplify failure."
+
+        return Completion(text, model, estimate_message_tokens(messages), estimate_tokens(text))
+
+    def complete(self, model, messages, **params):
+        delay, fail = self._plan()
+        if self._timed_out(delay, params):
+            time.sleep(params["timeout"])
+            raise ProviderError("Fake provider request timed out", 408)
+        time.sleep(delay)
+        if fail:
+            raise ProviderError(f"Injected fake provider error ({self.error_status})", self.error_status)
+        return self._reply(model, messages)
+
+    async def acomplete(self, model, messages, **params):
+        delay, fail = self._plan()
+        if self._timed_out(delay, params):
+            await asyncio.sleep(params["timeout"])
+            raise ProviderError("Fake provider request timed out", 408)
+        await asyncio.sleep(delay)
+        if fail:
+            raise ProviderError(f"Injected fake provider error ({self.error_status})", self.error_status)
+        return self._reply(model, messages)
+
+    def stream(self, model, messages, **params):
+        delay, fail = self._plan()
+        if fail:
+            raise ProviderError(f"Injected fake provider error ({self.error_status})", self.error_status)
+        text = self._reply(model, messages).text
+        chunks = [text[i:i + 16] for i in range(0, len(text), 16)] or [""]
+        for chunk in chunks:
+            time.sleep(delay / len(chunks))
+            yield chunk
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def _float_env(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _base_provider_from_env():
+    name = os.getenv("WISDOM_LLM_PROVIDER", "openai").lower()
+    if name == "fake":
+        return FakeProvider(
+            latency=_float_env("WISDOM_FAKE_LATENCY", 0.0),
+            jitter=_float_env("WISDOM_FAKE_JITTER", 0.0),
+            error_rate=_float_env("WISDOM_FAKE_ERROR_RATE", 0.0),
+            error_status=int(_float_env("WISDOM_FAKE_ERROR_STATUS", 503)),
+            seed=int(_float_env("WISDOM_FAKE_SEED", 0)),
+        )
+    if name == "openai":
+        return OpenAIProvider()
+    raise ValueError(f"Unknown LLM provider: {name}")
+
+
+def provider_from_env():
+    """
+    Build the provider named by WISDOM_LLM_PROVIDER ("openai" by default, or "fake"),
+    wrapped in a record/replay cassette when WISDOM_LLM_CASSETTE points at a file.
+    """
+    cassette_path = os.getenv("WISDOM_LLM_CASSETTE")
+    if not cassette_path:
+        return _base_provider_from_env()
+
+    from utils.cassette import CassetteProvider  # cassette builds on this module
+
+    mode = os.getenv("WISDOM_LLM_CASSETTE_MODE", "replay").lower()
+    return CassetteProvider(
+        cassette_path,
+        mode=mode,
+        inner=_base_provider_from_env() if mode == "record" else None,
+        latency_scale=_float_env("WISDOM_LLM_REPLAY_LATENCY_SCALE", 1.0),
+    )
+
+
+def get_provider():
+    """The process-wide default provider used by agents that were not given one."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = provider_from_env()
+        return _provider
+
+
+def set_provider(provider):
+    """Swap the process-wide provider (e.g. FakeProvider() in benchmarks); None re-reads the environment."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
@@ -0,0 +1,339 @@
+# llm_scheduler.py
+# Central rate-limit-aware scheduler for every LLM call made by the Wisdom Layer
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+
+import openai
+from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from utils.deadline import DeadlineExceeded, remaining_timeout
+from utils.telemetry import get_telemetry
+from utils.tokens import estimate_message_tokens
+
+# Requests-per-minute and tokens-per-minute per model; WISDOM_RATE_LIMITS='{"gpt-4": {"rpm": 200, "tpm": 40000}}' overrides
+DEFAULT_RATE_LIMITS = {
+    "gpt-4": {"rpm": 500, "tpm": 10000},
+    "gpt-4-turbo": {"rpm": 500, "tpm": 30000},
+    "gpt-3.5-turbo": {"rpm": 3500, "tpm": 200000},
+}
+FALLBACK_RATE_LIMIT = {"rpm": 500, "tpm": 30000}
+
+# Completion size assumed for budgeting when a call does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 800
+
+# Interactive calls are always admitted ahead of background ones (e.g. cache warm-up)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+# Share of each bucket background calls must leave untouched, so a user's question never waits on them
+BACKGROUND_RESERVE = 0.25
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 1.0
+DEFAULT_MAX_BACKOFF_SECONDS = 30.0
+
+
+def estimate_request_tokens(messages, max_tokens=None):
+    return estimate_message_tokens(messages) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def is_retryable(exc):
+    """429s (except exhausted quota), 5xx responses, timeouts and dropped connections."""
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status == 429:
+        return getattr(exc, "code", None) != "insufficient_quota"
+    return status is not None and status >= 500
+
+
+def _retry_after(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` units refilled evenly over one minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+
+class LLMScheduler:
+    """
+    Admits LLM calls under per-model RPM/TPM token buckets, serving waiting
+    callers round-robin across agents so one busy agent cannot starve the rest,
+    and retries rate-limit and server errors with jittered exponential backoff.
+
+    Background calls queue behind every interactive one and are only admitted
+    while BACKGROUND_RESERVE of both buckets stays free.
+
+    A caller's Deadline bounds both the queueing and the retries: a call that cannot
+    be admitted (or succeed) in time fails with DeadlineExceeded.
+    """
+
+    def __init__(self, limits=None, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 backoff=DEFAULT_BACKOFF_SECONDS, max_backoff=DEFAULT_MAX_BACKOFF_SECONDS):
+        self.limits = dict(DEFAULT_RATE_LIMITS)
+        self.limits.update(limits or {})
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._buckets = {}
+        # (model, priority) -> agent -> FIFO of waiting tickets; (model, priority) -> round-robin order of agents
+        self._queues = {}
+        self._order = {}
+        # event loop -> (model, priority) -> asyncio.Condition its queued coroutines wait on
+        self._async_conds = weakref.WeakKeyDictionary()
+        self._wake_tasks = set()
+
+    def _model_buckets(self, model):
+        if model not in self._buckets:
+            limit = self.limits.get(model, FALLBACK_RATE_LIMIT)
+            self._buckets[model] = (TokenBucket(limit["rpm"]), TokenBucket(limit["tpm"]))
+        return self._buckets[model]
+
+    def _next_ticket(self, model):
+        for priority in (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND):
+            lane = (model, priority)
+            for agent in self._order.get(lane, []):
+                queue = self._queues[lane].get(agent)
+                if queue:
+                    return queue[0]
+        return None
+
+    def _dequeue(self, lane, agent):
+        self._queues[lane][agent].popleft()
+        order = self._order[lane]
+        order.remove(agent)
+        if self._queues[lane][agent]:
+            order.append(agent)  # served: go to the back of the line
+        else:
+            del self._queues[lane][agent]
+
+    def _enqueue(self, agent, lane):
+        ticket = object()
+        self._queues.setdefault(lane, {}).setdefault(agent, deque()).append(ticket)
+        order = self._order.setdefault(lane, [])
+        if agent not in order:
+            order.append(agent)
+        return ticket
+
+    def _admit(self, agent, lane, ticket, tokens):
+        """
+        Under the lock: take `ticket`'s budget if it is next and the buckets allow it.
+        Returns 0 once admitted, the seconds until the buckets will allow it, or None
+        while another ticket is ahead of it.
+        """
+        model, priority = lane
+        if self._next_ticket(model) is not ticket:
+            return None
+        requests, token_budget = self._model_buckets(model)
+        now = time.monotonic()
+        if priority == PRIORITY_INTERACTIVE:
+            wait = max(requests.wait_time(1, now), token_budget.wait_time(tokens, now))
+        else:
+            wait = max(requests.wait_time(1 + requests.capacity * BACKGROUND_RESERVE, now),
+                       token_budget.wait_time(tokens + token_budget.capacity * BACKGROUND_RESERVE, now))
+        if wait == 0:
+            requests.take(1)
+            token_budget.take(tokens)
+            self._dequeue(lane, agent)
+            self._changed(model)
+        return wait
+
+    def _abandon(self, agent, lane, ticket):
+        queue = self._queues.get(lane, {}).get(agent)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[lane][agent]
+                self._order[lane].remove(agent)
+        self._changed(lane[0])
+
+    def _changed(self, model):
+        # The head of `model`'s queues may have moved: wake waiting threads, and coroutines on every loop
+        self._cond.notify_all()
+        for loop, conditions in list(self._async_conds.items()):
+            for lane, condition in conditions.items():
+                if lane[0] == model:
+                    try:
+                        loop.call_soon_threadsafe(self._wake, condition)
+                    except RuntimeError:
+                        pass  # that loop has closed
+
+    def _wake(self, condition):
+        # Runs on the condition's own loop; notify_all() needs the condition's lock
+        async def notify():
+            async with condition:
+                condition.notify_all()
+
+        task = asyncio.ensure_future(notify())
+        self._wake_tasks.add(task)
+        task.add_done_callback(self._wake_tasks.discard)
+
+    def _async_cond(self, lane):
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            conditions = self._async_conds.setdefault(loop, {})
+            if lane not in conditions:
+                conditions[lane] = asyncio.Condition()
+            return conditions[lane]
+
+    @staticmethod
+    def _admitted(agent, model, started):
+        waited = time.monotonic() - started
+        get_telemetry().record_queue_wait(agent, model, waited)
+        return waited
+
+    def acquire(self, agent, model, tokens, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """Block until `agent` may send a `tokens`-sized request to `model`; returns seconds queued."""
+        lane = (model, priority)
+        started = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(agent, lane)
+            try:
+                while True:
+                    if deadline is not None:
+                        deadline.check(f"{agent} waiting for {model} rate limit")
+                    wait = self._admit(agent, lane, ticket, tokens)
+                    if wait == 0:
+                        return self._admitted(agent, model, started)
+                    self._cond.wait(timeout=remaining_timeout(deadline, wait))
+            except BaseException:
+                self._abandon(agent, lane, ticket)
+                raise
+
+    def try_acquire(self, agent, model, tokens, priority=PRIORITY_INTERACTIVE):
+        """Admit a request only if it can go right now, without waiting or jumping the queue (e.g. a hedge)."""
+        lane = (model, priority)
+        with self._cond:
+            ticket = self._enqueue(agent, lane)
+            if self._admit(agent, lane, ticket, tokens) == 0:
+                return True
+            self._abandon(agent, lane, ticket)
+            return False
+
+    async def aacquire(self, agent, model, tokens, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """
+        Async counterpart of acquire(). The coroutine waits on an asyncio.Condition of its
+        lane for the bucket refill (or for the tickets ahead of it), so queued coroutines
+        hold no threads; they share the same queues and round-robin as blocking callers.
+        """
+        lane = (model, priority)
+        started = time.monotonic()
+        condition = self._async_cond(lane)
+        with self._cond:
+            ticket = self._enqueue(agent, lane)
+        try:
+            # Held across check and wait, so a wake-up scheduled in between cannot be lost
+            async with condition:
+                while True:
+                    if deadline is not None:
+                        deadline.check(f"{agent} waiting for {model} rate limit")
+                    with self._cond:
+                        wait = self._admit(agent, lane, ticket, tokens)
+                    if wait == 0:
+                        return self._admitted(agent, model, started)
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout=remaining_timeout(deadline, wait))
+                    except asyncio.TimeoutError:
+                        pass
+        except BaseException:
+            with self._cond:
+                self._abandon(agent, lane, ticket)
+            raise
+
+    def _wait(self, retry_state):
+        jitter = wait_random_exponential(multiplier=self.backoff, max=self.max_backoff)(retry_state)
+        error = retry_state.outcome.exception() if retry_state.outcome else None
+        return max(jitter, _retry_after(error) + random.uniform(0, self.backoff))
+
+    def _retry_kwargs(self, deadline=None):
+        # No backoff sleep outlives the caller's deadline, and no attempt starts after it
+        return dict(
+            retry=retry_if_exception(is_retryable),
+            wait=lambda retry_state: remaining_timeout(deadline, self._wait(retry_state)),
+            stop=stop_after_attempt(self.max_attempts) | (lambda retry_state: deadline is not None and deadline.expired),
+            reraise=True,
+        )
+
+    def run(self, agent, model, messages, call, max_tokens=None, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """Admit and execute `call()` (a blocking completion), retrying transient failures."""
+        tokens = estimate_request_tokens(messages, max_tokens)
+        try:
+            for attempt in Retrying(**self._retry_kwargs(deadline)):
+                with attempt:
+                    self.acquire(agent, model, tokens, priority, deadline)
+                    return call()
+        except Exception as e:
+            _raise_if_expired(e, deadline, agent, model)
+            raise
+
+    async def arun(self, agent, model, messages, call, max_tokens=None, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """Async counterpart of run(); `call()` returns an awaitable."""
+        tokens = estimate_request_tokens(messages, max_tokens)
+        try:
+            async for attempt in AsyncRetrying(**self._retry_kwargs(deadline)):
+                with attempt:
+                    await self.aacquire(agent, model, tokens, priority, deadline)
+                    return await call()
+        except Exception as e:
+            _raise_if_expired(e, deadline, agent, model)
+            raise
+
+
+def _raise_if_expired(error, deadline, agent, model):
+    # A timeout clamped to the caller's budget surfaces as the deadline it is, not as an upstream failure
+    if deadline is not None and deadline.expired and not isinstance(error, DeadlineExceeded):
+        raise DeadlineExceeded(f"{agent} call to {model} did not finish in time") from error
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler, with rate limits optionally overridden by WISDOM_RATE_LIMITS."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            overrides = {}
+            if os.getenv("WISDOM_RATE_LIMITS"):
+                try:
+                    overrides = json.loads(os.getenv("WISDOM_RATE_LIMITS"))
+                except ValueError:
+                    overrides = {}
+            _scheduler = LLMScheduler(
+                limits=overrides,
+                max_attempts=int(os.getenv("WISDOM_LLM_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+            )
+        return _scheduler
@@ -1,29 +1,184 @@
-def summarize_model_for_agent(system_model, agent_type="default", max_per_category=5, max_relationships=50):
+import hashlib
+import json
+
+from utils.tokens import estimate_tokens
+
+# Prompt tokens each agent may spend on the serialized system model. GPT-4's 8k context
+# also has to hold the instructions, meta-context, diff summary and the completion itself.
+AGENT_TOKEN_BUDGETS = {
+    "systems": 4500,
+    "chaos": 4000,
+    "karma": 4000,
+    "default": 4000,
+}
+
+# Consecutive oversized entries tolerated per category before packing gives up on it
+MAX_PACKING_MISSES = 20
+
+
+
+class VersionedModel(dict):
+    """
+    A loaded model that carries an explicit version (e.g. the SHA-256 of the uploaded
+    file), so model_fingerprint() need not hash its content. Replacing a top-level key
+    drops the version, and copies are plain dicts, so edited models are hashed again.
+    Entities nested inside must not be changed in place; layer changes over the model
+    (as ripples do) or load a new version instead.
     """
-    Reduce the size of the system model passed to LLM agents to avoid token limits.
+
+    def __init__(self, data, version):
+        super().__init__(data)
+        self.version = version
+
+    def _edited(self):
+        self.version = None
+
+    def __setitem__(self, key, value):
+        self._edited()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._edited()
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._edited()
+        super().update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._edited()
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        self._edited()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._edited()
+        return super().popitem()
+
+    def clear(self):
+        self._edited()
+        super().clear()
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+def model_fingerprint(obj):
+    """
+    Stable identifier of a model version: the explicit version of a VersionedModel,
+    else a content hash of the model (or any JSON value), computed on every call.
+    """
+    if isinstance(obj, VersionedModel) and obj.version is not None:
+        return obj.version
+    return content_hash(obj)
+
+
+def content_hash(obj):
+    """SHA-256 of the canonical JSON form of `obj`."""
+    canonical = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _serialized_tokens(obj, indent=2):
+    return estimate_tokens(json.dumps(obj, indent=indent))
+
+
+def _entry_tokens(data, indent=2):
+    # Entries sit two levels deep in the serialized model, so every line carries extra indentation
+    text = json.dumps(data, indent=indent)
+    return estimate_tokens(text) + estimate_tokens(" " * (2 * indent) * (text.count("\n") + 1)) + 1
+
+
+def _fits_whole(candidates, token_budget):
+    # Sum per-entry estimates with an early exit, so huge models are never serialized whole
+    estimate = _serialized_tokens({category: [] for category in candidates})
+    for entries in candidates.values():
+        for entry in entries:
+            estimate += _entry_tokens(entry)
+            if estimate > token_budget:
+                return False
+    return _serialized_tokens(candidates) <= token_budget
+
+
+def summarize_model_for_agent(system_model, agent_type="default", token_budget=None, max_per_category=None,
+                              max_relationships=50):
+    """
+    Reduce the size of the system model passed to LLM agents to fit a token budget.
+
+    Models that fit are passed through whole. Larger models are packed round-robin
+    across categories until the budget is reached, so no single category crowds out
+    the rest and the serialized result never exceeds it. Within a category the most
+    connected entities (by the graph index) are taken first; the summary keeps the
+    model's original order.
 
     Args:
         system_model (dict): Full mental model loaded from JSON.
-        agent_type (str): Placeholder for future agent-specific filters.
-        max_per_category (int): Max entries to keep per top-level distinction.
+        agent_type (str): Selects the agent's budget from AGENT_TOKEN_BUDGETS.
+        token_budget (int): Overrides the agent's budget (estimated tokens of the JSON dump).
+        max_per_category (int): Optional hard cap on entries per top-level distinction.
         max_relationships (int): Max relationships to retain.
 
     Returns:
         dict: A summarized version of the system model.
     """
-    summary = {}
-    for category, entries in system_model.items():
-        if not isinstance(entries, list):
-            continue
+    from utils.graph_index import get_graph_index  # the index fingerprints models with this module
 
+    if token_budget is None:
+        token_budget = AGENT_TOKEN_BUDGETS.get(agent_type, AGENT_TOKEN_BUDGETS["default"])
+
+    # Entity data per category (entries already reduced to plain dicts are indexed as-is)
+    index = get_graph_index(system_model)
+    candidates = {}
+    ranks = {}
+    for category, nodes in index.by_category.items():
         if category == "relationships":
-            summary[category] = entries[:max_relationships]
+            candidates[category] = system_model[category][:max_relationships]
+            ranks[category] = list(range(len(candidates[category])))
         else:
-            filtered = []
-            for entry in entries[:max_per_category]:
-                data = entry.get("data", entry)  # fallback if already reduced
-                if isinstance(data, dict):
-                    filtered.append(data)
-            summary[category] = filtered
+            nodes = nodes[:max_per_category] if max_per_category else nodes
+            candidates[category] = [index.entities[n] for n in nodes]
+            ranks[category] = sorted(range(len(nodes)), key=lambda i: -index.degree(nodes[i]))
+
+    if _fits_whole(candidates, token_budget):
+        return candidates
+
+    # Pack: start from the empty skeleton, then take one entry per category per round, hubs first
+    summary = {category: [] for category in candidates}
+    picked = {category: [] for category in candidates}
+    used = _serialized_tokens(summary)
+    added = []
+    cursors = {category: 0 for category in candidates}
+    misses = {category: 0 for category in candidates}
+    open_categories = [c for c in candidates if candidates[c]]
+    while open_categories:
+        for category in list(open_categories):
+            position = ranks[category][cursors[category]]
+            entry = candidates[category][position]
+            cost = _entry_tokens(entry)
+            cursors[category] += 1
+            if used + cost > token_budget:
+                # A smaller entry later on may still fit, but stop probing a category that keeps missing
+                misses[category] += 1
+                fits = misses[category] < MAX_PACKING_MISSES
+            else:
+                summary[category].append(entry)
+                picked[category].append(position)
+                added.append(category)
+                used += cost
+                misses[category] = 0
+                fits = True
+            if not fits or cursors[category] >= len(candidates[category]):
+                open_categories.remove(category)
+
+    # Per-entry costs are estimates; trim the last-packed entries until the real dump fits
+    while added and _serialized_tokens(summary) > token_budget:
+        category = added.pop()
+        summary[category].pop()
+        picked[category].pop()
 
+    for category in summary:
+        summary[category] = [candidates[category][i] for i in sorted(picked[category])]
     return summary
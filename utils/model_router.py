@@ -0,0 +1,269 @@
+# model_router.py
+# Picks the chat model per request from query complexity, prompt size and a latency/cost SLO
+
+import json
+import os
+import re
+import threading
+import time
+
+from utils.llm_scheduler import DEFAULT_COMPLETION_TOKENS
+
+# Models from fastest/cheapest to strongest
+MODEL_TIERS = ["gpt-3.5-turbo", "gpt-4-turbo", "gpt-4"]
+
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+}
+
+# USD per 1k (prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4": (0.03, 0.06),
+}
+
+# Seconds per call assumed until outcomes have been observed
+DEFAULT_LATENCY_SECONDS = {
+    "gpt-3.5-turbo": 3.0,
+    "gpt-4-turbo": 12.0,
+    "gpt-4": 25.0,
+}
+
+COMPLEXITIES = ("lookup", "analysis", "reasoning")
+
+# Weakest model trusted with each kind of question; WISDOM_MODEL_ROUTER='{"floors": {...}, "slo": {...}}' overrides
+DEFAULT_FLOORS = {
+    "lookup": "gpt-3.5-turbo",
+    "analysis": "gpt-4-turbo",
+    "reasoning": "gpt-4",
+}
+DEFAULT_SLO = {
+    "lookup": {"latency_seconds": 8.0, "max_cost_usd": 0.05},
+    "analysis": {"latency_seconds": 30.0, "max_cost_usd": 0.25},
+    "reasoning": {"latency_seconds": 60.0, "max_cost_usd": 0.50},
+}
+
+# Models whose recent error rate exceeds this are skipped while a healthier candidate exists
+MAX_ERROR_RATE = 0.5
+EWMA_ALPHA = 0.2
+STATS_SAVE_INTERVAL = 5.0
+# Seconds a pinned route is trusted before it is re-evaluated on current statistics (WISDOM_ROUTER_PIN_TTL)
+PIN_TTL_SECONDS = 3600.0
+DEFAULT_STATS_PATH = os.path.join("data", "router_stats.json")
+
+_LOOKUP_START = re.compile(r"^\s*(which|who|what|where|list|name|show|are there|is there|how many|does|do|is|are)\b", re.I)
+_REASONING_CUES = (
+    "why", "what would happen", "what if", "predict", "explain", "propagat", "cascad",
+    "could cause", "root cause", "trade-off", "tradeoff", "should we", "phase shift", "implication",
+)
+
+
+def classify_query(question):
+    """
+    Local complexity classifier: "lookup" for short questions that ask to find or list
+    entities, "reasoning" for causal / what-if questions, "analysis" for everything else.
+    """
+    text = (question or "").strip().lower()
+    if any(cue in text for cue in _REASONING_CUES):
+        return "reasoning"
+    if _LOOKUP_START.match(text) and len(text.split()) <= 12:
+        return "lookup"
+    return "analysis"
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens=DEFAULT_COMPLETION_TOKENS):
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4"])
+    return prompt_tokens / 1000.0 * prompt_price + completion_tokens / 1000.0 * completion_price
+
+
+class Route:
+    """A routing decision: the model to call and why."""
+
+    def __init__(self, model, complexity, reason):
+        self.model = model
+        self.complexity = complexity
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Route({self.model!r}, {self.complexity!r}, {self.reason!r})"
+
+
+class ModelRouter:
+    """
+    Chooses, per request, the cheapest model at or above the complexity's quality
+    floor that fits the prompt and is predicted to meet the latency/cost SLO. When
+    none meets it, the fastest eligible model is used. Observed latencies and errors
+    are kept as EWMAs per model and persisted to `stats_path` so the table can be tuned.
+    """
+
+    def __init__(self, floors=None, slo=None, stats_path=DEFAULT_STATS_PATH, pin_ttl=PIN_TTL_SECONDS):
+        self.floors = dict(DEFAULT_FLOORS, **(floors or {}))
+        self.slo = {c: dict(DEFAULT_SLO[c], **(slo or {}).get(c, {})) for c in COMPLEXITIES}
+        self.stats_path = stats_path
+        self.pin_ttl = pin_ttl
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._stats = self._load()
+
+    def _load(self):
+        if self.stats_path and os.path.exists(self.stats_path):
+            try:
+                with open(self.stats_path, "r") as f:
+                    stats = json.load(f)
+                stats.setdefault("models", {})
+                stats.setdefault("routes", {})
+                stats.setdefault("pinned", {})
+                return stats
+            except (OSError, ValueError):
+                pass
+        return {"models": {}, "routes": {}, "pinned": {}}
+
+    def _snapshot(self, force=False):
+        # Under the lock: the statistics as JSON text when a save is due, else None
+        now = time.monotonic()
+        if not self.stats_path or (not force and now - self._last_save < STATS_SAVE_INTERVAL):
+            return None
+        self._last_save = now
+        return json.dumps(self._stats, indent=2)
+
+    def _write(self, text):
+        # Outside the lock; an unwritable path costs the persisted statistics, never the request that was recorded
+        if text is None:
+            return
+        try:
+            if os.path.dirname(self.stats_path):
+                os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            tmp_path = f"{self.stats_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(text)
+            os.replace(tmp_path, self.stats_path)
+        except OSError as e:
+            print(f"[ROUTER STATS ERROR] {e}")
+
+    def predicted_latency(self, model):
+        stats = self._stats["models"].get(model)
+        return stats["latency_ewma"] if stats else DEFAULT_LATENCY_SECONDS.get(model, 30.0)
+
+    def _error_rate(self, model):
+        stats = self._stats["models"].get(model)
+        return stats["error_rate_ewma"] if stats else 0.0
+
+    def _meets_slo(self, model, prompt_tokens, slo):
+        return (self.predicted_latency(model) <= slo["latency_seconds"]
+                and estimate_cost(model, prompt_tokens) <= slo["max_cost_usd"])
+
+    def _pinned(self, pin, now):
+        # The pinned model, or None when there is no pin or it has outlived the TTL
+        entry = self._stats["pinned"].get(pin)
+        if not isinstance(entry, dict) or now - entry.get("pinned_at", 0.0) > self.pin_ttl:
+            return None
+        return entry.get("model")
+
+    def route(self, question, prompt_tokens, complexity=None, agent=None):
+        """
+        Pick a model for `question` whose prompt is about `prompt_tokens` long.
+
+        The pick per (agent, complexity) is pinned and persisted for `pin_ttl` seconds: the
+        model is part of the completion-cache and cassette keys, so a route that drifted with
+        every latency sample would stop matching warmed-up answers. The pin is only used while
+        its model is healthy, fits the prompt and meets the SLO for this prompt's size; it is
+        replaced when it expires, turns unhealthy or its latency breaks the SLO. reset_routes()
+        re-evaluates every route at once.
+        """
+        complexity = complexity or classify_query(question)
+        floor = self.floors.get(complexity, "gpt-4")
+        tiers = MODEL_TIERS[MODEL_TIERS.index(floor):] if floor in MODEL_TIERS else [floor]
+        needed = prompt_tokens + DEFAULT_COMPLETION_TOKENS
+        slo = self.slo.get(complexity, DEFAULT_SLO["analysis"])
+        now = time.time()
+
+        with self._lock:
+            candidates = [m for m in tiers if MODEL_CONTEXT_TOKENS.get(m, 0) >= needed] or [MODEL_TIERS[1]]
+            healthy = [m for m in candidates if self._error_rate(m) <= MAX_ERROR_RATE] or candidates
+            pin = f"{agent or '*'}|{complexity}"
+            pinned = self._pinned(pin, now)
+            if pinned in healthy and self._meets_slo(pinned, prompt_tokens, slo):
+                route = Route(pinned, complexity, "pinned route")
+            else:
+                within = [m for m in healthy if self._meets_slo(m, prompt_tokens, slo)]
+                if within:
+                    route = Route(within[0], complexity, "cheapest model within SLO")
+                else:
+                    route = Route(min(healthy, key=self.predicted_latency), complexity,
+                                  "no model meets SLO; fastest eligible")
+                # A prompt too large or too costly for the pinned model is routed elsewhere once; the pin
+                # itself only moves when it expired or its model is unhealthy or too slow for the SLO
+                if (pinned is None or self._error_rate(pinned) > MAX_ERROR_RATE
+                        or self.predicted_latency(pinned) > slo["latency_seconds"]):
+                    self._stats["pinned"][pin] = {"model": route.model, "pinned_at": now}
+            routes = self._stats["routes"].setdefault(complexity, {})
+            routes[route.model] = routes.get(route.model, 0) + 1
+        return route
+
+    def record(self, model, latency, ok=True):
+        """Fold one upstream call's outcome into the model's latency and error-rate EWMAs."""
+        with self._lock:
+            stats = self._stats["models"].setdefault(model, {
+                "calls": 0,
+                "errors": 0,
+                "latency_ewma": DEFAULT_LATENCY_SECONDS.get(model, 30.0),
+                "error_rate_ewma": 0.0,
+            })
+            stats["calls"] += 1
+            stats["error_rate_ewma"] += EWMA_ALPHA * ((0.0 if ok else 1.0) - stats["error_rate_ewma"])
+            if ok:
+                stats["latency_ewma"] += EWMA_ALPHA * (latency - stats["latency_ewma"])
+            else:
+                stats["errors"] += 1
+            text = self._snapshot()
+        self._write(text)
+
+    def reset_routes(self):
+        """Forget pinned routes so the next requests are routed on current statistics."""
+        with self._lock:
+            self._stats["pinned"] = {}
+            text = self._snapshot(force=True)
+        self._write(text)
+
+    def routing_table(self):
+        """Current per-model statistics and route counts, for tuning floors and SLOs."""
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    def flush(self):
+        with self._lock:
+            text = self._snapshot(force=True)
+        self._write(text)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """
+    Process-wide router configured from WISDOM_MODEL_ROUTER, or None when it is "off"
+    (callers then keep their historical fixed models).
+    """
+    global _router
+    setting = os.getenv("WISDOM_MODEL_ROUTER", "on")
+    if setting.lower() == "off":
+        return None
+    with _router_lock:
+        if _router is None:
+            config = {}
+            if setting.lower() != "on":
+                try:
+                    config = json.loads(setting)
+                except ValueError:
+                    config = {}
+            _router = ModelRouter(
+                floors=config.get("floors"),
+                slo=config.get("slo"),
+                stats_path=os.getenv("WISDOM_ROUTER_STATS", DEFAULT_STATS_PATH),
+                pin_ttl=float(os.getenv("WISDOM_ROUTER_PIN_TTL", PIN_TTL_SECONDS)),
+            )
+        return _router
@@ -0,0 +1,184 @@
+# prompt_encoding.py
+# Token-efficient encodings of the system model for agent prompts
+
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+
+from utils.tokens import estimate_tokens
+
+ENCODINGS = ("json", "compact")
+DEFAULT_ENCODING = "json"   # WISDOM_PROMPT_ENCODING
+
+COMPACT_PREAMBLE = (
+    "Compact table encoding: each '## <category>' section states its column names once "
+    "(a new header line starts whenever the columns change), followed by one '|'-separated row per entity. "
+    "List values are ';'-separated, '-' is an empty list, and '@n' aliases are defined in the 'Aliases' line."
+)
+
+IDENTIFIER_FIELDS = ("name", "hostname", "id", "vlan_name")
+
+# Rendered static prompt blocks kept per (agent, encoding, model version)
+PREFIX_CACHE_SIZE = 64
+
+_stats_lock = threading.Lock()
+_savings = {}
+_prefix_lock = threading.Lock()
+_prefix_cache = OrderedDict()
+
+
+def default_encoding():
+    encoding = os.getenv("WISDOM_PROMPT_ENCODING", DEFAULT_ENCODING).lower()
+    return encoding if encoding in ENCODINGS else DEFAULT_ENCODING
+
+
+def _flatten(data):
+    # One level of nesting (e.g. responsibilities.owns_tools) becomes dotted columns
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict) and value and all(not isinstance(v, dict) for v in value.values()):
+            for sub_key, sub_value in value.items():
+                flat[f"{key}.{sub_key}"] = sub_value
+        else:
+            flat[key] = value
+    return flat
+
+
+def _scalar(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def _cell(value, aliases):
+    if isinstance(value, list):
+        if not value:
+            return "-"
+        return ";".join(aliases.get(v, _scalar(v)) if isinstance(v, str) else _scalar(v) for v in value)
+    if isinstance(value, str):
+        return aliases.get(value, _scalar(value))
+    return _scalar(value)
+
+
+def _choose_aliases(categories):
+    identifiers = set()
+    for entries in categories.values():
+        for data in entries:
+            for field in IDENTIFIER_FIELDS:
+                if isinstance(data.get(field), str):
+                    identifiers.add(data[field])
+
+    counts = Counter()
+    for entries in categories.values():
+        for data in entries:
+            for value in _flatten(data).values():
+                for item in value if isinstance(value, list) else [value]:
+                    if isinstance(item, str) and item in identifiers:
+                        counts[item] += 1
+
+    aliases = {}
+    for name, count in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])):
+        alias = f"@{len(aliases) + 1}"
+        # Worth it only if the characters saved by every use outweigh the legend entry
+        if count * (len(name) - len(alias)) > len(name) + len(alias) + 2:
+            aliases[name] = alias
+    return aliases
+
+
+def encode_compact(system_model):
+    """Render {category: [entity dicts]} as per-category tables with shared entity aliases."""
+    categories = {}
+    for category, entries in system_model.items():
+        if isinstance(entries, list):
+            categories[category] = [e.get("data", e) if isinstance(e, dict) else {"value": e} for e in entries]
+
+    aliases = _choose_aliases(categories)
+    lines = [COMPACT_PREAMBLE]
+    if aliases:
+        lines.append("Aliases: " + "; ".join(f"{alias}={name}" for name, alias in aliases.items()))
+
+    for category, entries in categories.items():
+        if not entries:
+            continue
+        lines.append(f"## {category}")
+        header = None
+        for data in entries:
+            flat = _flatten(data) if isinstance(data, dict) else {"value": data}
+            columns = list(flat)
+            if columns != header:
+                header = columns
+                lines.append("|".join(columns))
+            lines.append("|".join(_cell(flat[c], aliases) for c in columns))
+
+    return "\n".join(lines)
+
+
+def encode_model(system_model, encoding=None):
+    """Serialize the model for a prompt: "json" (indented, the historical format) or "compact"."""
+    encoding = encoding or default_encoding()
+    if encoding == "compact":
+        return encode_compact(system_model)
+    if encoding == "json":
+        return json.dumps(system_model, indent=2)
+    raise ValueError(f"Unknown prompt encoding: {encoding}")
+
+
+def encode_json(value, encoding=None):
+    """Serialize auxiliary JSON (meta-context, diff summaries); compact mode drops the whitespace."""
+    if (encoding or default_encoding()) == "compact":
+        return json.dumps(value, separators=(",", ":"))
+    return json.dumps(value, indent=2)
+
+
+def encoding_report(system_model):
+    """Estimated prompt tokens for each encoding of `system_model`, and the compact saving."""
+    json_tokens = estimate_tokens(encode_model(system_model, "json"))
+    compact_tokens = estimate_tokens(encode_model(system_model, "compact"))
+    saved = json_tokens - compact_tokens
+    return {
+        "json_tokens": json_tokens,
+        "compact_tokens": compact_tokens,
+        "saved_tokens": saved,
+        "saved_pct": round(100.0 * saved / json_tokens, 1) if json_tokens else 0.0,
+    }
+
+
+def record_savings(agent, json_tokens, sent_tokens):
+    """Accumulate, per agent, the prompt tokens the chosen encoding saved versus indented JSON."""
+    with _stats_lock:
+        stats = _savings.setdefault(agent, {"prompts": 0, "json_tokens": 0, "sent_tokens": 0})
+        stats["prompts"] += 1
+        stats["json_tokens"] += json_tokens
+        stats["sent_tokens"] += sent_tokens
+
+
+def savings_report():
+    """Per-agent totals of tokens saved by prompt encoding since process start."""
+    with _stats_lock:
+        report = {}
+        for agent, stats in _savings.items():
+            saved = stats["json_tokens"] - stats["sent_tokens"]
+            report[agent] = dict(stats, saved_tokens=saved,
+                                 saved_pct=round(100.0 * saved / stats["json_tokens"], 1) if stats["json_tokens"] else 0.0)
+        return report
+
+
+def cached_prefix(key, render):
+    """
+    Return the static prompt block stored under `key`, calling `render()` only on a miss.
+
+    Returns (value, rendered) so callers can tell whether the block was rebuilt.
+    """
+    with _prefix_lock:
+        if key in _prefix_cache:
+            _prefix_cache.move_to_end(key)
+            return _prefix_cache[key], False
+    value = render()
+    with _prefix_lock:
+        _prefix_cache[key] = value
+        while len(_prefix_cache) > PREFIX_CACHE_SIZE:
+            _prefix_cache.popitem(last=False)
+    return value, True
@@ -0,0 +1,139 @@
+# ripple_engine.py
+# Frontier-based ripple propagation over the CSR dependency graph
+
+import numpy as np
+
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class RippleStep:
+    """
+    One propagation step.
+
+    frontier: nodes removed/failing at this step
+    hit:      frontier plus every node referring to it (what the step affects)
+    new:      hit nodes no earlier step reached; they form the next frontier
+    """
+
+    def __init__(self, step, frontier, hit, new):
+        self.step = step
+        self.frontier = frontier
+        self.hit = hit
+        self.new = new
+
+
+def gather_rows(offsets, nodes):
+    """Indices into a CSR value array covering the rows of `nodes`, without a Python loop."""
+    nodes = np.asarray(nodes, dtype=np.int64)
+    starts = np.asarray(offsets[nodes], dtype=np.int64)
+    counts = np.asarray(offsets[nodes + 1], dtype=np.int64) - starts
+    total = int(counts.sum())
+    if total == 0:
+        return EMPTY
+    # Position within the concatenated rows, shifted to each row's start
+    row_starts = np.cumsum(counts) - counts
+    return np.arange(total, dtype=np.int64) - np.repeat(row_starts, counts) + np.repeat(starts, counts)
+
+
+def referrers_of(graph, nodes, type_mask=None):
+    """Unique nodes referring to any of `nodes` through an edge type selected by `type_mask`."""
+    if len(nodes) == 0:
+        return EMPTY
+    edges = gather_rows(graph.rev_offsets, nodes)
+    sources = np.asarray(graph.rev_sources[edges], dtype=np.int64)
+    if type_mask is not None and not type_mask.all():
+        sources = sources[type_mask[graph.rev_types[edges]]]
+    return np.unique(sources)
+
+
+def ripple_hit(graph, nodes, type_mask=None):
+    """`nodes` together with everything referring to them, sorted."""
+    nodes = np.asarray(nodes, dtype=np.int64)
+    return np.union1d(nodes, referrers_of(graph, nodes, type_mask))
+
+
+def propagate(graph, origin, max_steps, edge_types=None, nested=False):
+    """
+    Yield a RippleStep per step, starting from the `origin` node IDs. Each step's
+    frontier is the set of nodes first reached by the step before, so work per step
+    is proportional to the edges into the frontier, not to the size of the model.
+    The first step is always yielded (with nothing hit if `origin` is empty); later
+    ones stop as soon as nothing new is reached.
+
+    By default only top-level reference fields propagate (nested=False), matching
+    the ripple semantics of simulate_ripple_step.
+    """
+    type_mask = graph.type_mask(edge_types, nested)
+    visited = np.zeros(len(graph), dtype=bool)
+    frontier = np.unique(np.asarray(origin, dtype=np.int64))
+    for step in range(1, max_steps + 1):
+        if step > 1 and len(frontier) == 0:
+            return
+        hit = ripple_hit(graph, frontier, type_mask)
+        new = hit[~visited[hit]]
+        visited[new] = True
+        yield RippleStep(step, frontier, hit, new)
+        frontier = new
+
+
+RIPPLE_STATUS = "ripple_affected"
+
+
+class RippleOverlay:
+    """
+    Ripple state layered over an immutable base model: entity statuses keyed by
+    node ID plus the ripple history, so a step costs time and memory in proportion
+    to what it affects rather than to the model. The base is never written to;
+    materialize() produces the exported model.
+
+    Stepping derives a new overlay (copy-on-write) and leaves the previous one as it was.
+    """
+
+    def __init__(self, base, graph, status=None, history=None, partial=None):
+        self.base = base
+        self.graph = graph
+        self.status = {} if status is None else status
+        self.history = list(base.get("ripple_history", [])) if history is None else history
+        self.partial = partial
+
+    @classmethod
+    def over(cls, model, graph):
+        """A fresh overlay for a model, or a derived one when `model` is already an overlay."""
+        return model.derive() if isinstance(model, cls) else cls(model, graph)
+
+    def derive(self):
+        return RippleOverlay(self.base, self.graph, dict(self.status), list(self.history), self.partial)
+
+    def entry(self, node):
+        category, position = self.graph.locate(node)
+        return self.base[category][position]
+
+    def mark(self, node, status=RIPPLE_STATUS):
+        self.status[node] = status
+
+    def affected(self, status=RIPPLE_STATUS):
+        """IDs of nodes carrying `status`, in model order."""
+        return sorted(node for node, value in self.status.items() if value == status)
+
+    def materialize(self):
+        """
+        The model with ripple statuses, history and partial flag applied, as the old
+        deep-copying simulation returned it. Untouched categories and entities are
+        shared with the base, so copy before mutating the result.
+        """
+        result = dict(self.base)
+        touched = {}
+        for node, status in self.status.items():
+            category, position = self.graph.locate(node)
+            touched.setdefault(category, []).append((position, status))
+        for category, changes in touched.items():
+            entries = list(self.base[category])
+            for position, status in changes:
+                entry = dict(entries[position])
+                entry["data"] = dict(entry["data"], status=status)
+                entries[position] = entry
+            result[category] = entries
+        result["ripple_history"] = list(self.history)
+        if self.partial:
+            result["ripple_partial"] = self.partial
+        return result
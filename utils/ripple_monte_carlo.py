@@ -0,0 +1,277 @@
+# ripple_monte_carlo.py
+# Weighted, decaying ripple propagation sampled over many Monte Carlo trials on the CSR graph
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import numpy as np
+
+from utils.csr_graph import ARRAYS, CSRGraph
+from utils.deadline import remaining_timeout
+from utils.ripple_engine import gather_rows
+
+# Chance that a failure crosses one reference of this type in the first step. Nested field paths
+# ("responsibilities.owns_apps") fall back to their sub-key; WISDOM_RIPPLE_TRANSMISSION='{"runs": 0.95}' overrides
+DEFAULT_TRANSMISSION = {
+    "runs": 0.9,
+    "deployed_on": 0.9,
+    "subnet": 0.7,
+    "owned_by": 0.6,
+    "owns_apps": 0.6,
+    "owns_tools": 0.5,
+    "uses_tools": 0.5,
+    "members": 0.5,
+    "teams": 0.4,
+    "used_by_teams": 0.4,
+    "responds_to": 0.4,
+    "monitors_applications": 0.3,
+    "monitors_apps": 0.3,
+    "related_to": 0.3,
+    "sub_events": 0.3,
+    "initiator": 0.2,
+}
+FALLBACK_TRANSMISSION = 0.3
+
+# Factor applied to every transmission probability once per step after the first (WISDOM_RIPPLE_DECAY)
+DEFAULT_DECAY = 0.7
+
+DEFAULT_TRIALS = 2000
+
+# Trials simulated together; every batch has its own seed, so results do not depend on the worker count
+TRIAL_BATCH = 250
+
+# Below this many trial-edges (trials x edges) starting worker processes costs more than it saves
+PARALLEL_MIN_WORK = 20_000_000
+
+_worker_arrays = None
+
+
+def ripple_decay():
+    return float(os.getenv("WISDOM_RIPPLE_DECAY", DEFAULT_DECAY))
+
+
+def transmission_probabilities(edge_types, transmission=None):
+    """Transmission probability per edge-type ID: exact field path, then its sub-key, then the fallback."""
+    table = dict(DEFAULT_TRANSMISSION)
+    if os.getenv("WISDOM_RIPPLE_TRANSMISSION"):
+        try:
+            table.update(json.loads(os.getenv("WISDOM_RIPPLE_TRANSMISSION")))
+        except ValueError:
+            pass
+    table.update(transmission or {})
+    probabilities = [table.get(t, table.get(t.rpartition(".")[2], FALLBACK_TRANSMISSION)) for t in edge_types]
+    return np.clip(np.array(probabilities, dtype=np.float64), 0.0, 1.0)
+
+
+def simulate_batch(rev_offsets, rev_sources, rev_types, origin, trials, max_steps, probabilities, decay, seed):
+    """
+    Run `trials` independent ripples from the `origin` node IDs at once. Each reached
+    (trial, node) pair is one int64 key, so a step is a handful of array operations over
+    the edges into that step's frontier, whatever the number of trials.
+
+    At step s a failing node is passed on to each referrer with its edge type's probability
+    times decay ** (s - 1); a node fails at most once per trial. Returns sparse per-step
+    counts of the nodes first reached at that step (origin nodes count at step 1) and the
+    number of nodes each trial reached.
+    """
+    node_count = len(rev_offsets) - 1
+    rng = np.random.default_rng(seed)
+    frontier = (np.arange(trials, dtype=np.int64)[:, None] * node_count + origin[None, :]).ravel()
+    reached = frontier
+    steps = []
+    for step in range(1, max_steps + 1):
+        if len(frontier) == 0:
+            break
+        nodes = frontier % node_count
+        counts = np.asarray(rev_offsets[nodes + 1], dtype=np.int64) - np.asarray(rev_offsets[nodes], dtype=np.int64)
+        edges = gather_rows(rev_offsets, nodes)
+        owners = np.repeat(frontier // node_count, counts)
+        crossed = rng.random(len(edges)) < probabilities[rev_types[edges]] * decay ** (step - 1)
+        candidates = _sorted_unique(owners[crossed] * node_count + np.asarray(rev_sources[edges[crossed]], dtype=np.int64))
+        new = candidates[~np.isin(candidates, reached, assume_unique=True)]
+        reached = np.sort(np.concatenate((reached, new)))
+        first_hit = np.concatenate((frontier, new)) if step == 1 else new
+        steps.append(_sorted_unique(first_hit % node_count, return_counts=True))
+        frontier = new
+    return {"trials": trials, "steps": steps, "sizes": np.bincount(reached // node_count, minlength=trials)}
+
+
+def _sorted_unique(values, return_counts=False):
+    # Sort-based np.unique: far faster than the hash-based one on these large int64 key arrays
+    values = np.sort(values)
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1]))) if len(values) else values
+    if not return_counts:
+        return values[starts]
+    return values[starts], np.diff(np.append(starts, len(values)))
+
+
+def _init_worker(directory):
+    # Each worker maps the sidecar itself: the arrays are neither pickled nor copied per process
+    global _worker_arrays
+    graph = CSRGraph.load(directory)
+    _worker_arrays = (graph.rev_offsets, graph.rev_sources, graph.rev_types)
+
+
+def _pool_context():
+    # Never fork: the caller (e.g. Streamlit) is multi-threaded, and a forked child inherits its held locks
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _run_batch(*args):
+    return simulate_batch(*_worker_arrays, *args)
+
+
+class ImpactDistribution:
+    """
+    Per-node outcome of a Monte Carlo ripple. step_counts[s, n] is the number of trials
+    in which node n was first reached at step s + 1, so each node's impact probability
+    splits into a distribution over the step it fails at (the rest of the mass is "never");
+    sizes[t] is how many nodes trial t reached.
+    """
+
+    def __init__(self, graph, origin, max_steps, decay):
+        self.graph = graph
+        self.origin = origin
+        self.max_steps = max_steps
+        self.decay = decay
+        self.trials = 0
+        self.step_counts = np.zeros((max_steps, len(graph)), dtype=np.int64)
+        self.partial = None
+        self._sizes = []
+
+    def add(self, batch):
+        self.trials += batch["trials"]
+        for index, (nodes, counts) in enumerate(batch["steps"]):
+            self.step_counts[index, nodes] += counts
+        self._sizes.append(batch["sizes"])
+
+    @property
+    def sizes(self):
+        return np.concatenate(self._sizes) if self._sizes else np.zeros(0, dtype=np.int64)
+
+    @property
+    def step_probabilities(self):
+        return self.step_counts / max(self.trials, 1)
+
+    @property
+    def probabilities(self):
+        """Probability that each node is impacted within max_steps."""
+        return self.step_counts.sum(axis=0) / max(self.trials, 1)
+
+    @property
+    def expected_impacted(self):
+        return float(self.sizes.mean()) if self.trials else 0.0
+
+    @property
+    def severity_score(self):
+        # Same 0-100 scale as the deterministic ripple, on the expected number of impacted nodes
+        return min(100, round(self.expected_impacted * 10))
+
+    def percentiles(self, q=(50, 90, 99)):
+        """Percentiles of the number of nodes a trial impacts."""
+        if not self.trials:
+            return {f"p{p}": 0 for p in q}
+        return {f"p{p}": int(v) for p, v in zip(q, np.percentile(self.sizes, q, method="higher"))}
+
+    def top(self, limit=20, min_probability=0.0):
+        """Impacted nodes other than the origin, most likely first."""
+        probabilities = self.probabilities
+        probabilities[self.origin] = 0.0
+        candidates = np.flatnonzero(probabilities > min_probability)
+        candidates = candidates[np.lexsort((candidates, -probabilities[candidates]))][:limit]
+        by_step = self.step_probabilities
+        rows = []
+        for node in candidates.tolist():
+            category, _ = self.graph.locate(node)
+            rows.append({
+                "node": self.graph.label(node) or "unknown",
+                "category": category,
+                "probability": round(float(probabilities[node]), 3),
+                "by_step": [round(float(p), 3) for p in by_step[:, node]],
+            })
+        return rows
+
+    def to_dict(self, limit=20):
+        result = {
+            "trials": self.trials,
+            "max_steps": self.max_steps,
+            "decay": self.decay,
+            "expected_impacted": round(self.expected_impacted, 2),
+            "impacted_percentiles": self.percentiles(),
+            "severity_score": self.severity_score,
+            "nodes": self.top(limit),
+        }
+        if self.partial:
+            result["partial"] = self.partial
+        return result
+
+
+def _worker_count(workers, trials, graph, batches):
+    if workers is None:
+        if trials * graph.edge_count < PARALLEL_MIN_WORK:
+            return 1
+        workers = int(os.getenv("WISDOM_RIPPLE_WORKERS", os.cpu_count() or 1))
+    return max(1, min(workers, batches))
+
+
+def monte_carlo_ripple(graph, origin, max_steps=3, trials=DEFAULT_TRIALS, transmission=None, decay=None,
+                       seed=None, workers=None, deadline=None):
+    """
+    Impact distribution of a failure of the `origin` node IDs over `trials` weighted,
+    decaying ripples of up to `max_steps` steps. Batches run in a process pool when the
+    work is large enough (or `workers` > 1); the same `seed` gives the same result either way.
+    Workers are started by forkserver (spawn where that is unavailable) and memory-map the
+    graph's sidecar directory themselves.
+    Unlike propagate(), nested references (responsibilities.*, relationships.*) carry
+    failures too, each at its own probability; give a type 0 in `transmission` to exclude it.
+
+    Once `deadline` expires the remaining batches are dropped and `partial` records how
+    many trials completed.
+    """
+    origin = np.unique(np.asarray(origin, dtype=np.int64))
+    probabilities = transmission_probabilities(graph.edge_types, transmission)
+    decay = ripple_decay() if decay is None else decay
+    sizes = [min(TRIAL_BATCH, trials - start) for start in range(0, trials, TRIAL_BATCH)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    batches = [(origin, size, max_steps, probabilities, decay, batch_seed) for size, batch_seed in zip(sizes, seeds)]
+    impact = ImpactDistribution(graph, origin, max_steps, decay)
+
+    workers = _worker_count(workers, trials, graph, len(batches))
+    if workers == 1:
+        for batch in batches:
+            if deadline is not None and deadline.expired:
+                break
+            impact.add(simulate_batch(graph.rev_offsets, graph.rev_sources, graph.rev_types, *batch))
+    else:
+        # A graph built in memory is written to a temporary sidecar for the workers to map
+        # (through a copy, so the shared graph never points at the scratch directory)
+        scratch = None if graph.directory else tempfile.mkdtemp(prefix="wisdom-ripple-")
+        directory = os.path.abspath(graph.directory or os.path.join(scratch, "graph"))
+        try:
+            if scratch:
+                CSRGraph({name: getattr(graph, name) for name in ARRAYS}, graph.meta).save(directory)
+            # Not a `with` block: its exit waits for running batches, which would overrun the deadline
+            pool = ProcessPoolExecutor(workers, mp_context=_pool_context(), initializer=_init_worker,
+                                       initargs=(directory,))
+            timed_out = False
+            try:
+                futures = [pool.submit(_run_batch, *batch) for batch in batches]
+                for future in futures:
+                    impact.add(future.result(timeout=remaining_timeout(deadline)))
+            except FuturesTimeout:
+                timed_out = True
+            finally:
+                pool.shutdown(wait=not timed_out, cancel_futures=True)
+        finally:
+            if scratch:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+    if impact.trials < trials:
+        impact.partial = {"trials_completed": impact.trials, "trials_requested": trials, "reason": deadline.reason}
+    return impact
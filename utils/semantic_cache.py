@@ -0,0 +1,167 @@
+# semantic_cache.py
+# Reuses stored agent answers for paraphrased questions about the same model version
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from scipy.sparse import vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from utils.model_filter import content_hash, model_fingerprint
+
+DEFAULT_SEMANTIC_CACHE_PATH = "data/semantic_cache.sqlite"   # WISDOM_SEMANTIC_CACHE ("off" disables)
+DEFAULT_THRESHOLD = 0.9                                      # WISDOM_SEMANTIC_CACHE_THRESHOLD
+DEFAULT_TTL_SECONDS = 24 * 60 * 60                           # WISDOM_LLM_CACHE_TTL
+
+# In-memory index bounds: contexts (agent x model version) kept, and the newest answers kept per context
+MAX_CONTEXTS = 64
+MAX_ENTRIES_PER_CONTEXT = 500
+
+# Words that flip or scope a question's meaning; paraphrases must agree on them exactly
+GUARD_WORDS = frozenset((
+    "not", "no", "never", "without", "except", "least", "most", "more", "less", "fewer",
+    "before", "after", "increase", "decrease", "new", "removed",
+))
+
+_vectorizer = HashingVectorizer(analyzer="char_wb", ngram_range=(3, 5), n_features=2 ** 18,
+                                alternate_sign=False, norm="l2")
+
+
+def normalize_question(question):
+    text = re.sub(r"[^\w\s-]", " ", (question or "").lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def question_guards(question):
+    """Tokens two questions must share to be interchangeable: guard words and entity-like names."""
+    words = re.findall(r"[\w-]+", question or "")
+    guards = {w.lower() for w in words if w.lower() in GUARD_WORDS}
+    for i, word in enumerate(words):
+        # CamelCase, digits, or capitalized mid-sentence words name specific entities (PayrollApp, vlan20, Jane)
+        if re.search(r"\d", word) or re.search(r"[a-z][A-Z]", word) or (i > 0 and word[:1].isupper()):
+            guards.add(word.lower())
+    return frozenset(guards)
+
+
+def context_key(agent, context_parts):
+    """Identity of everything an answer depends on besides the question: the agent and its model inputs."""
+    return content_hash([agent, [model_fingerprint(part) for part in context_parts]])
+
+
+class SemanticCache:
+    """
+    Stored answers per (agent, model version), searchable by question similarity.
+
+    Questions are embedded with hashed character n-grams (no fitting, so the index
+    is updated incrementally) and compared by cosine similarity. An answer is reused
+    only above `threshold` and when both questions name the same entities and agree
+    on negations/superlatives, so "if PayrollApp fails" never answers "if HRApp fails".
+    """
+
+    def __init__(self, path=DEFAULT_SEMANTIC_CACHE_PATH, threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.reused = 0
+        self._lock = threading.Lock()
+        # context -> (entries [(question, guards, answer, created_at)], stacked vectors or None), least recently used first
+        self._index = OrderedDict()
+
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    context TEXT,
+                    question TEXT,
+                    answer TEXT,
+                    created_at REAL,
+                    PRIMARY KEY (context, question)
+                )
+            """)
+
+    def _entries(self, context, now):
+        # Loaded from disk once per context, then kept in step with put(); expired answers are dropped on access
+        if context in self._index:
+            self._index.move_to_end(context)
+            entries, vectors = self._index[context]
+            fresh = [i for i, entry in enumerate(entries) if entry[3] >= now - self.ttl]
+            if len(fresh) < len(entries):
+                entries, vectors = [entries[i] for i in fresh], vectors[fresh] if fresh else None
+                self._index[context] = (entries, vectors)
+            return entries, vectors
+        rows = self._conn.execute(
+            "SELECT question, answer, created_at FROM answers WHERE context = ? AND created_at >= ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (context, now - self.ttl, MAX_ENTRIES_PER_CONTEXT)
+        ).fetchall()[::-1]
+        entries = [(q, question_guards(q), a, created_at) for q, a, created_at in rows]
+        vectors = _vectorizer.transform([normalize_question(q) for q, _, _ in rows]) if rows else None
+        self._index[context] = (entries, vectors)
+        while len(self._index) > MAX_CONTEXTS:
+            self._index.popitem(last=False)
+        return entries, vectors
+
+    def lookup(self, context, question):
+        """Return (answer, matched question, similarity) for the closest acceptable match, or None."""
+        with self._lock:
+            entries, vectors = self._entries(context, time.time())
+            if not entries:
+                return None
+            similarities = (vectors @ _vectorizer.transform([normalize_question(question)]).T).toarray().ravel()
+            guards = question_guards(question)
+            for i in similarities.argsort()[::-1]:
+                if similarities[i] < self.threshold:
+                    return None
+                stored_question, stored_guards, answer, _ = entries[i]
+                if stored_guards == guards:
+                    self.reused += 1
+                    return answer, stored_question, round(float(similarities[i]), 3)
+            return None
+
+    def put(self, context, question, answer):
+        vector = _vectorizer.transform([normalize_question(question)])
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (context, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                (context, question, answer, now)
+            )
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+            entries, vectors = self._entries(context, now)
+            # Keep the newest answers, one per question
+            keep = [i for i, entry in enumerate(entries) if entry[0] != question][-(MAX_ENTRIES_PER_CONTEXT - 1):]
+            entries = [entries[i] for i in keep] + [(question, question_guards(question), answer, now)]
+            vectors = vstack([vectors[keep], vector]).tocsr() if keep else vector
+            self._index[context] = (entries, vectors)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+            self._index.clear()
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Process-wide semantic cache configured from the environment, or None when disabled."""
+    global _semantic_cache
+    path = os.getenv("WISDOM_SEMANTIC_CACHE", DEFAULT_SEMANTIC_CACHE_PATH)
+    if path.lower() in ("", "0", "off", "false", "none"):
+        return None
+    with _semantic_cache_lock:
+        if _semantic_cache is None or _semantic_cache.path != path:
+            _semantic_cache = SemanticCache(
+                path=path,
+                threshold=float(os.getenv("WISDOM_SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+                ttl=float(os.getenv("WISDOM_LLM_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+            )
+        return _semantic_cache
@@ -0,0 +1,114 @@
+# single_flight.py
+# Coalesces identical in-flight LLM calls so one upstream completion serves every concurrent caller
+
+import asyncio
+import threading
+from concurrent.futures import CancelledError, Future
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+from utils.deadline import DeadlineExceeded, remaining_timeout
+from utils.llm_scheduler import PRIORITY_INTERACTIVE
+
+
+class SingleFlight:
+    """
+    At most one call per key runs at a time; callers arriving while it is in flight
+    wait for its outcome (result or exception) instead of starting their own.
+
+    The shared outcome is a concurrent.futures.Future, so threads (Streamlit sessions)
+    and coroutines on any event loop can wait on the same flight. If the leading call
+    is cancelled or runs out of its own deadline, one of the waiters takes over
+    rather than failing with it; waiters give up at their own deadline.
+
+    A caller only joins a flight running at its own scheduler priority or a more
+    urgent one: an interactive question never waits in the background lane behind a
+    warm-up call. It leads its own flight instead, which later callers then join.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def claim(self, key, priority=PRIORITY_INTERACTIVE):
+        """Return (future, is_leader); the leader must call settle() exactly once."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight[1] <= priority:
+                self.followers += 1
+                return flight[0], False
+            future = Future()
+            self._flights[key] = (future, priority)
+            self.leaders += 1
+            return future, True
+
+    def settle(self, key, future, result=None, error=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight[0] is future:
+                del self._flights[key]
+        if isinstance(error, DeadlineExceeded):
+            error = CancelledError()  # the leader's budget is not the waiters' budget
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, call, deadline=None, priority=PRIORITY_INTERACTIVE):
+        """Run `call()` for `key`, or wait (until `deadline`) for the identical call already in flight."""
+        while True:
+            future, leader = self.claim(key, priority)
+            if leader:
+                try:
+                    result = call()
+                except BaseException as e:
+                    self.settle(key, future, error=e)
+                    raise
+                self.settle(key, future, result)
+                return result
+            try:
+                return future.result(timeout=remaining_timeout(deadline))
+            except FuturesTimeout:
+                if future.done():
+                    raise  # the leader's own error
+                raise DeadlineExceeded("waiting for an identical in-flight call") from None
+            except (CancelledError, asyncio.CancelledError):
+                continue  # the leader was cancelled; try to lead
+
+    async def ado(self, key, call, deadline=None, priority=PRIORITY_INTERACTIVE):
+        """Async counterpart of do(); `call()` returns an awaitable."""
+        while True:
+            future, leader = self.claim(key, priority)
+            if leader:
+                try:
+                    result = await call()
+                except BaseException as e:
+                    self.settle(key, future, error=e)
+                    raise
+                self.settle(key, future, result)
+                return result
+            try:
+                # Shielded: cancelling this waiter must not cancel the flight the leader will settle
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                              timeout=remaining_timeout(deadline))
+            except asyncio.TimeoutError:
+                if future.done():
+                    raise
+                raise DeadlineExceeded("waiting for an identical in-flight call") from None
+            except asyncio.CancelledError:
+                if not future.done():
+                    raise  # this waiter itself was cancelled
+                continue
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+_flight = SingleFlight()
+
+
+def get_single_flight():
+    """Process-wide coalescer shared by every agent."""
+    return _flight
@@ -0,0 +1,96 @@
+# stream_json.py
+# Incremental parser that surfaces list items from a streamed JSON agent reply
+
+import json
+
+
+class IncrementalJSONParser:
+    """
+    Feed streamed completion text in chunks and get back every element of the
+    top-level object's arrays (e.g. "volatility_nodes") as soon as it is complete.
+
+    Prose before the first "{" is ignored, so replies like "Here you go: {...}"
+    still stream. Only arrays directly under the top-level object are emitted;
+    nested structures are returned whole as part of their enclosing item.
+    """
+
+    def __init__(self, keys=None):
+        self.keys = set(keys) if keys else None
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._pending_key = None
+        self._current_key = None
+        self._item_start = None
+
+    def feed(self, chunk):
+        """Consume a chunk; return a list of (key, item) pairs completed by it."""
+        self.text += chunk
+        completed = []
+        text = self.text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1:self._pos]
+                self._pos += 1
+                continue
+
+            in_array = self._depth == 2 and self._current_key is not None
+            if in_array and self._item_start is None and ch not in " \t\r\n,]":
+                self._item_start = self._pos
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch == ":" and self._depth == 1:
+                self._current_key = None
+                self._pending_key = self._last_string
+            elif ch == "[" and self._depth == 1:
+                self._current_key = self._pending_key
+                self._depth += 1
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                if in_array and ch == "]":
+                    self._emit(completed, self._pos)
+                    self._current_key = None
+                self._depth -= 1
+            elif ch == "," and in_array:
+                self._emit(completed, self._pos)
+            self._pos += 1
+        return completed
+
+    def _emit(self, completed, end):
+        if self._item_start is None:
+            return
+        fragment = self.text[self._item_start:end].strip()
+        self._item_start = None
+        if not fragment or (self.keys is not None and self._current_key not in self.keys):
+            return
+        try:
+            completed.append((self._current_key, json.loads(fragment)))
+        except json.JSONDecodeError:
+            completed.append((self._current_key, fragment))
+
+    @property
+    def done(self):
+        return self._started and self._depth == 0
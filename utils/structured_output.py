@@ -0,0 +1,139 @@
+# structured_output.py
+# Output schemas for agent replies: JSON-mode request options, validation, and one-shot repair
+
+import json
+
+# Replies are scanned at most this far; anything longer is treated as malformed
+MAX_REPLY_CHARS = 200_000
+# Candidate "{" positions tried before giving up on extracting an object
+MAX_OBJECT_STARTS = 3
+
+# Models that accept response_format={"type": "json_schema"} / {"type": "json_object"}
+JSON_SCHEMA_MODELS = ("gpt-4o", "gpt-4.1", "o3", "o4")
+JSON_MODE_MODELS = ("gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-3.5-turbo")
+
+
+def result_schema(list_keys, reasoning_key="llm_reasoning"):
+    """JSON schema of an agent answer: one array per result list plus a reasoning string."""
+    properties = {key: {"type": "array"} for key in list_keys}
+    properties[reasoning_key] = {"type": "string"}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+    }
+
+
+def batch_schema(item_schema):
+    """Schema of a batched answer: {"answers": [{"index", "question", "result": <item_schema>}]}."""
+    return {
+        "type": "object",
+        "properties": {
+            "answers": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "index": {"type": "integer"},
+                        "question": {"type": "string"},
+                        "result": item_schema,
+                    },
+                    "required": ["index", "result"],
+                },
+            },
+        },
+        "required": ["answers"],
+    }
+
+
+def response_format_for(model, schema, name="agent_result"):
+    """The strongest structured-output mode `model` supports, or None (prompt-only JSON)."""
+    if model.startswith(JSON_SCHEMA_MODELS):
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": False}}
+    if model.startswith(JSON_MODE_MODELS):
+        return {"type": "json_object"}
+    return None
+
+
+def extract_json(raw):
+    """
+    Return (object, error) for the first JSON object in `raw`.
+
+    Each candidate "{" is decoded in a single pass that stops at its matching brace, so
+    prose or code fences around the object are ignored and nothing is scanned twice.
+    """
+    if raw is None:
+        return None, "empty reply"
+    if len(raw) > MAX_REPLY_CHARS:
+        return None, f"reply longer than {MAX_REPLY_CHARS} characters"
+
+    decoder = json.JSONDecoder()
+    error = "no JSON object found"
+    start = raw.find("{")
+    for _ in range(MAX_OBJECT_STARTS):
+        if start < 0:
+            break
+        try:
+            obj, _ = decoder.raw_decode(raw, start)
+            return obj, None
+        except json.JSONDecodeError as e:
+            error = f"invalid JSON: {e.msg} at line {e.lineno} column {e.colno}"
+        start = raw.find("{", start + 1)
+    return None, error
+
+
+def _type_ok(value, expected):
+    return {
+        "array": isinstance(value, list),
+        "string": isinstance(value, str),
+        "object": isinstance(value, dict),
+    }.get(expected, True)
+
+
+def validate(obj, schema):
+    """List of human-readable problems with `obj` against `schema` (empty when valid)."""
+    if not isinstance(obj, dict):
+        return ["the reply must be a single JSON object"]
+    errors = []
+    for key, spec in schema["properties"].items():
+        if key not in obj:
+            if key in schema.get("required", []):
+                errors.append(f'missing required key "{key}"')
+        elif not _type_ok(obj[key], spec.get("type")):
+            errors.append(f'"{key}" must be a JSON {spec.get("type")}')
+    return errors
+
+
+def coerce(obj, schema):
+    """Best-effort conformance: fill missing keys and wrap mistyped values."""
+    result = dict(obj) if isinstance(obj, dict) else {}
+    for key, spec in schema["properties"].items():
+        value = result.get(key)
+        if spec.get("type") == "array":
+            if value is None:
+                result[key] = []
+            elif not isinstance(value, list):
+                result[key] = [value]
+        elif spec.get("type") == "string" and not isinstance(value, str):
+            result[key] = "" if value is None else json.dumps(value)
+    return result
+
+
+def check_reply(raw, schema):
+    """Extract and validate in one pass; returns (object or None, errors)."""
+    obj, error = extract_json(raw)
+    if error:
+        return None, [error]
+    return obj, validate(obj, schema)
+
+
+def repair_messages(messages, raw, errors, schema):
+    """Conversation for the single targeted repair turn."""
+    return list(messages) + [
+        {"role": "assistant", "content": raw[:MAX_REPLY_CHARS]},
+        {"role": "user", "content": (
+            "Your previous reply could not be used: " + "; ".join(errors) + ".\n"
+            "Return only the corrected JSON object, with no other text, using exactly these keys: "
+            + ", ".join(f'"{k}" ({v["type"]})' for k, v in schema["properties"].items()) + "."
+        )},
+    ]
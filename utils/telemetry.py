@@ -0,0 +1,211 @@
+# telemetry.py
+# Per-call LLM metrics (counters and histograms) exposed in OpenMetrics text format
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+QUEUE_WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (10, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+# Minimum seconds between rewrites of WISDOM_METRICS_FILE
+FILE_WRITE_INTERVAL = 5.0
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# TYPE {self.name} counter", f"# HELP {self.name} {self.help}"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}_total{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets, unit=""):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.unit = unit
+        self._series = {}
+
+    def observe(self, labels, value):
+        counts, total, observations = self._series.get(labels, ([0] * len(self.buckets), 0.0, 0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self._series[labels] = (counts, total + value, observations + 1)
+
+    def render(self):
+        lines = [f"# TYPE {self.name} histogram", f"# HELP {self.name} {self.help}"]
+        if self.unit:
+            lines.insert(1, f"# UNIT {self.name} {self.unit}")
+        for labels, (counts, total, observations) in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, [('le', _number(float(bound)))])} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, [('le', '+Inf')])} {observations}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(float(total))}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {observations}")
+        return lines
+
+
+class Telemetry:
+    """
+    Process-wide LLM call metrics.
+
+    Every agent completion (and the ai_utils intention classifier) reports its
+    agent, model, token usage, scheduler queue wait, upstream latency, cache hit
+    or miss and whether the reply parsed against its schema.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = Counter("wisdom_llm_calls", "Upstream chat completions by outcome.", ("agent", "model", "outcome"))
+        self.cache = Counter("wisdom_llm_cache_lookups", "Completion cache lookups.", ("agent", "model", "result"))
+        self.semantic = Counter("wisdom_llm_semantic_lookups", "Paraphrase (semantic cache) lookups.", ("agent", "result"))
+        self.hedges = Counter("wisdom_llm_hedges", "Hedged (backup) requests sent, and how many beat the original.",
+                              ("agent", "model", "outcome"))
+        self.parses = Counter("wisdom_llm_reply_parses", "Structured replies by validation result.", ("agent", "result"))
+        self.prompt_tokens = Counter("wisdom_llm_prompt_tokens", "Prompt tokens sent upstream.", ("agent", "model"))
+        self.completion_tokens = Counter("wisdom_llm_completion_tokens", "Completion tokens received.", ("agent", "model"))
+        self.latency = Histogram("wisdom_llm_upstream_latency_seconds", "Upstream completion latency, excluding queueing.",
+                                 ("agent", "model"), LATENCY_BUCKETS, "seconds")
+        self.queue_wait = Histogram("wisdom_llm_queue_wait_seconds", "Time spent waiting for rate-limit admission.",
+                                    ("agent", "model"), QUEUE_WAIT_BUCKETS, "seconds")
+        self.completion_size = Histogram("wisdom_llm_completion_size_tokens", "Completion tokens per call.",
+                                         ("agent", "model"), TOKEN_BUCKETS)
+        self._metrics = [self.calls, self.cache, self.semantic, self.hedges, self.parses, self.prompt_tokens, self.completion_tokens,
+                         self.latency, self.queue_wait, self.completion_size]
+        self._file_written = 0.0
+
+    def record_call(self, agent, model, latency, prompt_tokens=0, completion_tokens=0, ok=True, hedge_lost=False):
+        # A hedged copy that lost the race is counted once, as "hedge_lost", and stays out of the latency histogram
+        with self._lock:
+            if hedge_lost:
+                self.calls.inc((agent, model, "hedge_lost"))
+            else:
+                self.calls.inc((agent, model, "ok" if ok else "error"))
+                self.latency.observe((agent, model), latency)
+            if ok:
+                self.prompt_tokens.inc((agent, model), prompt_tokens)
+                self.completion_tokens.inc((agent, model), completion_tokens)
+                if not hedge_lost:
+                    self.completion_size.observe((agent, model), completion_tokens)
+        self._maybe_write_file()
+
+    def record_queue_wait(self, agent, model, seconds):
+        with self._lock:
+            self.queue_wait.observe((agent, model), seconds)
+
+    def record_cache(self, agent, model, hit):
+        with self._lock:
+            self.cache.inc((agent, model, "hit" if hit else "miss"))
+
+    def record_semantic(self, agent, hit):
+        with self._lock:
+            self.semantic.inc((agent, "hit" if hit else "miss"))
+
+    def record_hedge(self, agent, model, outcome):
+        with self._lock:
+            self.hedges.inc((agent, model, outcome))
+
+    def record_parse(self, agent, result):
+        """`result` is "ok", "repaired" (valid after the repair turn) or "failed"."""
+        with self._lock:
+            self.parses.inc((agent, result))
+
+    def render(self):
+        """All metrics as an OpenMetrics text exposition."""
+        with self._lock:
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        # Written atomically so a scraper (e.g. the node_exporter textfile collector) never reads half a file
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def _maybe_write_file(self):
+        path = os.getenv("WISDOM_METRICS_FILE")
+        now = time.monotonic()
+        if not path or now - self._file_written < FILE_WRITE_INTERVAL:
+            return
+        self._file_written = now
+        try:
+            self.write_file(path)
+        except OSError as e:
+            print(f"[METRICS ERROR] {e}")
+
+
+_telemetry = Telemetry()
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_telemetry():
+    return _telemetry
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = get_telemetry().render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would flood the console
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    """
+    Serve /metrics on a daemon thread (once per process). The port defaults to
+    WISDOM_METRICS_PORT; returns None when no port is configured.
+    """
+    global _server
+    port = port or os.getenv("WISDOM_METRICS_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="wisdom-metrics", daemon=True).start()
+        return _server
@@ -0,0 +1,21 @@
+# tokens.py
+# Local, dependency-free token estimates for prompt sizing and rate limiting
+
+import math
+
+# GPT-family BPE tokenizers average roughly four characters of English/JSON per token
+CHARS_PER_TOKEN = 4.0
+# Fixed per-message framing cost in the chat format (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """Approximate token count for `text` without calling a tokenizer."""
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def estimate_message_tokens(messages):
+    """Approximate prompt tokens for a list of chat messages."""
+    return sum(estimate_tokens(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in messages) + 2